@@ -7,4 +7,8 @@ from django.apps import AppConfig
 # 用于在Django应用注册表中注册ticket应用
 class TicketConfig(AppConfig):
     # 应用名称，必须与应用目录名一致
-    name = "ticket"
\ No newline at end of file
+    name = "ticket"
+
+    # 应用加载完成后注册信号处理函数（月历库存缓存失效、搜索索引同步）
+    def ready(self):
+        from . import signals  # noqa: F401
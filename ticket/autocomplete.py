@@ -0,0 +1,302 @@
+import heapq
+import logging
+import os
+import re
+import threading
+import time
+import unicodedata
+from bisect import bisect_left
+
+from django.conf import settings
+from django.db import connection
+
+from .models import ScenicSpot
+
+# 配置日志记录
+logger = logging.getLogger(__name__)
+
+# pypinyin为可选依赖（pip install pypinyin），未安装时只按景点名称前缀匹配，全拼和拼音首字母不能补全
+try:
+    from pypinyin import Style, lazy_pinyin
+except ImportError:
+    lazy_pinyin = None
+    logger.warning("未安装pypinyin，景点自动补全只支持名称前缀，不支持全拼和拼音首字母")
+
+
+# =======================
+# 景点名称自动补全
+# =======================
+# 每个上架景点生成三个匹配键：名称、全拼（gugongbowuyuan）、拼音首字母（ggbwy），
+# 所有键排序后存入数组，输入的前缀用二分查找定位到连续的一段。
+# 景点按 是否热门、预约人数 从高到低编号（排名），建议结果按排名取前k个：
+#   不超过TOP_PREFIX_LENGTH个字符的短前缀匹配的景点很多，建索引时预先算好前MAX_LIMIT个；
+#   更长的前缀匹配范围很小，查询时在范围内取排名最小的k个。
+# 索引保存在进程内存中，由后台线程加载和重建，请求中只读取当前的索引快照，不会等待加载：
+#   wsgi/asgi启动时调用start()启动后台线程，立即加载索引（计算拼音较慢，10万景点约十几秒），
+#   加载完成前的查询返回空结果；
+#   景点通过save()/delete()修改时由signals更新，后台线程随即重建快照；
+#   每隔AUTOCOMPLETE_REFRESH_SECONDS秒重新加载一次，同步其他进程的修改和批量更新。
+
+# 预先计算建议结果的前缀最大长度：四个字母以内的全拼前缀（如shan）匹配的景点最多
+TOP_PREFIX_LENGTH = 4
+
+# 每次最多返回的建议数
+MAX_LIMIT = 20
+
+# 匹配键只保留中文、英文字母和数字，忽略空格和标点
+_KEY_RE = re.compile(r'[^\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff0-9a-z]+')
+
+# 景点ID: (名称, 是否热门, 预约人数, 匹配键)，signals在两次重建之间修改这里
+_spots = {}
+# 当前的索引快照，重建时整体替换，查询不需要加锁
+_index = None
+# 景点有修改、索引需要重建
+_dirty = False
+# 从数据库加载期间signals的修改 {景点ID: 景点数据，删除为None}，加载完成后合并；不在加载时为None
+_changes = None
+# 保护_spots、_dirty、_changes，只在读写这些变量时短暂持有
+_lock = threading.Lock()
+# 加载和重建索引的后台线程，景点有修改时通过_wakeup唤醒
+_thread = None
+_wakeup = threading.Event()
+
+
+def normalize(text):
+    """统一全角半角和大小写，去掉空格和标点"""
+    return _KEY_RE.sub('', unicodedata.normalize('NFKC', text or '').lower())
+
+
+def spot_keys(name):
+    """
+    景点名称的匹配键：名称、全拼、拼音首字母
+
+    Args:
+        name: 景点名称
+
+    Returns:
+        tuple: 去重后的匹配键
+    """
+    keys = [normalize(name)]
+    if lazy_pinyin is not None:
+        # 多音字按pypinyin的词组读音取一种
+        keys.append(normalize(''.join(lazy_pinyin(name))))
+        keys.append(normalize(''.join(lazy_pinyin(name, style=Style.FIRST_LETTER))))
+    return tuple(key for key in dict.fromkeys(keys) if key)
+
+
+class SuggestIndex:
+    """
+    自动补全索引快照，创建后不再修改
+
+    Args:
+        spots: {景点ID: (名称, 是否热门, 预约人数, 匹配键)}
+    """
+
+    def __init__(self, spots):
+        # 排名从0开始，越小越靠前；排名相同时按ID
+        ranked = sorted(spots, key=lambda spot_id: (not spots[spot_id][1], -spots[spot_id][2], spot_id))
+        self.ids = ranked
+        self.names = [spots[spot_id][0] for spot_id in ranked]
+        entries = sorted((key, rank) for rank, spot_id in enumerate(ranked) for key in spots[spot_id][3])
+        self.keys = [key for key, _ in entries]
+        self.ranks = [rank for _, rank in entries]
+
+        # 短前缀的前MAX_LIMIT名：按排名从高到低加入，每个前缀加满为止
+        self.top = {}
+        for rank, spot_id in enumerate(ranked):
+            for key in spots[spot_id][3]:
+                for length in range(1, min(len(key), TOP_PREFIX_LENGTH) + 1):
+                    ranks = self.top.setdefault(key[:length], [])
+                    # 同一景点的多个键可能有相同的前缀
+                    if len(ranks) < MAX_LIMIT and (not ranks or ranks[-1] != rank):
+                        ranks.append(rank)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def suggest(self, prefix, limit):
+        """
+        按排名返回匹配前缀的景点
+
+        Args:
+            prefix: normalize()处理后的前缀
+            limit: 最多返回的建议数，不超过MAX_LIMIT
+
+        Returns:
+            list: [(景点ID, 景点名称)]
+        """
+        if not prefix:
+            return []
+        if len(prefix) <= TOP_PREFIX_LENGTH:
+            ranks = self.top.get(prefix, ())[:limit]
+        else:
+            # 以prefix开头的键位于[start, end)，'\uffff'大于键中可能出现的任何字符
+            start = bisect_left(self.keys, prefix)
+            end = bisect_left(self.keys, prefix + '\uffff', start)
+            ranks = heapq.nsmallest(limit, set(self.ranks[start:end]))
+        return [(self.ids[rank], self.names[rank]) for rank in ranks]
+
+
+# 首次加载完成前使用的空索引
+_EMPTY_INDEX = SuggestIndex({})
+
+
+def _refresh_seconds():
+    return getattr(settings, 'AUTOCOMPLETE_REFRESH_SECONDS', 300)
+
+
+def load():
+    """
+    从数据库重新加载上架景点并重建索引，名称未变的景点沿用原来的匹配键
+
+    计算拼音时不持有锁，期间signals的修改在加载完成后合并。
+
+    Returns:
+        SuggestIndex: 新的索引
+    """
+    global _spots, _index, _dirty, _changes
+    started = time.perf_counter()
+    with _lock:
+        previous = _spots
+        _changes = {}
+    try:
+        rows = ScenicSpot.objects.filter(is_active=True).values_list('id', 'name', 'is_hot', 'booking_count')
+        spots = {}
+        for spot_id, name, is_hot, booking_count in rows.iterator(chunk_size=2000):
+            old = previous.get(spot_id)
+            keys = old[3] if old and old[0] == name else spot_keys(name)
+            spots[spot_id] = (name, is_hot, booking_count, keys)
+    finally:
+        with _lock:
+            changes, _changes = _changes, None
+    with _lock:
+        for spot_id, entry in changes.items():
+            if entry is None:
+                spots.pop(spot_id, None)
+            else:
+                spots[spot_id] = entry
+        _spots = spots
+        snapshot = dict(spots)
+        _dirty = False
+    _index = SuggestIndex(snapshot)
+    logger.info(f"加载景点自动补全索引: 景点数={len(snapshot)}, 耗时={time.perf_counter() - started:.3f}s")
+    return _index
+
+
+def rebuild():
+    """景点有修改时按内存中的景点数据重建索引快照，不读数据库"""
+    global _index, _dirty
+    with _lock:
+        if not _dirty:
+            return _index
+        snapshot = dict(_spots)
+        _dirty = False
+    _index = SuggestIndex(snapshot)
+    return _index
+
+
+def _run():
+    # 后台线程：启动时加载索引，之后每隔刷新间隔重新加载，景点有修改时重建快照
+    next_load = 0.0
+    while True:
+        try:
+            if time.monotonic() >= next_load:
+                next_load = time.monotonic() + _refresh_seconds()
+                load()
+            else:
+                rebuild()
+        except Exception:
+            logger.exception("加载景点自动补全索引失败，下次刷新时重试")
+        finally:
+            # 线程长期运行，不保留空闲的数据库连接
+            connection.close()
+        _wakeup.wait(max(next_load - time.monotonic(), 0))
+        _wakeup.clear()
+
+
+def start():
+    """启动加载和刷新索引的后台线程，已启动时不做任何事"""
+    global _thread
+    with _lock:
+        if _thread is not None and _thread.is_alive():
+            return
+        _thread = threading.Thread(target=_run, name='autocomplete-index', daemon=True)
+        _thread.start()
+
+
+def get_index():
+    """获取当前的索引快照，后台线程未启动时启动它；首次加载完成前返回空索引"""
+    if _thread is None or not _thread.is_alive():
+        start()
+    return _index or _EMPTY_INDEX
+
+
+def _reset_after_fork():
+    # fork出的子进程沿用父进程已加载的索引，但后台线程和锁不能沿用，首次查询时重新启动线程
+    global _lock, _thread, _wakeup
+    _lock = threading.Lock()
+    _thread = None
+    _wakeup = threading.Event()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _set_spot(spot_id, entry):
+    # 必须持有_lock；加载期间的修改同时记录下来，加载完成后合并
+    global _dirty
+    if entry is None:
+        _spots.pop(spot_id, None)
+    else:
+        _spots[spot_id] = entry
+    if _changes is not None:
+        _changes[spot_id] = entry
+    _dirty = True
+
+
+def update_spot(spot):
+    """
+    景点保存后更新索引，下架的景点从索引中移除；索引由后台线程重建
+
+    Args:
+        spot: ScenicSpot对象
+    """
+    with _lock:
+        if _index is None and _changes is None:
+            # 索引还没有开始加载，加载时会读到最新数据
+            return
+        old = _spots.get(spot.id)
+        if spot.is_active:
+            keys = old[3] if old and old[0] == spot.name else spot_keys(spot.name)
+            _set_spot(spot.id, (spot.name, spot.is_hot, spot.booking_count, keys))
+        else:
+            _set_spot(spot.id, None)
+    _wakeup.set()
+
+
+def remove_spot(spot_id):
+    """景点删除后从索引中移除"""
+    with _lock:
+        if _index is None and _changes is None:
+            return
+        _set_spot(spot_id, None)
+    _wakeup.set()
+
+
+def suggest(query, limit=None):
+    """
+    景点名称自动补全，支持名称、全拼和拼音首字母前缀
+
+    Args:
+        query: 用户输入的内容
+        limit: 最多返回的建议数，默认为settings.AUTOCOMPLETE_LIMIT
+
+    Returns:
+        list: [{'id': 景点ID, 'name': 景点名称}]，按是否热门、预约人数从高到低排列；
+              索引首次加载完成前为空列表
+    """
+    limit = min(limit or getattr(settings, 'AUTOCOMPLETE_LIMIT', 10), MAX_LIMIT)
+    prefix = normalize(query)
+    if not prefix:
+        return []
+    return [{'id': spot_id, 'name': name} for spot_id, name in get_index().suggest(prefix, limit)]
@@ -0,0 +1,161 @@
+import logging
+from datetime import date
+
+from django.db import connection, transaction
+
+from . import id_generator, inventory
+from .models import Cart, Order
+
+# 配置日志记录
+logger = logging.getLogger(__name__)
+
+
+# =======================
+# 购物车批量结算
+# =======================
+# 一次结算在一个事务中按以下步骤完成，查询次数与购物车项数量无关：
+#   1. 一条查询读取选中的购物车项（连同景点和门票类型）
+#   2. 校验每一项（门票类型、使用日期、是否下架），不合格的项记录失败原因
+#   3. inventory.reserve_stock_batch 按固定顺序锁定所有库存行并一次性预占
+#   4. bulk_create 创建所有订单，bulk_create 记录库存预占
+#   5. 一条DELETE删除已结算的购物车项
+# 失败的项不影响其他项，留在购物车中，调用方根据failures提示用户。
+
+# 失败原因代码
+REASON_NOT_FOUND = 'not_found'
+REASON_NO_TICKET_TYPE = 'no_ticket_type'
+REASON_NO_USE_DATE = 'no_use_date'
+REASON_DATE_PASSED = 'date_passed'
+REASON_INACTIVE = 'inactive'
+REASON_INSUFFICIENT_STOCK = 'insufficient_stock'
+
+
+class CheckoutResult:
+    """
+    结算结果
+
+    Attributes:
+        orders: 成功创建的Order对象列表，顺序与购物车项ID顺序一致
+        failures: 失败的购物车项列表，每项为
+            {'cart_item_id': 购物车项ID, 'name': 显示名称, 'reason': 原因代码, 'message': 提示信息}
+    """
+
+    def __init__(self):
+        self.orders = []
+        self.failures = []
+
+    def add_failure(self, cart_item_id, name, reason, message):
+        self.failures.append({'cart_item_id': cart_item_id, 'name': name, 'reason': reason, 'message': message})
+
+
+def _item_name(cart_item):
+    if cart_item.ticket_type is None:
+        return cart_item.scenic_spot.name
+    return f'{cart_item.scenic_spot.name} - {cart_item.ticket_type.name}'
+
+
+def _validate(cart_item, today):
+    """检查购物车项能否结算，返回(原因代码, 提示信息)，可以结算时返回None"""
+    if cart_item.ticket_type is None:
+        return REASON_NO_TICKET_TYPE, '未选择门票类型'
+    if cart_item.use_date is None:
+        return REASON_NO_USE_DATE, '未选择使用日期'
+    if cart_item.use_date < today:
+        return REASON_DATE_PASSED, f'使用日期 {cart_item.use_date} 已过'
+    if not cart_item.ticket_type.is_active:
+        return REASON_INACTIVE, '门票已下架'
+    return None
+
+
+def _create_orders(orders):
+    """批量创建订单并返回带主键的订单对象"""
+    if connection.features.can_return_rows_from_bulk_insert:
+        return Order.objects.bulk_create(orders)
+
+    # MySQL的批量INSERT不返回自增主键，按订单号重新读取
+    Order.objects.bulk_create(orders)
+    created = Order.objects.in_bulk([order.order_number for order in orders], field_name='order_number')
+    return [created[order.order_number] for order in orders]
+
+
+def checkout_cart(user, cart_item_ids):
+    """
+    结算用户选中的购物车项
+
+    整个结算在一个事务中完成；调用方已开启事务时作为其中的一部分提交。
+    库存不足等可预期的失败逐项记录在结果中，其余项照常下单。
+
+    Args:
+        user: 当前用户
+        cart_item_ids: 选中的购物车项ID列表，可以是字符串，重复的ID只结算一次
+
+    Returns:
+        CheckoutResult: 创建的订单和失败的购物车项
+    """
+    result = CheckoutResult()
+
+    # 去重并保持提交顺序，非数字ID视为不存在
+    ordered_ids = []
+    for item_id in cart_item_ids:
+        try:
+            item_id = int(item_id)
+        except (TypeError, ValueError):
+            result.add_failure(item_id, '', REASON_NOT_FOUND, '购物车项不存在或已被删除')
+            continue
+        if item_id not in ordered_ids:
+            ordered_ids.append(item_id)
+
+    with transaction.atomic():
+        # 锁定购物车项，并发的重复结算在这里排队，后到的请求读不到已删除的项
+        cart_items = Cart.objects.select_for_update(of=('self',)).select_related(
+            'scenic_spot', 'ticket_type'
+        ).filter(user=user, id__in=ordered_ids).in_bulk()
+
+        today = date.today()
+        valid_items = []
+        for item_id in ordered_ids:
+            cart_item = cart_items.get(item_id)
+            if cart_item is None:
+                result.add_failure(item_id, '', REASON_NOT_FOUND, '购物车项不存在或已被删除')
+                continue
+            problem = _validate(cart_item, today)
+            if problem:
+                result.add_failure(item_id, _item_name(cart_item), *problem)
+                continue
+            valid_items.append(cart_item)
+
+        reservations = inventory.reserve_stock_batch(
+            [(item.ticket_type, item.use_date, item.quantity) for item in valid_items]
+        )
+
+        reserved_items = []
+        for cart_item, error in zip(valid_items, reservations):
+            if error is None:
+                reserved_items.append(cart_item)
+            else:
+                result.add_failure(cart_item.id, _item_name(cart_item), REASON_INSUFFICIENT_STOCK, f'门票库存不足，{error}')
+
+        if reserved_items:
+            result.orders = _create_orders([
+                Order(
+                    user=user,
+                    scenic_spot=item.scenic_spot,
+                    ticket_type=item.ticket_type,
+                    use_date=item.use_date,
+                    quantity=item.quantity,
+                    total_price=item.ticket_type.price * item.quantity,
+                    # 订单号按时间递增，不会重复
+                    order_number=id_generator.new_order_number(),
+                )
+                for item in reserved_items
+            ])
+            # 记录库存预占，超时未支付将自动取消并释放库存
+            inventory.create_holds(result.orders)
+            # 一条语句删除已结算的购物车项
+            Cart.objects.filter(id__in=[item.id for item in reserved_items]).delete()
+
+    logger.info(
+        f"购物车结算: 用户={user.id}, 成功={len(result.orders)}, "
+        f"失败={[(failure['cart_item_id'], failure['reason']) for failure in result.failures]}"
+    )
+    return result
@@ -0,0 +1,211 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import ScenicSpot, ScenicSpotTag
+
+# 配置日志记录
+logger = logging.getLogger(__name__)
+
+
+# =======================
+# 景点列表分面统计
+# =======================
+# 景点列表按地区、分类、标签筛选，每个筛选项显示点击后能得到的景点数。
+# 每个进程在内存中保存位图索引：景点按ID排序后编号，每个地区、分类、标签对应一个Python整数，
+# 第i位为1表示第i个景点属于该值；筛选结果的景点数 = (各条件位图按位与).bit_count()。
+# 某一维度的计数使用其他维度的筛选条件（不含本维度），即切换到该值后的结果数。
+# 每种筛选组合（搜索词、地区、分类、标签）的结果再按版本号缓存：
+#   景点的地区、分类变化，景点新增删除，地区改名删除，标签变化时更新版本号，
+#   旧版本的缓存不再被读取，各进程发现版本号变化后重建位图索引。
+# 标签通过ticket.tags批量修改，不触发模型信号，由tags模块显式调用invalidate()。
+
+CACHE_PREFIX = 'facets'
+
+VERSION_KEY = f'{CACHE_PREFIX}:version'
+
+# 当前进程的位图索引，重建时整体替换
+_index = None
+_lock = threading.Lock()
+
+
+def _get_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # 并发初始化时只有一个值写入成功，以缓存中的值为准
+        cache.add(VERSION_KEY, uuid.uuid4().hex, None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def invalidate():
+    """景点的地区、分类、标签变化后使分面统计失效，事务提交后生效"""
+    transaction.on_commit(lambda: cache.set(VERSION_KEY, uuid.uuid4().hex, None))
+
+
+def _to_bitmaps(values):
+    # {值: bytearray} 转为 {值: int}，bytearray第i个字节保存第8i到8i+7个景点
+    return {value: int.from_bytes(bits, 'little') for value, bits in values.items()}
+
+
+class FacetIndex:
+    """
+    地区、分类、标签的位图索引，创建后不再修改
+
+    Args:
+        version: 创建时的分面版本号
+    """
+
+    def __init__(self, version):
+        self.version = version
+        self.positions = {}
+        regions = {}
+        categories = {}
+        rows = list(ScenicSpot.objects.order_by('id').values_list('id', 'region__name', 'category'))
+        size = len(rows) // 8 + 1
+        for position, (spot_id, region, category) in enumerate(rows):
+            self.positions[spot_id] = position
+            byte, bit = divmod(position, 8)
+            if region:
+                regions.setdefault(region, bytearray(size))[byte] |= 1 << bit
+            if category:
+                categories.setdefault(category, bytearray(size))[byte] |= 1 << bit
+        tags = {}
+        for spot_id, tag in ScenicSpotTag.objects.values_list('scenic_spot_id', 'tag__name').iterator(chunk_size=5000):
+            position = self.positions.get(spot_id)
+            if position is not None:
+                byte, bit = divmod(position, 8)
+                tags.setdefault(tag, bytearray(size))[byte] |= 1 << bit
+        self.dimensions = {
+            'region': _to_bitmaps(regions),
+            'category': _to_bitmaps(categories),
+            'tag': _to_bitmaps(tags),
+        }
+        # 所有景点
+        self.all = (1 << len(self.positions)) - 1
+        # 不带其他筛选条件时各值的景点数，直接使用，不必逐个按位与
+        self.totals = {
+            dimension: {value: bitmap.bit_count() for value, bitmap in bitmaps.items()}
+            for dimension, bitmaps in self.dimensions.items()
+        }
+
+    def bitmap(self, spot_ids):
+        """景点ID列表对应的位图，索引中没有的景点忽略"""
+        bits = bytearray(len(self.positions) // 8 + 1)
+        for spot_id in spot_ids:
+            position = self.positions.get(spot_id)
+            if position is not None:
+                bits[position // 8] |= 1 << (position % 8)
+        return int.from_bytes(bits, 'little')
+
+    def count(self, base, filters):
+        """
+        统计各维度每个值的景点数
+
+        Args:
+            base: 参与统计的景点位图（全部景点或搜索结果）
+            filters: {'region': 地区名称, 'category': 分类名称, 'tag': 标签名称}，空字符串表示不筛选
+
+        Returns:
+            dict: {'total': 筛选结果数, 维度: [{'name': 值, 'count': 景点数}]}，
+                  只包含景点数大于0的值和当前选中的值
+        """
+        masks = {
+            dimension: self.dimensions[dimension].get(value, 0) if value else self.all
+            for dimension, value in filters.items()
+        }
+        result = {}
+        for dimension, bitmaps in self.dimensions.items():
+            # 其他维度的筛选条件
+            others = base
+            for other, mask in masks.items():
+                if other != dimension and mask is not self.all:
+                    others &= mask
+            if others is self.all:
+                counts = self.totals[dimension]
+            else:
+                counts = {value: (bitmap & others).bit_count() for value, bitmap in bitmaps.items()}
+            selected = filters.get(dimension)
+            result[dimension] = [
+                {'name': value, 'count': count}
+                for value, count in counts.items() if count or value == selected
+            ]
+            if selected and selected not in counts:
+                result[dimension].append({'name': selected, 'count': 0})
+        total = base
+        for mask in masks.values():
+            total &= mask
+        result['total'] = total.bit_count()
+        return result
+
+
+def get_index(version=None):
+    """获取当前进程的位图索引，版本号变化后重建"""
+    global _index
+    version = version or _get_version()
+    index = _index
+    if index is not None and index.version == version:
+        return index
+    with _lock:
+        # 同时到达的请求只有第一个重建，其余等待后直接使用新索引
+        if _index is None or _index.version != version:
+            started = time.perf_counter()
+            _index = FacetIndex(version)
+            logger.info(
+                f"重建景点分面索引: 景点数={len(_index.positions)}, 耗时={time.perf_counter() - started:.3f}s"
+            )
+        return _index
+
+
+def compute_facets(index, filters, search_ids=None):
+    """
+    用位图索引统计分面并排序，不读写缓存
+
+    Args:
+        index: FacetIndex
+        filters: {'region': 地区名称, 'category': 分类名称, 'tag': 标签名称}
+        search_ids: 搜索词匹配的全部景点ID，不搜索时为None
+
+    Returns:
+        dict: 同get_facets
+    """
+    base = index.all if search_ids is None else index.bitmap(search_ids)
+    facets = index.count(base, filters)
+    facets['region'].sort(key=lambda item: item['name'])
+    facets['category'].sort(key=lambda item: item['name'])
+    facets['tag'].sort(key=lambda item: (-item['count'], item['name']))
+    return facets
+
+
+def get_facets(region='', category='', tag='', search_keyword='', search_ids=None):
+    """
+    景点列表各筛选项的景点数，按筛选组合缓存
+
+    Args:
+        region: 地区筛选条件
+        category: 分类筛选条件
+        tag: 标签筛选条件
+        search_keyword: 搜索词，search_ids为None时忽略
+        search_ids: 搜索词匹配的全部景点ID（未经地区、分类、标签筛选），不搜索时为None
+
+    Returns:
+        dict: {'total': 筛选结果数, 'region': [...], 'category': [...], 'tag': [...]}，
+              地区、分类按名称排序，标签按景点数从多到少排序，元素为{'name': 值, 'count': 景点数}
+    """
+    version = _get_version()
+    filters = {'region': region, 'category': category, 'tag': tag}
+    combination = [search_keyword if search_ids is not None else None, region, category, tag]
+    digest = hashlib.md5(json.dumps(combination, ensure_ascii=False).encode()).hexdigest()
+    key = f'{CACHE_PREFIX}:{version}:{digest}'
+    facets = cache.get(key)
+    if facets is None:
+        facets = compute_facets(get_index(version), filters, search_ids)
+        cache.set(key, facets, getattr(settings, 'FACET_CACHE_TIMEOUT', 300))
+    return facets
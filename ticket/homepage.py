@@ -0,0 +1,89 @@
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+
+# =======================
+# 首页片段缓存
+# =======================
+# 首页的轮播图、公告、资讯、热门景点四个区域分别用模板的{% cache %}标签缓存渲染后的HTML，
+# 整个页面内容再按四个区域的版本号缓存一次：
+#   命中时不查询数据库、不渲染区域模板；某个区域变化后只重新渲染该区域，其他区域从各自的缓存读取。
+# 未登录且没有待显示提示消息的访客看到的页面完全相同（导航栏没有用户信息），
+# 整个响应内容再按四个区域的版本号缓存，命中时不渲染模板。
+# 区域数据通过save()/delete()修改时由signals模块更新对应区域的版本号，
+# 旧版本的片段不再被读取，等待自然过期。QuerySet.update()等批量修改不触发信号，
+# 需要显式调用invalidate()，否则在HOMEPAGE_CACHE_TIMEOUT后过期。
+
+CACHE_PREFIX = 'homepage'
+
+# 首页区域：轮播图、平台公告、旅游资讯、热门景点
+SECTIONS = ('carousels', 'announcements', 'news', 'hot_spots')
+
+
+def _version_key(section):
+    return f'{CACHE_PREFIX}:version:{section}'
+
+
+def get_versions():
+    """
+    各首页区域当前的版本号，用作片段缓存键的一部分
+
+    Returns:
+        dict: {区域名称: 版本号}
+    """
+    keys = [_version_key(section) for section in SECTIONS]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            # 并发初始化时只有一个值写入成功，以缓存中的值为准
+            cache.add(key, uuid.uuid4().hex, None)
+            versions[key] = cache.get(key)
+    return {section: versions[_version_key(section)] for section in SECTIONS}
+
+
+def invalidate(*sections):
+    """
+    使首页区域的片段缓存失效，事务提交后生效
+
+    Args:
+        sections: 区域名称，不传时使全部区域失效
+    """
+    keys = [_version_key(section) for section in sections or SECTIONS]
+    # 事务提交后再更新版本号，避免其他请求在提交前用旧数据重建缓存
+    transaction.on_commit(lambda: cache.set_many({key: uuid.uuid4().hex for key in keys}, None))
+
+
+def news_section(news):
+    """资讯所在的首页区域：公告或旅游资讯"""
+    return 'announcements' if news.is_announcement else 'news'
+
+
+def _page_key(versions):
+    return f'{CACHE_PREFIX}:page:' + ':'.join(str(versions[section]) for section in SECTIONS)
+
+
+def get_page(versions):
+    """
+    读取缓存的未登录访客首页
+
+    Args:
+        versions: get_versions()的返回值
+
+    Returns:
+        bytes: 页面内容，未缓存时为None
+    """
+    return cache.get(_page_key(versions))
+
+
+def set_page(versions, content):
+    """
+    缓存未登录访客首页
+
+    Args:
+        versions: 渲染页面时的区域版本号
+        content: 页面内容
+    """
+    cache.set(_page_key(versions), content, getattr(settings, 'HOMEPAGE_CACHE_TIMEOUT', 600))
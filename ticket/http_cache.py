@@ -0,0 +1,146 @@
+import hashlib
+from functools import wraps
+
+from django.conf import settings
+from django.contrib import messages
+from django.db.models import Count, Max
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.views.decorators.http import condition
+
+from . import spot_detail
+from .models import News, ScenicSpot
+
+
+# =======================
+# HTTP条件请求与缓存策略
+# =======================
+# 景点详情、资讯列表、资讯详情和景点列表API的响应带ETag（资讯页面还带Last-Modified），
+# 浏览器和反向代理再次请求时带上If-None-Match / If-Modified-Since，内容没有变化就返回304，不渲染页面。
+# 校验值只用聚合查询或缓存中的版本号计算，不读取整行数据：
+#   景点详情：景点详情缓存的版本号（景点、标签、留言变化时改变），不查询数据库
+#   资讯详情：该资讯的updated_at
+#   资讯列表：该类资讯的 最大updated_at + 条数（条数变化覆盖删除的情况）
+#   景点列表API：全部景点的 最大updated_at + 条数
+# 页面的导航栏包含登录用户的信息和购物车数量，只对未登录且没有待显示提示消息的访客使用条件请求，
+# 这些响应可以被浏览器和反向代理共享缓存（按Cookie区分）；登录用户的页面每次都重新生成，不允许共享缓存。
+
+# 页面类型对应的HTTP_CACHE_MAX_AGE配置项，以及未配置时的默认值（秒）
+DEFAULT_MAX_AGE = {'page': 60, 'api': 300}
+
+
+def _max_age(kind):
+    return getattr(settings, 'HTTP_CACHE_MAX_AGE', {}).get(kind, DEFAULT_MAX_AGE[kind])
+
+
+def is_public(request):
+    """请求的页面内容是否与用户无关：未登录且没有待显示的提示消息（len()不会把消息标记为已显示）"""
+    return not request.user.is_authenticated and not len(messages.get_messages(request))
+
+
+def make_etag(*parts):
+    """由各部分拼接后计算ETag"""
+    return hashlib.md5(':'.join(str(part) for part in parts).encode()).hexdigest()
+
+
+def _news_queryset(filter_type):
+    # 与news_list视图的筛选条件一致
+    if filter_type == 'news':
+        return News.objects.filter(is_announcement=False)
+    if filter_type == 'announcement':
+        return News.objects.filter(is_announcement=True)
+    return News.objects.all()
+
+
+def _memoize(request, name, compute):
+    # ETag和Last-Modified来自同一次查询，结果保存在request上，避免查询两次
+    attribute = f'_http_cache_{name}'
+    if not hasattr(request, attribute):
+        setattr(request, attribute, compute())
+    return getattr(request, attribute)
+
+
+def _news_item(request, news_id):
+    return _memoize(
+        request, 'news_item',
+        lambda: News.objects.filter(id=news_id).values_list('updated_at', flat=True).first(),
+    )
+
+
+def _news_list(request):
+    filter_type = request.GET.get('type', 'all')
+    return _memoize(
+        request, 'news_list',
+        lambda: _news_queryset(filter_type).aggregate(last=Max('updated_at'), count=Count('id')),
+    )
+
+
+def spot_detail_etag(request, spot_id):
+    if not is_public(request):
+        return None
+    return make_etag('spot', spot_id, spot_detail.get_version(spot_id))
+
+
+def news_detail_etag(request, news_id):
+    if not is_public(request):
+        return None
+    updated_at = _news_item(request, news_id)
+    # 资讯不存在时由视图处理（提示后重定向）
+    return make_etag('news', news_id, updated_at.isoformat()) if updated_at else None
+
+
+def news_detail_last_modified(request, news_id):
+    if not is_public(request):
+        return None
+    return _news_item(request, news_id)
+
+
+def news_list_etag(request):
+    if not is_public(request):
+        return None
+    stats = _news_list(request)
+    last = stats['last'].isoformat() if stats['last'] else ''
+    return make_etag('news_list', request.GET.urlencode(), last, stats['count'])
+
+
+def news_list_last_modified(request):
+    if not is_public(request):
+        return None
+    return _news_list(request)['last']
+
+
+def scenic_spots_api_etag(request):
+    stats = ScenicSpot.objects.aggregate(last=Max('updated_at'), count=Count('id'))
+    last = stats['last'].isoformat() if stats['last'] else ''
+    return make_etag('scenic_spots_api', last, stats['count'])
+
+
+def cache_policy(kind, etag_func=None, last_modified_func=None):
+    """
+    视图装饰器：支持条件请求，并按页面类型设置Cache-Control
+
+    Args:
+        kind: 'page'（HTML页面，登录用户不共享缓存）或'api'（与用户无关的JSON数据）
+        etag_func: 计算ETag的函数，参数与视图相同，返回None时不使用条件请求
+        last_modified_func: 计算最后修改时间的函数，参数与视图相同
+    """
+    def decorator(view_func):
+        conditional_view = condition(etag_func=etag_func, last_modified_func=last_modified_func)(view_func)
+
+        @wraps(view_func)
+        def wrapped_view(request, *args, **kwargs):
+            response = conditional_view(request, *args, **kwargs)
+            if request.method not in ('GET', 'HEAD') or response.status_code not in (200, 304):
+                return response
+            if kind == 'api':
+                # 浏览器和反向代理可以缓存max_age秒，过期后用ETag重新验证
+                patch_cache_control(response, public=True, max_age=_max_age(kind))
+            elif is_public(request):
+                # 同上；带会话Cookie的请求可能是登录用户，反向代理按Cookie区分缓存
+                patch_cache_control(response, public=True, max_age=_max_age(kind))
+                patch_vary_headers(response, ['Cookie'])
+            else:
+                # 登录用户的页面只允许浏览器保存，每次使用前必须重新请求
+                patch_cache_control(response, private=True, no_cache=True)
+            return response
+        return wrapped_view
+    return decorator
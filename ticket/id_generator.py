@@ -0,0 +1,262 @@
+import atexit
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import IntegrityError, connections, transaction
+from django.utils import timezone
+
+from .models import IdGeneratorNode
+
+# 配置日志记录
+logger = logging.getLogger(__name__)
+
+
+# =======================
+# 订单号生成器（Snowflake）
+# =======================
+# 64位整数ID，从高位到低位依次为：
+#   41位 毫秒时间戳（相对EPOCH_MS，可用约69年）
+#   10位 节点ID（0-1023），每个进程一个，由节点ID租约分配
+#   12位 序列号，同一毫秒内递增，每毫秒每节点最多4096个
+# 同一节点生成的ID严格递增；不同节点的ID因节点ID不同而不会重复。
+# 按时间递增的ID写入order_number唯一索引时总是追加在索引末尾，不会随机插入。
+# 订单号和支付流水号为前缀 + 固定19位十进制数字，字符串顺序与生成顺序一致。
+
+# 起始时间：2024-01-01 00:00:00 UTC
+EPOCH_MS = 1704067200000
+
+NODE_BITS = 10
+SEQUENCE_BITS = 12
+MAX_NODE_ID = (1 << NODE_BITS) - 1
+MAX_SEQUENCE = (1 << SEQUENCE_BITS) - 1
+# 64位整数的十进制最大长度
+ID_DIGITS = 19
+
+
+class SnowflakeGenerator:
+    """线程安全的Snowflake ID生成器"""
+
+    def __init__(self, node_id):
+        if not 0 <= node_id <= MAX_NODE_ID:
+            raise ValueError(f'节点ID必须在0到{MAX_NODE_ID}之间')
+        self.node_id = node_id
+        self._lock = threading.Lock()
+        self._last_ms = -1
+        self._sequence = 0
+
+    def _current_ms(self):
+        return time.time_ns() // 1_000_000 - EPOCH_MS
+
+    def next_id(self):
+        """
+        生成下一个ID
+
+        Returns:
+            int: 64位整数ID
+        """
+        with self._lock:
+            now = self._current_ms()
+            if now < self._last_ms:
+                # 系统时钟回拨时沿用上一次的时间戳继续递增序列号，保证ID单调递增
+                now = self._last_ms
+
+            if now == self._last_ms:
+                self._sequence = (self._sequence + 1) & MAX_SEQUENCE
+                if self._sequence == 0:
+                    # 本毫秒序列号用完，等待时钟走到下一毫秒
+                    while now <= self._last_ms:
+                        time.sleep(0.0001)
+                        now = self._current_ms()
+            else:
+                self._sequence = 0
+
+            self._last_ms = now
+            return (now << (NODE_BITS + SEQUENCE_BITS)) | (self.node_id << SEQUENCE_BITS) | self._sequence
+
+
+def parse_id(value):
+    """
+    解析ID，用于排查问题
+
+    Args:
+        value: 整数ID，或订单号/支付流水号字符串
+
+    Returns:
+        dict: {'time': 生成时间（UTC datetime）, 'node_id': 节点ID, 'sequence': 序列号}
+    """
+    if isinstance(value, str):
+        value = int(value[-ID_DIGITS:])
+    timestamp_ms = (value >> (NODE_BITS + SEQUENCE_BITS)) + EPOCH_MS
+    return {
+        'time': datetime.fromtimestamp(timestamp_ms / 1000, tz=dt_timezone.utc),
+        'node_id': (value >> SEQUENCE_BITS) & MAX_NODE_ID,
+        'sequence': value & MAX_SEQUENCE,
+    }
+
+
+# =======================
+# 节点ID租约
+# =======================
+# 每个进程首次生成ID时在IdGeneratorNode表中占用一个空闲的节点ID（或接管已过期的租约），
+# 多台服务器、每台多个工作进程共用同一个数据库即可保证节点ID互不相同，不需要逐个进程配置。
+# 后台线程每 租约时间/3 续期一次，进程正常退出时释放；进程异常退出后租约过期，节点ID可被重新占用。
+# 租约超过有效期仍未续期成功（如数据库长时间不可用）时不再使用该节点ID，下次生成ID时重新占用。
+# 续期在后台线程自己的数据库连接中执行；首次生成ID发生在事务中时，租约随该事务提交才生效。
+
+
+def _lease_seconds():
+    return getattr(settings, 'ID_GENERATOR_LEASE_SECONDS', 600)
+
+
+class NodeLease:
+    """当前进程占用的节点ID"""
+
+    def __init__(self):
+        self.owner = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+        self.valid_until = time.monotonic() + _lease_seconds()
+        self.node_id = self._claim()
+        # 在调用方的事务中占用时，事务提交后租约才生效；事务回滚则租约作废，下次生成ID时重新占用
+        self.confirmed = not transaction.get_connection().in_atomic_block
+        self._claimed_by = threading.get_ident()
+        if not self.confirmed:
+            transaction.on_commit(self._confirm)
+        logger.info(f"占用订单号节点ID: {self.node_id}, 进程={self.owner}")
+
+    def _claim(self):
+        now = timezone.now()
+        expires_at = now + timedelta(seconds=_lease_seconds())
+        # 优先接管已过期的租约，带条件的UPDATE保证并发时只有一个进程接管成功
+        expired = IdGeneratorNode.objects.filter(expires_at__lt=now).values_list('node_id', flat=True)[:10]
+        for node_id in list(expired):
+            if IdGeneratorNode.objects.filter(node_id=node_id, expires_at__lt=now).update(
+                owner=self.owner, expires_at=expires_at,
+            ):
+                return node_id
+        used = set(IdGeneratorNode.objects.values_list('node_id', flat=True))
+        for node_id in range(MAX_NODE_ID + 1):
+            if node_id in used:
+                continue
+            try:
+                # 使用保存点，唯一约束冲突只回滚这一条INSERT
+                with transaction.atomic():
+                    IdGeneratorNode.objects.create(node_id=node_id, owner=self.owner, expires_at=expires_at)
+                return node_id
+            except IntegrityError:
+                # 其他进程同时占用了该节点ID
+                continue
+        raise ImproperlyConfigured(f'订单号生成器的{MAX_NODE_ID + 1}个节点ID都已被占用，无法启动')
+
+    def _confirm(self):
+        self.confirmed = True
+
+    def is_valid(self):
+        """租约是否仍在有效期内（占用租约的事务提交前只对该事务有效，回滚后无效）"""
+        if not self.confirmed and not (
+            threading.get_ident() == self._claimed_by and transaction.get_connection().in_atomic_block
+        ):
+            return False
+        return time.monotonic() < self.valid_until
+
+    def renew(self):
+        """
+        续期租约
+
+        Returns:
+            bool: 是否续期成功；False说明租约已过期并被其他进程接管
+        """
+        started = time.monotonic()
+        renewed = IdGeneratorNode.objects.filter(node_id=self.node_id, owner=self.owner).update(
+            expires_at=timezone.now() + timedelta(seconds=_lease_seconds()),
+        )
+        if renewed:
+            self.valid_until = started + _lease_seconds()
+        return bool(renewed)
+
+    def release(self):
+        """释放节点ID"""
+        self.valid_until = 0
+        IdGeneratorNode.objects.filter(node_id=self.node_id, owner=self.owner).delete()
+
+
+_generator = None
+_lease = None
+_generator_lock = threading.Lock()
+
+
+def _keep_alive(lease):
+    # 后台续期线程，租约被释放或被其他进程接管后退出
+    while True:
+        time.sleep(_lease_seconds() / 3)
+        if not lease.is_valid() and lease is not _lease:
+            break
+        if not lease.confirmed:
+            # 占用租约的事务尚未提交
+            continue
+        try:
+            renewed = lease.renew()
+        except Exception as e:
+            # 数据库暂时不可用，下次再试；超过有效期后生成器会重新占用节点ID
+            logger.warning(f"订单号节点ID续期失败: {str(e)}")
+            continue
+        finally:
+            connections.close_all()
+        if not renewed:
+            logger.error(f"订单号节点ID {lease.node_id} 的租约已被其他进程接管，重新占用节点ID")
+            lease.valid_until = 0
+            break
+
+
+def get_generator():
+    """获取当前进程的生成器，首次调用或租约失效时占用节点ID并创建"""
+    global _generator, _lease
+    if _generator is None or not _lease.is_valid():
+        with _generator_lock:
+            if _generator is None or not _lease.is_valid():
+                lease = NodeLease()
+                _generator = SnowflakeGenerator(lease.node_id)
+                _lease = lease
+                threading.Thread(target=_keep_alive, args=(lease,), daemon=True).start()
+    return _generator
+
+
+def release_node_id():
+    """释放当前进程占用的节点ID，进程退出时自动调用"""
+    global _generator, _lease
+    with _generator_lock:
+        lease, _generator, _lease = _lease, None, None
+    if lease is not None:
+        lease.release()
+
+
+def _reset_after_fork():
+    # fork出的子进程不能沿用父进程的节点ID和序列号状态，也不能释放父进程的租约，首次使用时重新占用
+    global _generator, _lease, _generator_lock
+    _generator = None
+    _lease = None
+    _generator_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+atexit.register(release_node_id)
+
+
+def next_id():
+    """生成下一个整数ID"""
+    return get_generator().next_id()
+
+
+def new_order_number():
+    """生成订单号：ORD + 19位数字"""
+    return f'ORD{next_id():0{ID_DIGITS}d}'
+
+
+def new_payment_serial():
+    """生成支付流水号：PAY + 19位数字"""
+    return f'PAY{next_id():0{ID_DIGITS}d}'
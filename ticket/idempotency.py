@@ -0,0 +1,100 @@
+import logging
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import IdempotencyKey
+
+# 配置日志记录
+logger = logging.getLogger(__name__)
+
+
+# =======================
+# 下单幂等
+# =======================
+# 下单表单携带一个幂等键（隐藏字段idempotency_key或请求头Idempotency-Key）。
+# 在创建订单的同一个事务中插入幂等键记录：
+#   第一次提交插入成功，创建订单后把订单ID写回记录，随订单一起提交；
+#   同一用户在同一入口重复提交时被(用户, 入口, 幂等键)唯一约束拦下（并发时会等待第一次提交的事务结束），读取原订单直接返回；
+#   第一次提交失败回滚时幂等键记录也一起回滚，重试的请求按新请求处理。
+
+
+def new_key():
+    """生成新的幂等键，渲染下单表单时放入隐藏字段"""
+    return uuid.uuid4().hex
+
+
+def get_key(request):
+    """
+    从请求中读取幂等键，优先使用请求头Idempotency-Key
+
+    Returns:
+        str: 幂等键，没有携带时返回None
+    """
+    key = request.headers.get('Idempotency-Key') or request.POST.get('idempotency_key')
+    return key[:64] if key else None
+
+
+def claim(user, key, endpoint):
+    """
+    在当前事务中登记幂等键，必须在transaction.atomic()内调用
+
+    Args:
+        user: 当前用户
+        key: 幂等键，为None时不做幂等处理
+        endpoint: 创建订单的入口名称
+
+    Returns:
+        tuple: (IdempotencyKey记录或None, 是否为第一次提交)
+    """
+    if not key:
+        return None, True
+    try:
+        # 使用保存点，键已存在时只回滚这一条INSERT
+        with transaction.atomic():
+            return IdempotencyKey.objects.create(key=key, user=user, endpoint=endpoint), True
+    except IntegrityError:
+        record = IdempotencyKey.objects.get(user=user, endpoint=endpoint, key=key)
+        logger.info(f"重复的下单请求: 幂等键={key}, 用户={user.id}, 入口={endpoint}, 原订单={record.order_ids}")
+        return record, False
+
+
+def complete(record, order_ids):
+    """
+    把本次请求创建的订单ID写入幂等键记录
+
+    Args:
+        record: claim返回的IdempotencyKey记录，可以为None
+        order_ids: 订单ID列表
+    """
+    if record is None:
+        return
+    record.order_ids = list(order_ids)
+    record.save(update_fields=['order_ids'])
+
+
+def cleanup_expired(batch_size=1000, now=None):
+    """
+    分批删除超过保留时间的幂等键
+
+    Args:
+        batch_size: 每批删除的记录数
+        now: 当前时间，默认timezone.now()
+
+    Returns:
+        int: 删除的记录数
+    """
+    now = now or timezone.now()
+    cutoff = now - timedelta(hours=getattr(settings, 'IDEMPOTENCY_KEY_TTL_HOURS', 24))
+    deleted = 0
+    while True:
+        ids = list(
+            IdempotencyKey.objects.filter(created_at__lt=cutoff).order_by('created_at').values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            break
+        deleted += IdempotencyKey.objects.filter(id__in=ids).delete()[0]
+    return deleted
@@ -0,0 +1,695 @@
+import logging
+import random
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Count, F, FilteredRelation, Q, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from . import stock_calendar
+from .models import DateStock, Order, StockHold, TicketType
+
+# 配置日志记录
+logger = logging.getLogger(__name__)
+
+
+# =======================
+# 日期库存服务
+# =======================
+# 所有对DateStock的库存扣减、确认和归还都必须经过本模块。
+# 库存字段含义：
+#   stock: 当天剩余可售库存，下单时预占（扣减），取消/退款时归还
+#   sold:  当天已售数量，支付成功时确认（增加），退款时扣回
+# 每个操作都是单条带条件的UPDATE语句（stock >= 数量），
+# 由数据库保证并发下不会超卖，不再在Python中读-改-写。
+#
+# 分片模式：TicketType.stock_shards > 1 时，同一(门票类型, 日期)的库存
+# 拆分为多行（shard = 0..N-1），预占时随机选择一个分片扣减，
+# 分散抢购时对同一行的锁竞争；读取时对所有分片求和。
+#
+# F()表达式UPDATE不触发模型信号，库存变化后需要显式使月历库存缓存失效。
+
+
+class InsufficientStockError(Exception):
+    """库存不足异常，available为扣减失败时的剩余库存"""
+
+    def __init__(self, ticket_type, use_date, requested, available):
+        self.ticket_type = ticket_type
+        self.use_date = use_date
+        self.requested = requested
+        self.available = available
+        super().__init__(f'{use_date} 当日库存仅剩 {available} 张')
+
+
+def _split_stock(stock, shards):
+    """
+    将库存尽量平均地拆分到各个分片，余数分配给前面的分片
+
+    Args:
+        stock: 总库存
+        shards: 分片数
+
+    Returns:
+        list: 各分片的库存
+    """
+    base, remainder = divmod(stock, shards)
+    return [base + (1 if shard < remainder else 0) for shard in range(shards)]
+
+
+def _ticket_type_info(ticket_type):
+    """获取门票类型的(库存分片数, 景点ID)，支持传入TicketType对象或门票类型ID"""
+    if isinstance(ticket_type, int):
+        info = TicketType.objects.filter(id=ticket_type).values_list('stock_shards', 'scenic_spot_id').first()
+        shards, spot_id = info or (1, None)
+        return max(shards, 1), spot_id
+    return max(ticket_type.stock_shards, 1), ticket_type.scenic_spot_id
+
+
+def _shard_count(ticket_type):
+    """获取门票类型的库存分片数，支持传入TicketType对象或门票类型ID"""
+    return _ticket_type_info(ticket_type)[0]
+
+
+def ensure_date_stock(ticket_type, use_date):
+    """
+    确保指定门票类型和日期的库存记录存在，不存在时使用门票类型的默认库存创建，
+    分片模式下按分片数拆分默认库存
+
+    Args:
+        ticket_type: TicketType对象
+        use_date: 使用日期，date对象
+    """
+    if DateStock.objects.filter(ticket_type=ticket_type, use_date=use_date).exists():
+        return
+
+    rows = [
+        DateStock(ticket_type=ticket_type, use_date=use_date, shard=shard, stock=part)
+        for shard, part in enumerate(_split_stock(ticket_type.stock, _shard_count(ticket_type)))
+    ]
+    try:
+        # 使用保存点，并发创建时唯一约束冲突只回滚这一次INSERT
+        with transaction.atomic():
+            DateStock.objects.bulk_create(rows)
+    except IntegrityError:
+        # 其他请求已经抢先创建了该记录
+        pass
+
+
+def get_date_stock_totals(ticket_type, use_date):
+    """
+    汇总指定日期所有分片的剩余库存和已售数量
+
+    Args:
+        ticket_type: TicketType对象
+        use_date: 使用日期，date对象
+
+    Returns:
+        dict: {'stock': 剩余库存, 'sold': 已售数量}，没有库存记录时返回None
+    """
+    totals = DateStock.objects.filter(
+        ticket_type=ticket_type, use_date=use_date
+    ).aggregate(stock=Sum('stock'), sold=Sum('sold'), rows=Count('id'))
+    if not totals['rows']:
+        return None
+    return {'stock': totals['stock'], 'sold': totals['sold']}
+
+
+def get_available_stock(ticket_type, use_date):
+    """
+    查询指定日期的剩余库存（所有分片之和），没有库存记录时返回门票类型的默认库存
+
+    Args:
+        ticket_type: TicketType对象
+        use_date: 使用日期，date对象
+
+    Returns:
+        int: 剩余库存
+    """
+    totals = get_date_stock_totals(ticket_type, use_date)
+    return ticket_type.stock if totals is None else totals['stock']
+
+
+def with_date_stock(ticket_types, use_date):
+    """
+    为门票类型查询集附加指定日期的库存，一条LEFT JOIN聚合查询取回所有门票类型
+
+    附加的字段：
+        available_stock: 剩余库存（所有分片之和），没有库存记录时为门票类型的默认库存
+        date_sold: 已售数量，没有库存记录时为0
+        date_stock_rows: 库存记录（分片）数，为0说明该日期还没有库存记录
+
+    Args:
+        ticket_types: TicketType查询集
+        use_date: 使用日期，date对象
+
+    Returns:
+        QuerySet: 附加了库存字段的TicketType查询集
+    """
+    return ticket_types.annotate(
+        day_stock=FilteredRelation('datestock', condition=Q(datestock__use_date=use_date)),
+    ).annotate(
+        available_stock=Coalesce(Sum('day_stock__stock'), F('stock')),
+        date_sold=Coalesce(Sum('day_stock__sold'), 0),
+        date_stock_rows=Count('day_stock'),
+    )
+
+
+def get_stock_calendar(ticket_types, start_date, end_date):
+    """
+    查询一组门票类型在日期范围内每天的剩余库存，一条LEFT JOIN分组查询完成
+
+    没有库存记录的日期使用门票类型的默认库存。
+
+    Args:
+        ticket_types: TicketType查询集
+        start_date: 开始日期（包含），date对象
+        end_date: 结束日期（包含），date对象
+
+    Returns:
+        dict: {门票类型ID: {date对象: 剩余库存}}，按日期顺序
+    """
+    rows = (
+        ticket_types.annotate(
+            day_stock=FilteredRelation(
+                'datestock',
+                condition=Q(datestock__use_date__gte=start_date, datestock__use_date__lte=end_date),
+            ),
+        )
+        .order_by()
+        .values('id', 'stock', 'day_stock__use_date')
+        .annotate(total=Sum('day_stock__stock'))
+    )
+
+    days = [start_date + timedelta(days=offset) for offset in range((end_date - start_date).days + 1)]
+    calendar = {}
+    for row in rows:
+        stocks = calendar.setdefault(row['id'], {day: row['stock'] for day in days})
+        if row['day_stock__use_date'] is not None:
+            stocks[row['day_stock__use_date']] = row['total']
+    return calendar
+
+
+def _reserve_across_shards(ticket_type, use_date, quantity):
+    """
+    单个分片不足时的兜底：锁定该日期的全部分片，从多个分片凑足预占数量
+
+    Returns:
+        bool: 是否预占成功
+    """
+    with transaction.atomic():
+        # 按分片序号顺序加锁，避免并发兜底时死锁
+        rows = list(
+            DateStock.objects.select_for_update()
+            .filter(ticket_type=ticket_type, use_date=use_date, stock__gt=0)
+            .order_by('shard')
+        )
+        if sum(row.stock for row in rows) < quantity:
+            return False
+
+        now = timezone.now()
+        remaining = quantity
+        for row in rows:
+            take = min(row.stock, remaining)
+            row.stock -= take
+            row.updated_at = now
+            remaining -= take
+            if not remaining:
+                break
+        DateStock.objects.bulk_update(rows, ['stock', 'updated_at'])
+    return True
+
+
+def reserve_stock(ticket_type, use_date, quantity):
+    """
+    预占库存：下单时扣减剩余库存
+
+    使用 UPDATE ... SET stock = stock - n WHERE stock >= n 单条语句完成检查和扣减，
+    受影响行数为0说明库存不足。分片模式下先随机选择一个分片扣减，
+    所有分片都无法单独满足时再锁定全部分片合并扣减。
+
+    Args:
+        ticket_type: TicketType对象
+        use_date: 使用日期，date对象
+        quantity: 预占数量
+
+    Raises:
+        InsufficientStockError: 库存不足
+    """
+    if quantity <= 0:
+        raise ValueError('购买数量必须大于0')
+
+    ensure_date_stock(ticket_type, use_date)
+    shards = list(range(_shard_count(ticket_type)))
+    # 随机顺序尝试各分片，让并发请求落在不同的行上
+    random.shuffle(shards)
+
+    updated = 0
+    for shard in shards:
+        with transaction.atomic():
+            updated = DateStock.objects.filter(
+                ticket_type=ticket_type,
+                use_date=use_date,
+                shard=shard,
+                stock__gte=quantity,
+            ).update(stock=F('stock') - quantity, updated_at=timezone.now())
+        if updated:
+            break
+
+    if not updated and len(shards) > 1:
+        updated = _reserve_across_shards(ticket_type, use_date, quantity)
+
+    if not updated:
+        available = get_available_stock(ticket_type, use_date)
+        logger.info(f"库存不足: 门票类型={ticket_type.id}, 日期={use_date}, 请求={quantity}, 剩余={available}")
+        raise InsufficientStockError(ticket_type, use_date, quantity, available)
+
+    stock_calendar.invalidate_month(ticket_type.scenic_spot_id, use_date)
+
+
+def _ensure_date_stock_batch(ticket_types):
+    """
+    批量确保多个(门票类型, 日期)的库存记录存在，只为完全没有记录的组合创建分片行
+
+    Args:
+        ticket_types: {(门票类型ID, 使用日期): TicketType对象}
+    """
+    condition = Q()
+    for ticket_type_id, use_date in ticket_types:
+        condition |= Q(ticket_type_id=ticket_type_id, use_date=use_date)
+    existing = set(
+        DateStock.objects.filter(condition).values_list('ticket_type_id', 'use_date').distinct()
+    )
+
+    rows = [
+        DateStock(ticket_type=ticket_type, use_date=use_date, shard=shard, stock=part)
+        for (ticket_type_id, use_date), ticket_type in ticket_types.items()
+        if (ticket_type_id, use_date) not in existing
+        for shard, part in enumerate(_split_stock(ticket_type.stock, _shard_count(ticket_type)))
+    ]
+    if rows:
+        # 并发请求抢先创建的行直接忽略，已有行的库存不受影响
+        DateStock.objects.bulk_create(rows, ignore_conflicts=True)
+
+
+def reserve_stock_batch(items):
+    """
+    批量预占库存：一次结算多个购物车项时使用
+
+    先按(门票类型, 日期, 分片)的固定顺序用一条 SELECT ... FOR UPDATE 锁定所有涉及的库存行，
+    并发结算以相同顺序加锁，不会互相死锁；锁定后在内存中逐项分配，
+    最后用一条 bulk_update 写回。库存不足的项不扣减，其他项照常预占。
+    必须在事务中调用，调用方提交事务后锁才释放。
+
+    Args:
+        items: [(TicketType对象, 使用日期, 数量)] 列表
+
+    Returns:
+        list: 与items一一对应，预占成功为None，库存不足为InsufficientStockError
+    """
+    if not items:
+        return []
+
+    ticket_types = {(ticket_type.id, use_date): ticket_type for ticket_type, use_date, _ in items}
+    _ensure_date_stock_batch(ticket_types)
+
+    condition = Q()
+    for ticket_type_id, use_date in ticket_types:
+        condition |= Q(ticket_type_id=ticket_type_id, use_date=use_date)
+    rows_by_key = defaultdict(list)
+    locked = DateStock.objects.select_for_update().filter(condition).order_by('ticket_type_id', 'use_date', 'shard')
+    for row in locked:
+        rows_by_key[(row.ticket_type_id, row.use_date)].append(row)
+
+    now = timezone.now()
+    results = []
+    changed = {}
+    for ticket_type, use_date, quantity in items:
+        rows = rows_by_key[(ticket_type.id, use_date)]
+        available = sum(row.stock for row in rows)
+        if quantity <= 0 or available < quantity:
+            logger.info(f"库存不足: 门票类型={ticket_type.id}, 日期={use_date}, 请求={quantity}, 剩余={available}")
+            results.append(InsufficientStockError(ticket_type, use_date, quantity, available))
+            continue
+
+        # 优先从剩余最多的分片扣减，保持各分片库存均衡
+        remaining = quantity
+        for row in sorted(rows, key=lambda row: row.stock, reverse=True):
+            take = min(row.stock, remaining)
+            if take:
+                row.stock -= take
+                row.updated_at = now
+                changed[row.id] = row
+                remaining -= take
+            if not remaining:
+                break
+        results.append(None)
+
+    if changed:
+        DateStock.objects.bulk_update(list(changed.values()), ['stock', 'updated_at'])
+        # 每个景点每个月只失效一次
+        for spot_id, month in {(tt.scenic_spot_id, d.replace(day=1)) for tt, d, _ in items}:
+            stock_calendar.invalidate_month(spot_id, month)
+    return results
+
+
+def _update_groups(items, build_changes):
+    """
+    按(门票类型, 日期)合并数量，每组对随机一个分片执行一条增量UPDATE
+
+    Args:
+        items: [(门票类型ID, 使用日期, 数量)] 列表
+        build_changes: 根据合并后的数量返回UPDATE字段的函数
+    """
+    groups = defaultdict(int)
+    for ticket_type_id, use_date, quantity in items:
+        groups[(ticket_type_id, use_date)] += quantity
+    if not groups:
+        return
+
+    # 一条查询取出所有门票类型的分片数和景点ID
+    infos = {
+        ticket_type_id: (max(shards, 1), spot_id)
+        for ticket_type_id, shards, spot_id in TicketType.objects.filter(
+            id__in={ticket_type_id for ticket_type_id, _ in groups}
+        ).values_list('id', 'stock_shards', 'scenic_spot_id')
+    }
+    # 按固定顺序更新，并发的批量操作以相同顺序加锁
+    for (ticket_type_id, use_date), quantity in sorted(groups.items()):
+        shards, spot_id = infos.get(ticket_type_id, (1, None))
+        changes = build_changes(quantity)
+        shard = random.randrange(shards)
+        updated = DateStock.objects.filter(
+            ticket_type_id=ticket_type_id, use_date=use_date, shard=shard,
+        ).update(**changes)
+        if not updated and shard:
+            DateStock.objects.filter(ticket_type_id=ticket_type_id, use_date=use_date, shard=0).update(**changes)
+        # 月历只展示剩余库存，只修改已售数量时不需要失效
+        if 'stock' in changes and spot_id is not None:
+            stock_calendar.invalidate_month(spot_id, use_date)
+
+
+def commit_stock_batch(items):
+    """
+    批量确认库存：一次支付多个订单时使用，相同(门票类型, 日期)的数量合并为一条UPDATE
+
+    必须在事务中调用。
+
+    Args:
+        items: [(门票类型ID, 使用日期, 数量)] 列表
+    """
+    now = timezone.now()
+    _update_groups(items, lambda quantity: {'sold': F('sold') + quantity, 'updated_at': now})
+
+
+def release_stock_batch(items, committed=False):
+    """
+    批量归还库存：批量取消或退款时使用，相同(门票类型, 日期)的数量合并为一条UPDATE
+
+    必须在事务中调用。
+
+    Args:
+        items: [(门票类型ID, 使用日期, 数量)] 列表
+        committed: 订单是否已支付确认，已确认的订单需要同时扣回已售数量
+    """
+    now = timezone.now()
+
+    def build_changes(quantity):
+        changes = {'stock': F('stock') + quantity, 'updated_at': now}
+        if committed:
+            changes['sold'] = F('sold') - quantity
+        return changes
+
+    _update_groups(items, build_changes)
+
+
+def set_date_stock(ticket_type, use_date, stock):
+    """
+    管理员设置指定日期的剩余库存，记录不存在时创建
+
+    库存按门票类型当前的分片数重新拆分，多余分片的已售数量合并到0号分片。
+
+    Args:
+        ticket_type: TicketType对象
+        use_date: 使用日期，date对象或"YYYY-MM-DD"字符串
+        stock: 新的剩余库存
+    """
+    shards = _shard_count(ticket_type)
+    with transaction.atomic():
+        rows = {
+            row.shard: row
+            for row in DateStock.objects.select_for_update().filter(ticket_type=ticket_type, use_date=use_date)
+        }
+        # 分片数减少时删除多余分片，其已售数量计入0号分片
+        extra_sold = sum(row.sold for shard, row in rows.items() if shard >= shards)
+        DateStock.objects.filter(ticket_type=ticket_type, use_date=use_date, shard__gte=shards).delete()
+
+        for shard, part in enumerate(_split_stock(int(stock), shards)):
+            row = rows.get(shard) or DateStock(ticket_type=ticket_type, use_date=use_date, shard=shard)
+            row.stock = part
+            if shard == 0:
+                row.sold += extra_sold
+            row.save()
+
+
+def expand_dates(start_date, end_date, weekdays=None):
+    """
+    展开日期范围，可按星期筛选
+
+    Args:
+        start_date: 开始日期（包含），date对象
+        end_date: 结束日期（包含），date对象
+        weekdays: 星期列表，0表示周一，6表示周日；为空时包含每一天
+
+    Returns:
+        list: date对象列表
+    """
+    weekdays = set(weekdays or range(7))
+    days = (end_date - start_date).days + 1
+    return [
+        start_date + timedelta(days=offset)
+        for offset in range(days)
+        if (start_date + timedelta(days=offset)).weekday() in weekdays
+    ]
+
+
+def bulk_set_date_stock(ticket_types, dates, stock=None, delta=None, batch_size=500):
+    """
+    批量设置多个门票类型在多个日期的剩余库存，整个操作在一个事务内完成
+
+    stock和delta二选一：stock直接设置剩余库存，delta在当前剩余库存（没有记录时为默认库存）
+    基础上增减，结果不小于0。每批日期只执行一次加锁查询，已有记录用bulk_update更新，
+    缺少的记录用bulk_create写入，并发插入冲突时按唯一约束更新库存。
+
+    Args:
+        ticket_types: TicketType对象列表
+        dates: date对象列表
+        stock: 新的剩余库存
+        delta: 剩余库存增减量
+        batch_size: 每批处理的日期数，同时作为bulk_create/bulk_update的批量大小
+
+    Returns:
+        int: 写入的(门票类型, 日期)组合数
+    """
+    if (stock is None) == (delta is None):
+        raise ValueError('stock和delta必须且只能指定一个')
+    if stock is not None and stock < 0:
+        raise ValueError('库存不能小于0')
+
+    # MySQL的ON DUPLICATE KEY UPDATE不支持指定冲突字段
+    unique_fields = None
+    if connection.features.supports_update_conflicts_with_target:
+        unique_fields = ['ticket_type', 'use_date', 'shard']
+
+    ticket_types = {ticket_type.id: ticket_type for ticket_type in ticket_types}
+    dates = sorted(set(dates))
+    now = timezone.now()
+    written = 0
+    with transaction.atomic():
+        for start in range(0, len(dates), batch_size):
+            batch_dates = dates[start:start + batch_size]
+            # 一次查询锁定本批日期所有门票类型的库存记录
+            existing = defaultdict(dict)
+            for row in DateStock.objects.select_for_update().filter(
+                ticket_type_id__in=ticket_types, use_date__in=batch_dates
+            ):
+                existing[(row.ticket_type_id, row.use_date)][row.shard] = row
+
+            to_update, to_create, to_delete = [], [], []
+            for ticket_type in ticket_types.values():
+                shards = _shard_count(ticket_type)
+                for use_date in batch_dates:
+                    rows = existing.get((ticket_type.id, use_date), {})
+                    if stock is not None:
+                        total = stock
+                    else:
+                        current = sum(row.stock for row in rows.values()) if rows else ticket_type.stock
+                        total = max(current + delta, 0)
+
+                    # 分片数调整后多出的分片删除，其已售数量计入0号分片
+                    extra_sold = 0
+                    for shard, row in rows.items():
+                        if shard >= shards:
+                            extra_sold += row.sold
+                            to_delete.append(row.id)
+
+                    for shard, part in enumerate(_split_stock(total, shards)):
+                        row = rows.get(shard)
+                        if row is None:
+                            to_create.append(DateStock(
+                                ticket_type=ticket_type, use_date=use_date, shard=shard,
+                                stock=part, sold=extra_sold if shard == 0 else 0,
+                            ))
+                        else:
+                            row.stock = part
+                            row.updated_at = now
+                            if shard == 0:
+                                row.sold += extra_sold
+                            to_update.append(row)
+                    written += 1
+
+            if to_delete:
+                DateStock.objects.filter(id__in=to_delete).delete()
+            if to_update:
+                DateStock.objects.bulk_update(to_update, ['stock', 'sold', 'updated_at'], batch_size=batch_size)
+            if to_create:
+                DateStock.objects.bulk_create(
+                    to_create,
+                    batch_size=batch_size,
+                    update_conflicts=True,
+                    unique_fields=unique_fields,
+                    update_fields=['stock', 'updated_at'],
+                )
+
+        # 批量写入不触发模型信号，按(景点, 月份)使月历缓存失效
+        months = {(use_date.year, use_date.month): use_date for use_date in dates}
+        for spot_id in {ticket_type.scenic_spot_id for ticket_type in ticket_types.values()}:
+            for use_date in months.values():
+                stock_calendar.invalidate_month(spot_id, use_date)
+
+    logger.info(f"批量设置日期库存: 门票类型={list(ticket_types)}, 日期数={len(dates)}, 组合数={written}")
+    return written
+
+
+def set_stock_shards(ticket_type, shards):
+    """
+    调整门票类型的库存分片数，并按新分片数重新拆分今天及以后日期的库存
+
+    Args:
+        ticket_type: TicketType对象
+        shards: 新的分片数，1表示关闭分片模式
+    """
+    shards = int(shards)
+    if shards < 1:
+        raise ValueError('分片数必须大于0')
+    if shards == ticket_type.stock_shards:
+        return
+
+    with transaction.atomic():
+        ticket_type.stock_shards = shards
+        ticket_type.save(update_fields=['stock_shards', 'updated_at'])
+        totals = (
+            DateStock.objects.filter(ticket_type=ticket_type, use_date__gte=timezone.localdate())
+            .values('use_date')
+            .annotate(total=Sum('stock'))
+        )
+        for row in totals:
+            set_date_stock(ticket_type, row['use_date'], row['total'])
+    logger.info(f"调整库存分片数: 门票类型={ticket_type.id}, 分片数={shards}")
+
+
+# =======================
+# 库存预占（未支付订单）
+# =======================
+
+def create_hold(order):
+    """
+    为新创建的待支付订单记录库存预占，超过STOCK_HOLD_MINUTES未支付将被自动释放
+
+    Args:
+        order: 已预占库存的Order对象
+
+    Returns:
+        StockHold: 预占记录
+    """
+    minutes = getattr(settings, 'STOCK_HOLD_MINUTES', 15)
+    return StockHold.objects.create(
+        order=order,
+        ticket_type_id=order.ticket_type_id,
+        use_date=order.use_date,
+        quantity=order.quantity,
+        expires_at=timezone.now() + timedelta(minutes=minutes),
+    )
+
+
+def create_holds(orders):
+    """
+    批量为新创建的待支付订单记录库存预占，一条INSERT完成
+
+    Args:
+        orders: 已预占库存的Order对象列表（必须已有主键）
+
+    Returns:
+        list: StockHold对象列表
+    """
+    minutes = getattr(settings, 'STOCK_HOLD_MINUTES', 15)
+    expires_at = timezone.now() + timedelta(minutes=minutes)
+    return StockHold.objects.bulk_create([
+        StockHold(
+            order=order,
+            ticket_type_id=order.ticket_type_id,
+            use_date=order.use_date,
+            quantity=order.quantity,
+            expires_at=expires_at,
+        )
+        for order in orders
+    ])
+
+
+def release_expired_holds(batch_size=500, now=None):
+    """
+    批量释放一批已过期的库存预占：取消仍为待支付的订单并归还库存
+
+    按expires_at索引取最早过期的一批记录，通过order_state把订单状态更新为已取消，
+    库存按(门票类型, 使用日期)分组后每组一条UPDATE归还。
+    与支付确认使用相同的加锁顺序：先锁订单，再删除预占记录。正在支付的订单已被锁定，
+    跳过不处理，支付完成后预占记录随支付删除，支付失败则由下一次清理释放。
+
+    Args:
+        batch_size: 每批处理的预占记录数
+        now: 当前时间，默认timezone.now()
+
+    Returns:
+        tuple: (本批释放的预占记录数, 本批取消的订单数)
+    """
+    # 延迟导入，order_state模块在顶层导入了本模块
+    from . import order_state
+
+    now = now or timezone.now()
+    with transaction.atomic():
+        # 读取过期记录不加锁，只用来确定要处理的订单
+        holds = dict(
+            StockHold.objects.filter(expires_at__lte=now)
+            .order_by('expires_at').values_list('id', 'order_id')[:batch_size]
+        )
+        if not holds:
+            return 0, 0
+
+        # 先锁定仍处于待支付状态的订单，其他事务正在支付或取消的订单跳过
+        orders = list(
+            Order.objects.select_for_update(skip_locked=True)
+            .filter(id__in=set(holds.values()), status=order_state.PENDING)
+            .only(*order_state.ROW_FIELDS)
+            .order_by('id')
+        )
+        # 取消订单并按(门票类型, 使用日期)合并归还库存，同时删除这些订单的预占记录
+        order_state.apply_transition(orders, 'cancel', now=now)
+
+        # 订单已不是待支付状态（已支付或已取消）的预占记录直接清理，不需要锁订单
+        cleaned = StockHold.objects.filter(id__in=list(holds)).exclude(order__status=order_state.PENDING).delete()[0]
+
+    released = len(orders) + cleaned
+    logger.info(f"释放过期库存预占: 记录={released}, 取消订单={len(orders)}")
+    return released, len(orders)
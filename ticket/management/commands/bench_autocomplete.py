@@ -0,0 +1,80 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ticket import autocomplete
+
+# 生成景点名称用的常见汉字，前面的字出现得更频繁
+CHARACTERS = (
+    '山水湖公园古城寺庙博物馆景区国家森林湿地峡谷温泉海滩岛乐园故宫长城西北京上南天津河江省市县镇村'
+    '龙凤云龙泉石桥塔楼阁亭台花鸟鱼竹梅兰松柏黄金银玉清明月星光东中华大小新老红白青绿'
+)
+
+
+def _percentile(values, percent):
+    # 最近秩法计算百分位数
+    ordered = sorted(values)
+    index = max(int(round(percent / 100 * len(ordered))) - 1, 0)
+    return ordered[min(index, len(ordered) - 1)]
+
+
+class Command(BaseCommand):
+    help = 'Build an autocomplete index over synthetic spot names and measure per-keystroke latency'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--spots', type=int, default=100000, help='Synthetic scenic spots in the index')
+        parser.add_argument('--names', type=int, default=200, help='Spot names to type keystroke by keystroke')
+        parser.add_argument('--limit', type=int, default=10, help='Suggestions per keystroke')
+        parser.add_argument('--budget-ms', type=float, default=0.5, help='Fail if the p99 latency exceeds this')
+        parser.add_argument('--seed', type=int, default=1, help='Random seed')
+
+    def handle(self, *args, **options):
+        if options['spots'] <= 0 or options['names'] <= 0:
+            raise CommandError('--spots and --names must be positive')
+        if autocomplete.lazy_pinyin is None:
+            self.stdout.write(self.style.WARNING('pypinyin is not installed, only name prefixes are indexed'))
+        rng = random.Random(options['seed'])
+        weights = range(len(CHARACTERS), 0, -1)
+
+        started = time.perf_counter()
+        spots = {}
+        for spot_id in range(1, options['spots'] + 1):
+            name = ''.join(rng.choices(CHARACTERS, weights=weights, k=rng.randint(2, 8)))
+            spots[spot_id] = (name, rng.random() < 0.05, rng.randint(0, 100000), autocomplete.spot_keys(name))
+        self.stdout.write(f"Generated keys for {options['spots']} spots in {time.perf_counter() - started:.1f}s")
+        started = time.perf_counter()
+        index = autocomplete.SuggestIndex(spots)
+        self.stdout.write(f'Built index in {time.perf_counter() - started:.2f}s')
+
+        # 模拟逐字输入：名称、全拼、拼音首字母的每一个前缀都查询一次
+        typed = {'name': [], 'full pinyin': [], 'initials': []}
+        for spot_id in rng.sample(sorted(spots), min(options['names'], len(spots))):
+            keys = spots[spot_id][3]
+            for kind, key in zip(typed, keys):
+                typed[kind].extend(key[:length] for length in range(1, len(key) + 1))
+
+        results = []
+        for kind, prefixes in typed.items():
+            if not prefixes:
+                continue
+            timings = []
+            hits = 0
+            for prefix in prefixes:
+                query_started = time.perf_counter()
+                suggestions = index.suggest(autocomplete.normalize(prefix), options['limit'])
+                timings.append((time.perf_counter() - query_started) * 1000)
+                hits += bool(suggestions)
+            results.append((kind, timings, hits))
+
+        self.stdout.write(f"{'keystrokes':<14} {'count':>7} {'p50':>10} {'p99':>10} {'max':>10}  with results")
+        for kind, timings, hits in results:
+            self.stdout.write(
+                f'{kind:<14} {len(timings):>7} {_percentile(timings, 50):>8.3f}ms '
+                f'{_percentile(timings, 99):>8.3f}ms {max(timings):>8.3f}ms  {hits}/{len(timings)}'
+            )
+
+        p99 = _percentile([timing for _, timings, _ in results for timing in timings], 99)
+        if p99 > options['budget_ms']:
+            raise CommandError(f"Autocomplete p99 {p99:.3f}ms exceeds budget {options['budget_ms']}ms")
+        self.stdout.write(self.style.SUCCESS(f'Autocomplete p99 {p99:.3f}ms is within budget'))
@@ -0,0 +1,87 @@
+import time
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from ticket import checkout, id_generator
+from ticket.models import Cart, ScenicSpot, TicketType, User
+
+
+def _percentile(values, percent):
+    # 最近秩法计算百分位数
+    ordered = sorted(values)
+    index = max(int(round(percent / 100 * len(ordered))) - 1, 0)
+    return ordered[min(index, len(ordered) - 1)]
+
+
+class Command(BaseCommand):
+    help = 'Measure cart checkout latency and query count against the number of cart items'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='1,5,10,20,50', help='Comma separated cart sizes to measure')
+        parser.add_argument('--repeat', type=int, default=20, help='Checkouts per cart size')
+        parser.add_argument('--shards', type=int, default=1, help='Stock shards per ticket type')
+
+    def _fill_cart(self, user, spot, ticket_types, use_date):
+        # 每个门票类型一个购物车项，返回购物车项ID列表
+        items = Cart.objects.bulk_create([
+            Cart(user=user, scenic_spot=spot, ticket_type=ticket_type, use_date=use_date, quantity=1)
+            for ticket_type in ticket_types
+        ])
+        if items and items[0].id is None:
+            return list(Cart.objects.filter(user=user).values_list('id', flat=True))
+        return [item.id for item in items]
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options['sizes'].split(',')]
+        repeat = options['repeat']
+        user = User.objects.create_user(username='checkout-bench', email='checkout-bench@example.com', password=None)
+        spot = ScenicSpot.objects.create(
+            name='结算压测景点', description='bench', price=0, image='bench.jpg',
+            address='bench', opening_hours='',
+        )
+        try:
+            ticket_types = [
+                TicketType.objects.create(
+                    scenic_spot=spot, name=f'门票{i}', price=10, stock=repeat * 10, stock_shards=options['shards'],
+                )
+                for i in range(max(sizes))
+            ]
+            # 首次生成订单号时占用节点ID，提前占用，不计入结算的查询数
+            id_generator.get_generator()
+            results = {}
+            for round_index, size in enumerate(sizes):
+                timings = []
+                queries = set()
+                for i in range(repeat):
+                    # 每次结算使用不同的日期，都包含首次创建库存行的开销
+                    use_date = date.today() + timedelta(days=1 + round_index * repeat + i)
+                    item_ids = self._fill_cart(user, spot, ticket_types[:size], use_date)
+                    with CaptureQueriesContext(connection) as context:
+                        started = time.perf_counter()
+                        result = checkout.checkout_cart(user, item_ids)
+                        timings.append((time.perf_counter() - started) * 1000)
+                    queries.add(len(context.captured_queries))
+                    if result.failures or len(result.orders) != size:
+                        raise CommandError(f'Checkout of {size} items failed: {result.failures}')
+                results[size] = (timings, queries)
+                # 清理本轮订单，库存行随景点一起删除
+                user.order_set.all().delete()
+        finally:
+            spot.delete()
+            user.delete()
+
+        self.stdout.write(f"{'items':>6} {'p50':>10} {'p99':>10} {'per item':>10}  queries")
+        for size, (timings, queries) in results.items():
+            p50 = _percentile(timings, 50)
+            self.stdout.write(
+                f'{size:>6} {p50:>8.2f}ms {_percentile(timings, 99):>8.2f}ms {p50 / size:>8.3f}ms  '
+                + ','.join(str(count) for count in sorted(queries))
+            )
+
+        query_counts = {count for _, queries in results.values() for count in queries}
+        if len(query_counts) != 1:
+            raise CommandError(f'Query count depends on cart size: {sorted(query_counts)}')
+        self.stdout.write(self.style.SUCCESS(f'Checkout uses {query_counts.pop()} queries regardless of cart size'))
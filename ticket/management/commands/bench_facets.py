@@ -0,0 +1,117 @@
+import random
+import time
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ticket import facets
+from ticket.models import Region, ScenicSpot, ScenicSpotTag, Tag
+
+
+def _percentile(values, percent):
+    # 最近秩法计算百分位数
+    ordered = sorted(values)
+    index = max(int(round(percent / 100 * len(ordered))) - 1, 0)
+    return ordered[min(index, len(ordered) - 1)]
+
+
+class Command(BaseCommand):
+    help = 'Seed scenic spots with regions, categories and tags and measure facet count latency'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--spots', type=int, default=100000, help='Scenic spots to seed')
+        parser.add_argument('--repeat', type=int, default=50, help='Computations per filter combination')
+        parser.add_argument('--budget-ms', type=float, default=5.0, help='Fail if an uncached p99 exceeds this')
+        parser.add_argument('--seed', type=int, default=1, help='Random seed')
+
+    def _seed(self, rng, run_id, count):
+        # 34个地区、8个分类、50个标签，地区和标签的景点数相差较大
+        Region.objects.bulk_create([Region(name=f'分面压测地区{run_id}-{i:02d}') for i in range(34)])
+        regions = list(Region.objects.filter(name__startswith=f'分面压测地区{run_id}-').order_by('name'))
+        categories = [f'分面压测分类{run_id}-{i}' for i in range(8)]
+        batch = []
+        for i in range(count):
+            batch.append(ScenicSpot(
+                name=f'分面压测景点{run_id}-{i}', description='bench', price=10, image='bench.jpg',
+                address='bench', opening_hours='', category=rng.choice(categories),
+                region=rng.choices(regions, weights=range(len(regions), 0, -1))[0],
+            ))
+            if len(batch) == 5000:
+                ScenicSpot.objects.bulk_create(batch)
+                batch = []
+        ScenicSpot.objects.bulk_create(batch)
+
+        Tag.objects.bulk_create([Tag(name=f'分面压测标签{run_id}-{i:02d}') for i in range(50)])
+        tags = list(Tag.objects.filter(name__startswith=f'分面压测标签{run_id}-').order_by('name'))
+        spot_ids = ScenicSpot.objects.filter(name__startswith=f'分面压测景点{run_id}-').values_list('id', flat=True)
+        links = []
+        for spot_id in spot_ids.iterator():
+            spot_tags = set(rng.choices(tags, weights=[1 / (i + 1) for i in range(len(tags))], k=3))
+            links.extend(
+                ScenicSpotTag(scenic_spot_id=spot_id, tag=tag, position=position)
+                for position, tag in enumerate(spot_tags)
+            )
+            if len(links) >= 5000:
+                ScenicSpotTag.objects.bulk_create(links)
+                links = []
+        ScenicSpotTag.objects.bulk_create(links)
+        return regions, categories, tags, list(spot_ids)
+
+    def handle(self, *args, **options):
+        if options['spots'] <= 0 or options['repeat'] <= 0:
+            raise CommandError('--spots and --repeat must be positive')
+        rng = random.Random(options['seed'])
+        run_id = uuid.uuid4().hex[:8]
+        self.stdout.write(f"Seeding {options['spots']} scenic spots ...")
+        try:
+            regions, categories, tags, spot_ids = self._seed(rng, run_id, options['spots'])
+            # 批量写入不触发信号，手动更新版本号后重建位图索引
+            facets.invalidate()
+            started = time.perf_counter()
+            index = facets.get_index()
+            self.stdout.write(
+                f'Built facet index over {len(index.positions)} spots in {time.perf_counter() - started:.2f}s'
+            )
+
+            region, category, tag = regions[0].name, categories[0], tags[0].name
+            search_ids = rng.sample(spot_ids, min(1000, len(spot_ids)))
+            combinations = [
+                ('no filter', {'region': '', 'category': '', 'tag': ''}, None),
+                ('region', {'region': region, 'category': '', 'tag': ''}, None),
+                ('region + category', {'region': region, 'category': category, 'tag': ''}, None),
+                ('region + category + tag', {'region': region, 'category': category, 'tag': tag}, None),
+                ('search (1000 results)', {'region': '', 'category': '', 'tag': ''}, search_ids),
+                ('search + region', {'region': region, 'category': '', 'tag': ''}, search_ids),
+            ]
+            results = []
+            for name, filters, ids in combinations:
+                # 未缓存：直接用位图索引计算
+                uncached = []
+                for _ in range(options['repeat']):
+                    started = time.perf_counter()
+                    computed = facets.compute_facets(index, filters, ids)
+                    uncached.append((time.perf_counter() - started) * 1000)
+                # 已缓存：第一次调用写入缓存，之后读取缓存
+                facets.get_facets(**filters, search_keyword=name, search_ids=ids)
+                cached = []
+                for _ in range(options['repeat']):
+                    started = time.perf_counter()
+                    facets.get_facets(**filters, search_keyword=name, search_ids=ids)
+                    cached.append((time.perf_counter() - started) * 1000)
+                results.append((name, computed['total'], uncached, cached))
+        finally:
+            ScenicSpot.objects.filter(name__startswith=f'分面压测景点{run_id}-').delete()
+            Tag.objects.filter(name__startswith=f'分面压测标签{run_id}-').delete()
+            Region.objects.filter(name__startswith=f'分面压测地区{run_id}-').delete()
+
+        self.stdout.write(f"{'filters':<26} {'results':>8} {'uncached p50':>13} {'p99':>9} {'cached p50':>11}")
+        for name, total, uncached, cached in results:
+            self.stdout.write(
+                f'{name:<26} {total:>8} {_percentile(uncached, 50):>11.2f}ms {_percentile(uncached, 99):>7.2f}ms '
+                f'{_percentile(cached, 50):>9.3f}ms'
+            )
+
+        p99 = max(_percentile(uncached, 99) for _, _, uncached, _ in results)
+        if p99 > options['budget_ms']:
+            raise CommandError(f"Uncached facet p99 {p99:.2f}ms exceeds budget {options['budget_ms']}ms")
+        self.stdout.write(self.style.SUCCESS(f'Uncached facet p99 {p99:.2f}ms is within budget'))
@@ -0,0 +1,88 @@
+import time
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+from ticket.models import Carousel, News, ScenicSpot
+
+# 不缓存任何内容的缓存后端，用于测量未缓存时的首页吞吐量
+DUMMY_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+
+
+def _percentile(values, percent):
+    # 最近秩法计算百分位数
+    ordered = sorted(values)
+    index = max(int(round(percent / 100 * len(ordered))) - 1, 0)
+    return ordered[min(index, len(ordered) - 1)]
+
+
+class Command(BaseCommand):
+    help = 'Measure homepage throughput with and without the fragment cache'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=300, help='Homepage requests per mode')
+        parser.add_argument('--min-speedup', type=float, default=10.0, help='Fail if cached throughput gains less')
+
+    def _seed(self, run_id):
+        # 通过save()创建，和后台录入一样触发信号；创建时间最新，都会出现在首页
+        spots = [
+            ScenicSpot.objects.create(
+                name=f'首页压测景点{run_id}-{i}', description='bench ' * 40, price=10, image='bench.jpg',
+                address='bench', opening_hours='', category='自然风光类', is_hot=True,
+            )
+            for i in range(12)
+        ]
+        for i, spot in enumerate(spots[:5]):
+            Carousel.objects.create(scenic_spot=spot, image='bench.jpg', order=i)
+        for i in range(8):
+            News.objects.create(title=f'首页压测公告{run_id}-{i}', content='bench ' * 40, is_announcement=True)
+            News.objects.create(title=f'首页压测资讯{run_id}-{i}', content='bench ' * 40)
+
+    def _measure(self, client, url, count):
+        timings = []
+        queries = set()
+        started = time.perf_counter()
+        for _ in range(count):
+            request_started = time.perf_counter()
+            with CaptureQueriesContext(connection) as context:
+                response = client.get(url)
+            timings.append((time.perf_counter() - request_started) * 1000)
+            queries.add(len(context.captured_queries))
+            if response.status_code != 200:
+                raise CommandError(f'Homepage returned {response.status_code}')
+        return count / (time.perf_counter() - started), timings, queries
+
+    def handle(self, *args, **options):
+        if options['requests'] <= 0:
+            raise CommandError('--requests must be positive')
+        run_id = uuid.uuid4().hex[:8]
+        url = reverse('ticket:index')
+        try:
+            self._seed(run_id)
+            with override_settings(ALLOWED_HOSTS=['testserver']):
+                client = Client()
+                with override_settings(CACHES=DUMMY_CACHES):
+                    client.get(url)
+                    uncached = self._measure(client, url, options['requests'])
+                # 第一次请求写入片段缓存
+                client.get(url)
+                cached = self._measure(client, url, options['requests'])
+        finally:
+            ScenicSpot.objects.filter(name__startswith=f'首页压测景点{run_id}-').delete()
+            News.objects.filter(title__startswith='首页压测', title__contains=run_id).delete()
+
+        self.stdout.write(f"{'mode':<10} {'req/s':>9} {'p50':>10} {'p99':>10}  queries")
+        for name, (throughput, timings, queries) in (('uncached', uncached), ('cached', cached)):
+            self.stdout.write(
+                f'{name:<10} {throughput:>9.0f} {_percentile(timings, 50):>8.2f}ms '
+                f'{_percentile(timings, 99):>8.2f}ms  ' + ','.join(str(count) for count in sorted(queries))
+            )
+
+        speedup = cached[0] / uncached[0]
+        if speedup < options['min_speedup']:
+            raise CommandError(f"Cached homepage is only {speedup:.1f}x faster (< {options['min_speedup']}x)")
+        self.stdout.write(self.style.SUCCESS(f'Cached homepage throughput is {speedup:.1f}x higher'))
@@ -0,0 +1,81 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from ticket import idempotency
+from ticket.models import User
+
+
+def _percentile(values, percent):
+    # 最近秩法计算百分位数
+    ordered = sorted(values)
+    index = max(int(round(percent / 100 * len(ordered))) - 1, 0)
+    return ordered[min(index, len(ordered) - 1)]
+
+
+class Command(BaseCommand):
+    help = 'Measure the per-request cost of idempotency key handling on the order creation path'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=2000, help='Number of simulated order requests')
+        parser.add_argument('--budget-ms', type=float, default=1.0, help='Fail if the p50 overhead exceeds this many milliseconds')
+
+    def _timed(self, func, iterations):
+        # 返回每次调用的耗时（毫秒）
+        timings = []
+        for i in range(iterations):
+            started = time.perf_counter()
+            func(i)
+            timings.append((time.perf_counter() - started) * 1000)
+        return timings
+
+    def handle(self, *args, **options):
+        iterations = options['iterations']
+        user = User.objects.create_user(username='idempotency-bench', email='idempotency-bench@example.com', password=None)
+        run_id = idempotency.new_key()[:8]
+        try:
+            def order_write():
+                # 代替下单事务中的写操作，使两种情况都包含一次真实的提交
+                User.objects.filter(id=user.id).update(last_login=timezone.now())
+
+            def baseline(i):
+                # 只有下单事务本身，不做幂等处理
+                with transaction.atomic():
+                    order_write()
+
+            def first_request(i):
+                # 第一次提交：在同一事务中登记幂等键并写回订单ID
+                with transaction.atomic():
+                    record, created = idempotency.claim(user, f'bench-{run_id}-{i}', 'bench')
+                    order_write()
+                    idempotency.complete(record, [i])
+
+            def replay(i):
+                # 重复提交：唯一约束冲突后读取原订单
+                with transaction.atomic():
+                    record, created = idempotency.claim(user, f'bench-{run_id}-{i}', 'bench')
+                if created:
+                    raise CommandError(f'Replay of key {i} created a new record')
+
+            results = {
+                'baseline': self._timed(baseline, iterations),
+                'first request': self._timed(first_request, iterations),
+                'replay': self._timed(replay, iterations),
+            }
+        finally:
+            user.delete()
+
+        baseline_p50 = _percentile(results['baseline'], 50)
+        for name, timings in results.items():
+            self.stdout.write(
+                f'{name:<14} p50={_percentile(timings, 50):.3f}ms p99={_percentile(timings, 99):.3f}ms '
+                f'mean={sum(timings) / len(timings):.3f}ms'
+            )
+
+        overhead = _percentile(results['first request'], 50) - baseline_p50
+        self.stdout.write(f'Idempotency overhead on the hot path (p50): {overhead:.3f}ms')
+        if overhead > options['budget_ms']:
+            raise CommandError(f"Overhead {overhead:.3f}ms exceeds budget {options['budget_ms']}ms")
+        self.stdout.write(self.style.SUCCESS('Idempotency key handling is within budget'))
@@ -0,0 +1,102 @@
+import multiprocessing
+import threading
+import time
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from ticket import inventory
+from ticket.models import DateStock, ScenicSpot, TicketType
+
+
+def _buy_worker(ticket_type_id, use_date, attempts, quantity):
+    # 每个线程/进程独立重复下单，返回成功预占的次数
+    ticket_type = TicketType.objects.get(id=ticket_type_id)
+    success = 0
+    try:
+        for _ in range(attempts):
+            try:
+                inventory.reserve_stock(ticket_type, use_date, quantity)
+                success += 1
+            except inventory.InsufficientStockError:
+                pass
+    finally:
+        # 线程结束时关闭该线程自己的数据库连接
+        connections.close_all()
+    return success
+
+
+def _process_worker(args):
+    ticket_type_id, use_date, threads, attempts, quantity = args
+    results = []
+    workers = [
+        threading.Thread(target=lambda: results.append(_buy_worker(ticket_type_id, use_date, attempts, quantity)))
+        for _ in range(threads)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return sum(results)
+
+
+class Command(BaseCommand):
+    help = 'Benchmark concurrent DateStock reservations on one (ticket_type, use_date) row and verify zero oversell'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--stock', type=int, default=1000, help='Initial stock of the benchmark row')
+        parser.add_argument('--processes', type=int, default=4, help='Number of worker processes')
+        parser.add_argument('--threads', type=int, default=8, help='Number of threads per process')
+        parser.add_argument('--attempts', type=int, default=50, help='Purchase attempts per thread')
+        parser.add_argument('--quantity', type=int, default=1, help='Tickets per purchase attempt')
+
+    def handle(self, *args, **options):
+        stock = options['stock']
+        processes = options['processes']
+        threads = options['threads']
+        attempts = options['attempts']
+        quantity = options['quantity']
+
+        # 创建临时景点和门票类型，压测结束后删除
+        spot = ScenicSpot.objects.create(
+            name='库存压测景点', description='bench', price=0, image='bench.jpg',
+            address='bench', opening_hours='',
+        )
+        try:
+            ticket_type = TicketType.objects.create(scenic_spot=spot, name='压测门票', price=0, stock=stock)
+            use_date = date.today() + timedelta(days=1)
+            inventory.ensure_date_stock(ticket_type, use_date)
+
+            total_attempts = processes * threads * attempts
+            self.stdout.write(
+                f'Hammering ticket_type={ticket_type.id} use_date={use_date} stock={stock} with '
+                f'{processes} processes x {threads} threads x {attempts} attempts (qty={quantity})'
+            )
+
+            # fork前关闭连接，避免子进程共享父进程的数据库连接
+            connections.close_all()
+            started = time.perf_counter()
+            job = (ticket_type.id, use_date, threads, attempts, quantity)
+            if processes > 1:
+                with multiprocessing.get_context('fork').Pool(processes) as pool:
+                    sold = sum(pool.map(_process_worker, [job] * processes))
+            else:
+                sold = _process_worker(job)
+            elapsed = time.perf_counter() - started
+
+            row = DateStock.objects.get(ticket_type=ticket_type, use_date=use_date)
+            expected = min(stock // quantity, total_attempts)
+            self.stdout.write(f'Attempts:       {total_attempts}')
+            self.stdout.write(f'Successful:     {sold}')
+            self.stdout.write(f'Remaining:      {row.stock}')
+            self.stdout.write(f'Elapsed:        {elapsed:.3f}s')
+            self.stdout.write(f'Throughput:     {total_attempts / elapsed:.1f} attempts/s')
+
+            if row.stock < 0 or sold * quantity + row.stock != stock:
+                raise CommandError(f'Oversell detected: sold {sold * quantity}, remaining {row.stock}, initial {stock}')
+            if sold != expected:
+                raise CommandError(f'Expected {expected} successful reservations, got {sold}')
+            self.stdout.write(self.style.SUCCESS('No oversell detected'))
+        finally:
+            spot.delete()
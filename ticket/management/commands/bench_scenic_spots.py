@@ -0,0 +1,140 @@
+import time
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+from ticket.models import Region, ScenicSpot, ScenicSpotTag, Tag
+
+
+def _percentile(values, percent):
+    # 最近秩法计算百分位数
+    ordered = sorted(values)
+    index = max(int(round(percent / 100 * len(ordered))) - 1, 0)
+    return ordered[min(index, len(ordered) - 1)]
+
+
+class Command(BaseCommand):
+    help = 'Measure scenic_spots page latency on first, middle and last pages of a large spot table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--spots', type=int, default=100000, help='Scenic spots to seed')
+        parser.add_argument('--repeat', type=int, default=20, help='Requests per page')
+        parser.add_argument(
+            '--max-ratio', type=float, default=3.0,
+            help='Fail if the slowest page p50 exceeds the first page p50 by this factor',
+        )
+
+    def _seed(self, run_id, count):
+        # 批量创建景点，部分景点带地区和分类，便于测试筛选条件
+        region = Region.objects.create(name=f'压测地区{run_id}')
+        categories = ['自然风光类', '历史文化类', '主题乐园类']
+        batch = []
+        for i in range(count):
+            batch.append(ScenicSpot(
+                name=f'列表压测景点{run_id}-{i}', description='bench', price=10, image='bench.jpg',
+                address=f'压测地址{i % 100}', opening_hours='',
+                category=categories[i % len(categories)], region=region if i % 2 else None,
+            ))
+            if len(batch) == 5000:
+                ScenicSpot.objects.bulk_create(batch)
+                batch = []
+        ScenicSpot.objects.bulk_create(batch)
+
+        # 每个景点带两到三个标签，其中一个标签只有十分之一的景点使用，用于测试标签筛选
+        Tag.objects.bulk_create([Tag(name=f'压测标签{run_id}-{n}') for n in range(3)])
+        tags = list(Tag.objects.filter(name__startswith=f'压测标签{run_id}-').order_by('name'))
+        spot_ids = ScenicSpot.objects.filter(name__startswith=f'列表压测景点{run_id}-').values_list('id', flat=True)
+        links = []
+        for i, spot_id in enumerate(spot_ids.iterator()):
+            spot_tags = tags if i % 10 == 0 else tags[:2]
+            links.extend(
+                ScenicSpotTag(scenic_spot_id=spot_id, tag=tag, position=position)
+                for position, tag in enumerate(spot_tags)
+            )
+            if len(links) >= 5000:
+                ScenicSpotTag.objects.bulk_create(links)
+                links = []
+        ScenicSpotTag.objects.bulk_create(links)
+        return region
+
+    def _measure(self, client, url, params, repeat):
+        # 返回(每次请求的耗时列表, 查询次数集合)
+        timings = []
+        queries = set()
+        for _ in range(repeat):
+            with CaptureQueriesContext(connection) as context:
+                started = time.perf_counter()
+                response = client.get(url, params)
+                timings.append((time.perf_counter() - started) * 1000)
+            if response.status_code != 200:
+                raise CommandError(f'{params} returned HTTP {response.status_code}')
+            queries.add(len(context.captured_queries))
+        return timings, queries
+
+    def handle(self, *args, **options):
+        if options['spots'] <= 0 or options['repeat'] <= 0:
+            raise CommandError('--spots and --repeat must be positive')
+        run_id = uuid.uuid4().hex[:8]
+        url = reverse('ticket:scenic_spots')
+        self.stdout.write(f"Seeding {options['spots']} scenic spots ...")
+        region = None
+        try:
+            region = self._seed(run_id, options['spots'])
+            ids = ScenicSpot.objects.order_by('id').values_list('id', flat=True)
+            num_pages = (ids.count() + 8) // 9
+            pages = sorted({1, 10, 100, num_pages // 2, num_pages} - {0})
+            # 不带筛选条件的页码跳转，以及上一页/下一页链接（带相邻页首尾景点的ID），用于比较不同页的耗时
+            scenarios = [(f'page {page}', {'page': page}) for page in pages]
+            scenarios += [
+                (f'next to page {page}', {'page': page, 'after': ids[(page - 1) * 9 - 1]})
+                for page in pages if page > 1
+            ]
+            scenarios += [
+                (f'previous to page {page}', {'page': page, 'before': ids[page * 9]})
+                for page in pages if page < num_pages
+            ]
+            paging_scenarios = len(scenarios)
+            # 带筛选条件的查询只报告耗时
+            scenarios += [
+                ('category, last page', {'category': '历史文化类', 'page': 'last'}),
+                ('tag, last page', {'tag': f'压测标签{run_id}-2', 'page': 'last'}),
+                ('search, first page', {'search': f'列表压测景点{run_id}-1'}),
+                ('search region, last page', {'search': f'压测地区{run_id}', 'page': 'last'}),
+            ]
+
+            results = []
+            with override_settings(ALLOWED_HOSTS=['testserver']):
+                client = Client()
+                for name, params in scenarios:
+                    if params.get('page') == 'last':
+                        # 超出范围的页码回退到最后一页
+                        params = {**params, 'page': 10 ** 9}
+                    timings, queries = self._measure(client, url, params, options['repeat'])
+                    results.append((name, timings, queries))
+        finally:
+            ScenicSpot.objects.filter(name__startswith=f'列表压测景点{run_id}-').delete()
+            Tag.objects.filter(name__startswith=f'压测标签{run_id}-').delete()
+            if region is not None:
+                region.delete()
+
+        self.stdout.write(f"{'scenario':<28} {'p50':>10} {'p99':>10}  queries")
+        for name, timings, queries in results:
+            self.stdout.write(
+                f'{name:<28} {_percentile(timings, 50):>8.2f}ms '
+                f'{_percentile(timings, 99):>8.2f}ms  ' + ','.join(str(count) for count in sorted(queries))
+            )
+
+        # 搜索结果为空时不再读取景点，带筛选条件的查询不参与查询次数的比较
+        query_counts = {count for _, _, queries in results[:paging_scenarios] for count in queries}
+        if len(query_counts) != 1:
+            raise CommandError(f'Query count depends on the page: {sorted(query_counts)}')
+        page_p50 = [_percentile(timings, 50) for _, timings, _ in results[:paging_scenarios]]
+        ratio = max(page_p50) / page_p50[0]
+        self.stdout.write(f'Slowest page / first page (p50): {ratio:.2f}x')
+        if ratio > options['max_ratio']:
+            raise CommandError(f"Page latency grows with the page number ({ratio:.2f}x > {options['max_ratio']}x)")
+        self.stdout.write(self.style.SUCCESS(f'Page latency is flat with {query_counts.pop()} queries per page'))
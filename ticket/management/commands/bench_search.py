@@ -0,0 +1,112 @@
+import random
+import time
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ticket import search
+from ticket.models import SearchEntry
+
+# 生成景点名称和地址用的常见汉字，前面的字出现得更频繁
+CHARACTERS = (
+    '山水湖公园古城寺庙博物馆景区国家森林湿地峡谷温泉海滩岛乐园故宫长城西北京上南天津河江省市县镇村'
+    '龙凤云龙泉石桥塔楼阁亭台花鸟鱼竹梅兰松柏黄金银玉清明月星光东中华大小新老红白青绿'
+)
+
+
+def _percentile(values, percent):
+    # 最近秩法计算百分位数
+    ordered = sorted(values)
+    index = max(int(round(percent / 100 * len(ordered))) - 1, 0)
+    return ordered[min(index, len(ordered) - 1)]
+
+
+class Command(BaseCommand):
+    help = 'Build a synthetic search index and measure ranked search and paged listing latency'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--docs', type=int, default=100000, help='Documents in the synthetic corpus')
+        parser.add_argument('--queries', type=int, default=200, help='Search queries to run')
+        parser.add_argument('--limit', type=int, default=10, help='Results per query')
+        parser.add_argument('--budget-ms', type=float, default=10.0, help='Fail if the p50 latency exceeds this')
+        parser.add_argument('--seed', type=int, default=1, help='Random seed')
+
+    def _text(self, rng, low, high):
+        # 按递减的权重随机选字，模拟真实文本中常见字和少见字的分布
+        return ''.join(
+            rng.choices(CHARACTERS, weights=range(len(CHARACTERS), 0, -1), k=rng.randint(low, high))
+        )
+
+    def _build(self, rng, doc_type, count):
+        # 分批写入索引，返回部分文档的名称用于生成搜索词
+        names = []
+        batch = {}
+        for object_id in range(1, count + 1):
+            name = self._text(rng, 4, 6)
+            batch[object_id] = [(name, 3), (self._text(rng, 6, 10), 1)]
+            if object_id % 100 == 0:
+                names.append(name)
+            if len(batch) == 2000:
+                search.index_documents(doc_type, batch)
+                batch = {}
+        search.index_documents(doc_type, batch)
+        return names
+
+    def handle(self, *args, **options):
+        if options['docs'] <= 0 or options['queries'] <= 0:
+            raise CommandError('--docs and --queries must be positive')
+        rng = random.Random(options['seed'])
+        doc_type = f'bench{uuid.uuid4().hex[:8]}'
+        try:
+            started = time.perf_counter()
+            names = self._build(rng, doc_type, options['docs'])
+            entries = SearchEntry.objects.filter(doc_type=doc_type).count()
+            self.stdout.write(
+                f"Indexed {options['docs']} documents ({entries} entries) in {time.perf_counter() - started:.1f}s"
+            )
+
+            # 搜索词：单字、文档名称中的两字到四字片段
+            queries = {'single character': [], 'two characters': [], 'three to four characters': []}
+            for _ in range(options['queries']):
+                name = rng.choice(names)
+                queries['single character'].append(rng.choice(name))
+                start = rng.randint(0, len(name) - 2)
+                queries['two characters'].append(name[start:start + 2])
+                start = rng.randint(0, len(name) - 3)
+                queries['three to four characters'].append(name[start:start + rng.randint(3, 4)])
+
+            results = {}
+            for kind, texts in queries.items():
+                timings = []
+                page_timings = []
+                hits = 0
+                for text in texts:
+                    query_started = time.perf_counter()
+                    ids = search.search(doc_type, text, limit=options['limit'])
+                    timings.append((time.perf_counter() - query_started) * 1000)
+                    hits += bool(ids)
+                    # 列表页：统计全部命中数用于分页，再取第一页
+                    query_started = time.perf_counter()
+                    ranked = search.ranked(doc_type, text)
+                    ranked.count()
+                    list(ranked[:options['limit']])
+                    page_timings.append((time.perf_counter() - query_started) * 1000)
+                results[kind] = (timings, page_timings, hits)
+        finally:
+            SearchEntry.objects.filter(doc_type=doc_type).delete()
+
+        self.stdout.write(
+            f"{'query':<26} {'p50':>10} {'p99':>10} {'page p50':>10} {'page p99':>10}  with results"
+        )
+        for kind, (timings, page_timings, hits) in results.items():
+            self.stdout.write(
+                f'{kind:<26} {_percentile(timings, 50):>8.2f}ms {_percentile(timings, 99):>8.2f}ms '
+                f'{_percentile(page_timings, 50):>8.2f}ms {_percentile(page_timings, 99):>8.2f}ms  '
+                f'{hits}/{len(timings)}'
+            )
+        self.stdout.write('page: count all matches for the paginator, then read the first page')
+
+        p50 = _percentile([timing for timings, _, _ in results.values() for timing in timings], 50)
+        if p50 > options['budget_ms']:
+            raise CommandError(f"Search p50 {p50:.2f}ms exceeds budget {options['budget_ms']}ms")
+        self.stdout.write(self.style.SUCCESS(f'Search p50 {p50:.2f}ms is within budget'))
@@ -0,0 +1,98 @@
+import time
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+from ticket import spot_detail, tags
+from ticket.models import ScenicSpot, ScenicSpotComment, User
+
+# 不缓存任何内容的缓存后端，用于测量未缓存时的详情页耗时
+DUMMY_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+
+
+def _percentile(values, percent):
+    # 最近秩法计算百分位数
+    ordered = sorted(values)
+    index = max(int(round(percent / 100 * len(ordered))) - 1, 0)
+    return ordered[min(index, len(ordered) - 1)]
+
+
+class Command(BaseCommand):
+    help = 'Measure scenic_spot_detail latency with and without the object cache'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--comments', type=int, default=200, help='Comments on the benchmark spot')
+        parser.add_argument('--requests', type=int, default=300, help='Detail page requests per mode')
+        parser.add_argument('--min-speedup', type=float, default=3.0, help='Fail if the cached p50 gains less')
+
+    def _seed(self, run_id, count):
+        spot = ScenicSpot.objects.create(
+            name=f'详情压测景点{run_id}', description='bench ' * 100, price=10, image='bench.jpg',
+            address='bench', opening_hours='', category='自然风光类',
+        )
+        tags.set_spot_tags(spot, [f'详情压测标签{run_id}-{i}' for i in range(5)])
+        User.objects.bulk_create([
+            User(username=f'detail_bench_{run_id}_{i}', email=f'detail_bench_{run_id}_{i}@example.com')
+            for i in range(20)
+        ])
+        users = list(User.objects.filter(username__startswith=f'detail_bench_{run_id}_'))
+        ScenicSpotComment.objects.bulk_create([
+            ScenicSpotComment(
+                scenic_spot=spot, user=users[i % len(users)], content=f'bench comment {i}',
+                reply='thanks' if i % 3 == 0 else None, is_replied=i % 3 == 0,
+            )
+            for i in range(count)
+        ])
+        return spot
+
+    def _measure(self, client, url, count):
+        timings = []
+        queries = set()
+        for _ in range(count):
+            started = time.perf_counter()
+            with CaptureQueriesContext(connection) as context:
+                response = client.get(url)
+            timings.append((time.perf_counter() - started) * 1000)
+            queries.add(len(context.captured_queries))
+            if response.status_code != 200:
+                raise CommandError(f'Detail page returned {response.status_code}')
+        return timings, queries
+
+    def handle(self, *args, **options):
+        if options['comments'] < 0 or options['requests'] <= 0:
+            raise CommandError('--comments must not be negative and --requests must be positive')
+        run_id = uuid.uuid4().hex[:8]
+        try:
+            spot = self._seed(run_id, options['comments'])
+            url = reverse('ticket:scenic_spot_detail', kwargs={'spot_id': spot.id})
+            with override_settings(ALLOWED_HOSTS=['testserver']):
+                client = Client()
+                with override_settings(CACHES=DUMMY_CACHES):
+                    client.get(url)
+                    uncached = self._measure(client, url, options['requests'])
+                spot_detail.reset_stats()
+                cached = self._measure(client, url, options['requests'])
+                stats = spot_detail.get_stats()
+        finally:
+            ScenicSpot.objects.filter(name=f'详情压测景点{run_id}').delete()
+            User.objects.filter(username__startswith=f'detail_bench_{run_id}_').delete()
+            tags.remove_tags([f'详情压测标签{run_id}-{i}' for i in range(5)])
+
+        self.stdout.write(f"{'mode':<10} {'p50':>10} {'p99':>10}  queries")
+        for name, (timings, queries) in (('uncached', uncached), ('cached', cached)):
+            self.stdout.write(
+                f'{name:<10} {_percentile(timings, 50):>8.2f}ms {_percentile(timings, 99):>8.2f}ms  '
+                + ','.join(str(count) for count in sorted(queries))
+            )
+        self.stdout.write(
+            f"Cache hits {stats['hits']}, misses {stats['misses']}, hit rate {stats['hit_rate']:.1%}"
+        )
+
+        speedup = _percentile(uncached[0], 50) / _percentile(cached[0], 50)
+        if speedup < options['min_speedup']:
+            raise CommandError(f"Cached detail page is only {speedup:.1f}x faster (< {options['min_speedup']}x)")
+        self.stdout.write(self.style.SUCCESS(f'Cached detail page p50 is {speedup:.1f}x faster'))
@@ -0,0 +1,119 @@
+import multiprocessing
+import threading
+import time
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from ticket import inventory
+from ticket.models import ScenicSpot, TicketType
+
+
+def _percentile(values, percent):
+    # 最近秩法计算百分位数
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(int(round(percent / 100 * len(ordered))) - 1, 0)
+    return ordered[min(index, len(ordered) - 1)]
+
+
+def _buy_worker(ticket_type_id, use_date, attempts, latencies):
+    # 每个线程重复下单，记录每次预占的耗时（毫秒）
+    ticket_type = TicketType.objects.get(id=ticket_type_id)
+    success = 0
+    try:
+        for _ in range(attempts):
+            started = time.perf_counter()
+            try:
+                inventory.reserve_stock(ticket_type, use_date, 1)
+                success += 1
+            except inventory.InsufficientStockError:
+                pass
+            latencies.append((time.perf_counter() - started) * 1000)
+    finally:
+        # 线程结束时关闭该线程自己的数据库连接
+        connections.close_all()
+    return success
+
+
+def _process_worker(args):
+    ticket_type_id, use_date, threads, attempts = args
+    latencies = []
+    results = []
+    workers = [
+        threading.Thread(target=lambda: results.append(_buy_worker(ticket_type_id, use_date, attempts, latencies)))
+        for _ in range(threads)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return sum(results), latencies
+
+
+class Command(BaseCommand):
+    help = 'Compare reservation latency (p50/p99) of single-row and sharded DateStock under concurrency'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--stock', type=int, default=5000, help='Initial stock of the benchmark date')
+        parser.add_argument('--shards', type=int, default=8, help='Shard count for the sharded round')
+        parser.add_argument('--processes', type=int, default=4, help='Number of worker processes')
+        parser.add_argument('--threads', type=int, default=8, help='Number of threads per process')
+        parser.add_argument('--attempts', type=int, default=50, help='Purchase attempts per thread')
+
+    def _run_round(self, spot, shards, options):
+        stock = options['stock']
+        processes = options['processes']
+        ticket_type = TicketType.objects.create(
+            scenic_spot=spot, name=f'压测门票-{shards}分片', price=0, stock=stock, stock_shards=shards,
+        )
+        use_date = date.today() + timedelta(days=1)
+        inventory.ensure_date_stock(ticket_type, use_date)
+
+        # fork前关闭连接，避免子进程共享父进程的数据库连接
+        connections.close_all()
+        job = (ticket_type.id, use_date, options['threads'], options['attempts'])
+        started = time.perf_counter()
+        if processes > 1:
+            with multiprocessing.get_context('fork').Pool(processes) as pool:
+                results = pool.map(_process_worker, [job] * processes)
+        else:
+            results = [_process_worker(job)]
+        elapsed = time.perf_counter() - started
+
+        sold = sum(result[0] for result in results)
+        latencies = [latency for result in results for latency in result[1]]
+        remaining = inventory.get_available_stock(ticket_type, use_date)
+        if remaining < 0 or sold + remaining != stock:
+            raise CommandError(f'Oversell detected with {shards} shard(s): sold {sold}, remaining {remaining}, initial {stock}')
+
+        self.stdout.write(
+            f'shards={shards:<3} sold={sold:<6} remaining={remaining:<6} '
+            f'p50={_percentile(latencies, 50):.2f}ms p99={_percentile(latencies, 99):.2f}ms '
+            f'throughput={len(latencies) / elapsed:.1f} attempts/s'
+        )
+        return _percentile(latencies, 99)
+
+    def handle(self, *args, **options):
+        if options['shards'] < 2:
+            raise CommandError('--shards must be at least 2 to compare with single-row mode')
+
+        self.stdout.write(
+            f"{options['processes']} processes x {options['threads']} threads x {options['attempts']} attempts, "
+            f"stock={options['stock']}"
+        )
+        # 创建临时景点，压测结束后删除（门票类型和库存级联删除）
+        spot = ScenicSpot.objects.create(
+            name='库存分片压测景点', description='bench', price=0, image='bench.jpg',
+            address='bench', opening_hours='',
+        )
+        try:
+            single_p99 = self._run_round(spot, 1, options)
+            sharded_p99 = self._run_round(spot, options['shards'], options)
+        finally:
+            spot.delete()
+
+        if sharded_p99:
+            self.stdout.write(self.style.SUCCESS(f'p99 speedup with sharding: {single_p99 / sharded_p99:.2f}x'))
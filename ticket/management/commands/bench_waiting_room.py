@@ -0,0 +1,169 @@
+import math
+import threading
+import time
+from collections import defaultdict
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test.utils import override_settings
+
+from ticket import inventory, waiting_room
+from ticket.models import ScenicSpot, TicketType
+
+
+class QueryCounter:
+    # 按压测开始后的秒数统计数据库查询次数，供各线程的execute_wrapper共享
+    def __init__(self, started):
+        self.started = started
+        self.lock = threading.Lock()
+        self.buckets = defaultdict(int)
+
+    def __call__(self, execute, sql, params, many, context):
+        second = int(time.perf_counter() - self.started)
+        with self.lock:
+            self.buckets[second] += 1
+        return execute(sql, params, many, context)
+
+
+def _purchase(ticket_types, use_date):
+    # 模拟一次购票流程：读取各门票类型库存后预占一张
+    for ticket_type in ticket_types:
+        inventory.get_available_stock(ticket_type, use_date)
+    inventory.reserve_stock(ticket_types[0], use_date, 1)
+
+
+def _user(user_id, spot_id, ticket_types, use_date, use_queue, counters, poll_seconds, results):
+    queue_counter, purchase_counter = counters
+    arrived = time.time()
+    try:
+        if use_queue:
+            # 领取排队令牌（只有这一步访问排队后端），之后的轮询只校验令牌不访问数据库
+            with connection.execute_wrapper(queue_counter):
+                token, admit_at = waiting_room.issue_token(spot_id, user_id)
+            token_data = waiting_room.read_token(token, spot_id)
+            while not waiting_room.get_status(token_data, spot_id)['admitted']:
+                time.sleep(min(poll_seconds, max(admit_at - time.time(), 0.01)))
+        results['waits'].append(time.time() - arrived)
+        with connection.execute_wrapper(purchase_counter):
+            _purchase(ticket_types, use_date)
+    except Exception as e:
+        # 记录失败的用户（如数据库锁等待超时），不中断压测
+        results['errors'].append(str(e))
+    finally:
+        # 线程结束时关闭该线程自己的数据库连接
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = 'Load test buy_ticket admission control: compare DB QPS with and without the waiting room under a 10x burst'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rate', type=float, default=20, help='Admission rate (users/second) for the benchmark spot')
+        parser.add_argument('--baseline-seconds', type=int, default=2, help='Seconds of normal traffic before the burst')
+        parser.add_argument('--burst-seconds', type=int, default=1, help='Seconds of burst traffic')
+        parser.add_argument('--burst-multiplier', type=int, default=10, help='Burst arrival rate as a multiple of --rate')
+        parser.add_argument('--backend', help='Queue backend path, defaults to WAITING_ROOM["BACKEND"]')
+        parser.add_argument('--poll-seconds', type=float, default=0.5, help='Polling interval of queued users')
+        parser.add_argument(
+            '--tolerance', type=float, default=1.5,
+            help='Fail if queued purchase QPS in any second exceeds rate x queries per purchase x this factor',
+        )
+
+    def _run(self, spot, ticket_types, use_date, use_queue, options):
+        rate = options['rate']
+        # 到达计划：先按放行速率到达，随后突发放大burst_multiplier倍
+        arrivals = []
+        for second in range(options['baseline_seconds']):
+            arrivals += [second + i / rate for i in range(int(rate))]
+        burst_rate = rate * options['burst_multiplier']
+        for second in range(options['burst_seconds']):
+            offset = options['baseline_seconds'] + second
+            arrivals += [offset + i / burst_rate for i in range(int(burst_rate))]
+
+        waiting_room.get_backend().reset(spot.id)
+        started = time.perf_counter()
+        counters = (QueryCounter(started), QueryCounter(started))
+        results = {'waits': [], 'errors': []}
+        threads = []
+        for user_id, arrival in enumerate(arrivals, start=1):
+            delay = arrival - (time.perf_counter() - started)
+            if delay > 0:
+                time.sleep(delay)
+            thread = threading.Thread(
+                target=_user,
+                args=(user_id, spot.id, ticket_types, use_date, use_queue, counters, options['poll_seconds'], results),
+            )
+            thread.start()
+            threads.append(thread)
+        for thread in threads:
+            thread.join()
+        results['users'] = len(arrivals)
+        results['queue_qps'] = counters[0].buckets
+        results['purchase_qps'] = counters[1].buckets
+        return results
+
+    def handle(self, *args, **options):
+        config = waiting_room.get_config()
+        if options['backend']:
+            config['BACKEND'] = options['backend']
+        self.stdout.write(f"Backend: {config['BACKEND']}, rate: {options['rate']}/s")
+
+        # 创建临时景点和门票类型，压测结束后删除
+        spot = ScenicSpot.objects.create(
+            name='排队压测景点', description='bench', price=0, image='bench.jpg',
+            address='bench', opening_hours='',
+        )
+        try:
+            ticket_types = [
+                TicketType.objects.create(scenic_spot=spot, name=f'压测门票{i}', price=0, stock=100000)
+                for i in range(3)
+            ]
+            use_date = date.today() + timedelta(days=1)
+            inventory.ensure_date_stock(ticket_types[0], use_date)
+
+            # 压测景点使用指定的放行速率
+            config['SPOT_RATES'] = {**config['SPOT_RATES'], spot.id: options['rate']}
+            runs = {}
+            with override_settings(WAITING_ROOM=config):
+                for label, use_queue in (('direct', False), ('queued', True)):
+                    self.stdout.write(f'Running {label} ...')
+                    runs[label] = self._run(spot, ticket_types, use_date, use_queue, options)
+        finally:
+            spot.delete()
+
+        # 按秒输出两种模式购票流程的数据库查询次数，以及排队后端自身的查询次数
+        direct, queued = runs['direct'], runs['queued']
+        seconds = max(list(direct['purchase_qps']) + list(queued['purchase_qps']) + [0]) + 1
+        self.stdout.write(f"{'second':>6} {'direct QPS':>11} {'queued QPS':>11} {'queue backend QPS':>18}")
+        for second in range(seconds):
+            self.stdout.write(
+                f"{second:>6} {direct['purchase_qps'].get(second, 0):>11} "
+                f"{queued['purchase_qps'].get(second, 0):>11} {queued['queue_qps'].get(second, 0):>18}"
+            )
+
+        for label, result in runs.items():
+            values = [result['purchase_qps'].get(second, 0) for second in range(seconds)]
+            self.stdout.write(
+                f"{label:>6}: users={result['users']} errors={len(result['errors'])} "
+                f"peak purchase QPS={max(values)} max wait={max(result['waits'] or [0]):.1f}s"
+            )
+
+        failures = [f'{label}: {error}' for label, result in runs.items() for error in result['errors'][:3]]
+        if failures:
+            raise CommandError('Purchases failed: ' + '; '.join(failures))
+        # 排队后端不能访问数据库，否则突发流量只是从购票查询转移到了排队查询
+        queue_queries = sum(queued['queue_qps'].values())
+        if queue_queries:
+            raise CommandError(f'Queue backend ran {queue_queries} DB queries; admission state must stay out of the DB')
+        # 放行后每秒的购票查询数不能超过 放行速率 × 每次购票的查询数（允许窗口边界的误差）
+        per_purchase = sum(direct['purchase_qps'].values()) / direct['users']
+        limit = math.ceil(options['rate'] * per_purchase * options['tolerance'])
+        peak = max(queued['purchase_qps'].values())
+        if peak > limit:
+            raise CommandError(f'Queued purchase QPS peaked at {peak} (> {limit}) during the burst')
+        direct_peak = max(direct['purchase_qps'].values())
+        self.stdout.write(self.style.SUCCESS(
+            f'Queued DB QPS stayed at or below {limit} (peak {peak}, direct peak {direct_peak}) '
+            f"under a {options['burst_multiplier']}x burst"
+        ))
@@ -0,0 +1,200 @@
+import json
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from ticket import weather_api
+
+
+def _percentile(values, percent):
+    # 最近秩法计算百分位数
+    ordered = sorted(values)
+    index = max(int(round(percent / 100 * len(ordered))) - 1, 0)
+    return ordered[min(index, len(ordered) - 1)]
+
+
+class FakeWeatherServer:
+    """
+    本地模拟的天气API，返回与OpenWeatherMap相同格式的数据
+
+    Args:
+        delay: 每次响应前等待的时间（秒）
+    """
+
+    def __init__(self, delay):
+        self.delay = delay
+        # 'ok'返回天气数据，'error'返回500
+        self.mode = 'ok'
+        self.calls = 0
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                with server._lock:
+                    server.calls += 1
+                time.sleep(server.delay)
+                if server.mode == 'error':
+                    self.send_response(500)
+                    self.end_headers()
+                    return
+                body = json.dumps({
+                    'cod': 200,
+                    'main': {'temp_min': 3, 'temp_max': 12, 'humidity': 40},
+                    'weather': [{'description': '晴'}],
+                    'wind': {'deg': 90, 'speed': 3},
+                }).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.httpd.daemon_threads = True
+        self.url = f'http://127.0.0.1:{self.httpd.server_port}/weather'
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def reset(self, mode='ok', delay=None):
+        self.mode = mode
+        if delay is not None:
+            self.delay = delay
+        with self._lock:
+            self.calls = 0
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class Command(BaseCommand):
+    help = 'Check the weather lookup cache against a local fake weather API: coalescing, TTL, stale-while-revalidate and negative caching'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=20, help='Concurrent lookups for one cold key')
+        parser.add_argument('--requests', type=int, default=500, help='Cached lookups to time')
+        parser.add_argument('--delay', type=float, default=0.2, help='Fake upstream response time in seconds')
+
+    def _lookup(self, region):
+        started = time.perf_counter()
+        result = weather_api.get_weather_by_region(region, date.today())
+        return result, (time.perf_counter() - started) * 1000
+
+    def _expect_calls(self, server, expected, what):
+        if server.calls != expected:
+            raise CommandError(f'{what}: expected {expected} upstream call(s), got {server.calls}')
+
+    def _wait_for_calls(self, server, expected, timeout):
+        deadline = time.time() + timeout
+        while server.calls < expected and time.time() < deadline:
+            time.sleep(0.01)
+
+    def _check(self, server, run_id, options):
+        delay = options['delay']
+        config = weather_api.get_config()
+        lines = []
+
+        # 冷启动：并发查询同一个键只请求一次上游
+        region = f'压测城市{run_id}-1'
+        with ThreadPoolExecutor(options['concurrency']) as pool:
+            results = list(pool.map(lambda _: self._lookup(region), range(options['concurrency'])))
+        self._expect_calls(server, 1, f"{options['concurrency']} concurrent cold lookups")
+        if not all(result['success'] and result['weather'] == '晴' for result, _ in results):
+            raise CommandError('Concurrent cold lookups did not all get the upstream weather')
+        lines.append(
+            f"cold x{options['concurrency']:<5} 1 upstream call, p50 {_percentile([t for _, t in results], 50):.1f}ms"
+        )
+
+        # TTL内：直接返回缓存结果
+        server.reset()
+        timings = [self._lookup(region)[1] for _ in range(options['requests'])]
+        self._expect_calls(server, 0, 'Cached lookups')
+        lines.append(
+            f"cached x{options['requests']:<4} 0 upstream calls, p50 {_percentile(timings, 50):.3f}ms "
+            f"p99 {_percentile(timings, 99):.3f}ms"
+        )
+
+        # 超过TTL：立即返回旧结果，后台只刷新一次
+        time.sleep(config['TTL'] + 0.1)
+        server.reset()
+        with ThreadPoolExecutor(options['concurrency']) as pool:
+            results = list(pool.map(lambda _: self._lookup(region), range(options['concurrency'])))
+        slowest = max(t for _, t in results)
+        if slowest >= delay * 1000:
+            raise CommandError(f'Stale lookup waited for the upstream ({slowest:.1f}ms)')
+        self._wait_for_calls(server, 1, delay * 10)
+        time.sleep(delay * 2)
+        self._expect_calls(server, 1, 'Stale lookups')
+        server.reset()
+        self._lookup(region)
+        self._expect_calls(server, 0, 'Lookup after background refresh')
+        lines.append(f"stale x{options['concurrency']:<5} 1 background refresh, slowest {slowest:.1f}ms")
+
+        # 上游失败：失败结果缓存NEGATIVE_TTL秒
+        server.reset(mode='error')
+        failed_region = f'压测城市{run_id}-2'
+        first = self._lookup(failed_region)[0]
+        if first['success']:
+            raise CommandError('Upstream error was reported as success')
+        for _ in range(10):
+            self._lookup(failed_region)
+        self._expect_calls(server, 1, 'Lookups after an upstream error')
+        time.sleep(config['NEGATIVE_TTL'] + 0.1)
+        self._lookup(failed_region)
+        self._expect_calls(server, 2, 'Lookup after NEGATIVE_TTL')
+        lines.append('error    1 upstream call per NEGATIVE_TTL')
+
+        # 刷新失败：继续返回旧结果
+        time.sleep(config['TTL'] + 0.1)
+        server.reset(mode='error')
+        result = self._lookup(region)[0]
+        self._wait_for_calls(server, 1, delay * 10)
+        time.sleep(delay * 2)
+        result = self._lookup(region)[0]
+        if not (result['success'] and result['weather'] == '晴'):
+            raise CommandError('Failed refresh replaced the stale weather')
+        lines.append('refresh  failed refresh kept serving the previous weather')
+
+        # 上游无响应：耗时不超过 TIMEOUT × MAX_ATTEMPTS
+        server.reset(mode='ok', delay=config['TIMEOUT'] * 3)
+        elapsed = self._lookup(f'压测城市{run_id}-3')[1] / 1000
+        budget = config['TIMEOUT'] * config['MAX_ATTEMPTS']
+        if elapsed > budget + 1:
+            raise CommandError(f'Hung upstream blocked the lookup for {elapsed:.1f}s (> {budget}s)')
+        self._expect_calls(server, config['MAX_ATTEMPTS'], 'Lookup against a hung upstream')
+        lines.append(f'timeout  gave up after {elapsed:.2f}s ({config["MAX_ATTEMPTS"]} attempts)')
+        return lines
+
+    def handle(self, *args, **options):
+        if options['concurrency'] <= 0 or options['requests'] <= 0 or options['delay'] <= 0:
+            raise CommandError('--concurrency, --requests and --delay must be positive')
+        if weather_api.API_MODE != 'real':
+            raise CommandError('weather_api.API_MODE is not "real"; mock weather is not cached')
+        run_id = uuid.uuid4().hex[:8]
+        server = FakeWeatherServer(options['delay'])
+        delay = options['delay']
+        try:
+            # 缩短的过期时间让检查在几秒内完成
+            with override_settings(WEATHER_API={
+                'URL': server.url, 'API_KEY': 'bench', 'TIMEOUT': delay * 2, 'MAX_ATTEMPTS': 2,
+                'TTL': delay * 3, 'STALE_TTL': 60, 'NEGATIVE_TTL': delay * 3,
+            }):
+                lines = self._check(server, run_id, options)
+        finally:
+            server.close()
+            for i in range(1, 4):
+                cache.delete(weather_api._cache_key(f'压测城市{run_id}-{i}', date.today().strftime('%Y-%m-%d')))
+
+        for line in lines:
+            self.stdout.write(line)
+        self.stdout.write(self.style.SUCCESS('Weather cache coalesced, expired and negative-cached lookups as configured'))
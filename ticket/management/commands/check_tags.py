@@ -1,4 +1,5 @@
 from django.core.management.base import BaseCommand
+from ticket import tags
 from ticket.models import ScenicSpot
 
 class Command(BaseCommand):
@@ -6,7 +7,13 @@ class Command(BaseCommand):
 
     def handle(self, *args, **options):
         self.stdout.write('Checking scenic spot tags after cleaning:')
-        scenic_spots = ScenicSpot.objects.all()
+        # 一次查询预加载所有景点的标签
+        scenic_spots = ScenicSpot.objects.prefetch_related(tags.TAG_PREFETCH).order_by('id')
         for spot in scenic_spots:
-            self.stdout.write(f'{spot.name}: {spot.tags}')
+            self.stdout.write(f"{spot.name}: {','.join(tags.tag_names(spot))}")
         self.stdout.write(f'Total scenic spots: {scenic_spots.count()}')
+
+        # 各标签的景点数，在数据库中统计
+        self.stdout.write('\nScenic spots per tag:')
+        for facet in tags.tag_facets():
+            self.stdout.write(f"{facet['name']}: {facet['count']}")
@@ -1,5 +1,5 @@
 from django.core.management.base import BaseCommand
-from ticket.models import ScenicSpot
+from ticket import tags
 
 class Command(BaseCommand):
     help = 'Clean tags by removing category-related tags'
@@ -14,22 +14,10 @@ class Command(BaseCommand):
             '宗教文化', '现代都市'
         ]
 
-        # 获取所有景点
-        scenic_spots = ScenicSpot.objects.all()
-        updated_count = 0
+        # 每个标签一条DELETE，从所有景点中一次性移除，不再逐个保存景点
+        removed = tags.remove_tags(tags_to_remove)
+        for name, count in removed.items():
+            self.stdout.write(f'Removed tag {name} from {count} scenic spots')
 
-        for spot in scenic_spots:
-            if spot.tags:
-                # 分割标签为列表
-                tag_list = [tag.strip() for tag in spot.tags.split(',') if tag.strip()]
-                # 过滤掉需要移除的标签
-                filtered_tags = [tag for tag in tag_list if tag not in tags_to_remove]
-                # 如果标签有变化，更新景点
-                if len(filtered_tags) != len(tag_list):
-                    spot.tags = ','.join(filtered_tags) if filtered_tags else ''
-                    spot.save()
-                    updated_count += 1
-                    self.stdout.write(f'Updated tags for {spot.name}: {spot.tags}')
-
-        self.stdout.write(f'\nUpdated {updated_count} scenic spots')
+        self.stdout.write(f'\nRemoved {len(removed)} tags from {sum(removed.values())} scenic spot tag links')
         self.stdout.write('Tag cleaning completed')
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from ticket import idempotency
+
+
+class Command(BaseCommand):
+    help = 'Delete idempotency keys older than IDEMPOTENCY_KEY_TTL_HOURS'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Number of keys deleted per batch')
+
+    def handle(self, *args, **options):
+        deleted = idempotency.cleanup_expired(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} expired idempotency keys'))
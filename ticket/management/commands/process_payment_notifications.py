@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from ticket import payment_notifications
+
+
+class Command(BaseCommand):
+    help = 'Settle queued payment-provider callbacks in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None, help='Notifications processed per transaction')
+        parser.add_argument('--loop', action='store_true', help='Keep running as a background worker')
+        parser.add_argument('--interval', type=float, default=1, help='Seconds to sleep when the queue is empty in --loop mode')
+
+    def handle(self, *args, **options):
+        while True:
+            counts = self.drain(options['batch_size'])
+            if counts['claimed']:
+                self.stdout.write(
+                    f"Processed {counts['claimed']} notifications: {counts['processed']} settled, {counts['failed']} failed"
+                )
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+    def drain(self, batch_size):
+        # 逐批处理直到队列为空，每批一个事务
+        totals = {'claimed': 0, 'processed': 0, 'failed': 0}
+        while True:
+            counts = payment_notifications.process_batch(batch_size=batch_size)
+            for key in totals:
+                totals[key] += counts[key]
+            if not counts['claimed']:
+                return totals
@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from ticket import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the search index for scenic spots, news, comments and users'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--type', action='append', choices=sorted(search.DOCUMENT_TYPES), dest='doc_types',
+            help='Document type to rebuild, can be repeated; default is all types',
+        )
+        parser.add_argument('--batch-size', type=int, default=1000, help='Records indexed per batch')
+
+    def handle(self, *args, **options):
+        for doc_type in options['doc_types'] or sorted(search.DOCUMENT_TYPES):
+            started = time.perf_counter()
+            total = search.rebuild(doc_type, batch_size=options['batch_size'])
+            self.stdout.write(f'{doc_type:<8} {total} records indexed in {time.perf_counter() - started:.2f}s')
+        self.stdout.write(self.style.SUCCESS('Search index rebuilt'))
@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from ticket import inventory
+
+
+class Command(BaseCommand):
+    help = 'Cancel unpaid orders whose stock hold has expired and release their DateStock'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Holds processed per transaction')
+        parser.add_argument('--loop', action='store_true', help='Keep running as a background worker')
+        parser.add_argument('--interval', type=float, default=30, help='Seconds to sleep between sweeps in --loop mode')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        while True:
+            total_holds, total_cancelled = self.sweep(batch_size)
+            if total_holds:
+                self.stdout.write(f'Released {total_holds} expired holds, cancelled {total_cancelled} orders')
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+    def sweep(self, batch_size):
+        # 逐批处理直到没有过期记录，每批一个短事务
+        total_holds = total_cancelled = 0
+        while True:
+            holds, cancelled = inventory.release_expired_holds(batch_size=batch_size)
+            total_holds += holds
+            total_cancelled += cancelled
+            if holds < batch_size:
+                return total_holds, total_cancelled
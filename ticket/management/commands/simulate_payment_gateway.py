@@ -0,0 +1,183 @@
+import json
+import random
+import secrets
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Sum
+from django.test import RequestFactory
+from django.test.utils import override_settings
+
+from ticket import id_generator, inventory, payment_notifications, views
+from ticket.models import DateStock, Order, PaymentNotification, ScenicSpot, TicketType, User
+
+
+class Command(BaseCommand):
+    help = (
+        'Simulate a payment provider: create pending orders, fire signed callbacks (with duplicates) '
+        'at the callback endpoint, then settle them and verify every order was paid exactly once'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=2000, help='Pending orders to create')
+        parser.add_argument('--orders-per-payment', type=int, default=1, help='Orders settled by one callback')
+        parser.add_argument('--duplicates', type=float, default=0.3, help='Fraction of callbacks delivered twice')
+        parser.add_argument('--threads', type=int, default=1, help='Concurrent senders')
+        parser.add_argument(
+            '--url', default=None,
+            help='Callback URL of a running server, e.g. http://127.0.0.1:8000/payment_callback/; '
+                 'without it callbacks are sent to the view in-process',
+        )
+        parser.add_argument('--batch-size', type=int, default=None, help='Worker batch size')
+        parser.add_argument('--no-process', action='store_true', help='Only fire callbacks, leave them queued')
+
+    def _create_orders(self, user, count):
+        # 创建临时景点和待支付订单，库存已全部预占（剩余0、已售0）
+        spot = ScenicSpot.objects.create(
+            name='支付回调压测景点', description='bench', price=0, image='bench.jpg',
+            address='bench', opening_hours='',
+        )
+        ticket_type = TicketType.objects.create(scenic_spot=spot, name='门票', price=10, stock=count)
+        use_date = date.today() + timedelta(days=1)
+        inventory.set_date_stock(ticket_type, use_date, 0)
+        Order.objects.bulk_create([
+            Order(
+                user=user, scenic_spot=spot, ticket_type=ticket_type, use_date=use_date,
+                quantity=1, total_price=ticket_type.price, order_number=id_generator.new_order_number(),
+            )
+            for _ in range(count)
+        ], batch_size=500)
+        return spot, ticket_type, use_date, list(
+            Order.objects.filter(scenic_spot=spot).order_by('id').values_list('order_number', 'total_price')
+        )
+
+    def _build_callbacks(self, orders, per_payment, duplicates, run_id):
+        # 每个支付一个签名后的回调，按比例重复投递并打乱顺序
+        payments = {}
+        callbacks = []
+        for index in range(0, len(orders), per_payment):
+            group = orders[index:index + per_payment]
+            serial = f'SIM{run_id}{index:08d}'
+            payments[serial] = [order_number for order_number, _ in group]
+            body = json.dumps({
+                'payment_serial': serial,
+                'payment_method': 'simulator',
+                'order_numbers': payments[serial],
+                'amount': str(sum((price for _, price in group), Decimal('0'))),
+            }).encode()
+            callbacks.append((body, payment_notifications.sign(body)))
+        callbacks += random.sample(callbacks, int(len(callbacks) * duplicates))
+        random.shuffle(callbacks)
+        return payments, callbacks
+
+    def _sender(self, url):
+        # 返回发送单个回调的函数，结果为HTTP状态码
+        if url:
+            def send(callback):
+                body, signature = callback
+                request = urllib.request.Request(
+                    url, data=body, method='POST',
+                    headers={'Content-Type': 'application/json', 'X-Payment-Signature': signature},
+                )
+                try:
+                    with urllib.request.urlopen(request, timeout=10) as response:
+                        return response.status
+                except urllib.error.HTTPError as e:
+                    return e.code
+            return send
+
+        factory = RequestFactory()
+
+        def send(callback):
+            body, signature = callback
+            request = factory.post(
+                '/payment_callback/', data=body, content_type='application/json',
+                **{payment_notifications.SIGNATURE_HEADER: signature},
+            )
+            return views.payment_callback(request).status_code
+
+        return send
+
+    def handle(self, *args, **options):
+        if options['orders'] <= 0 or options['orders_per_payment'] <= 0:
+            raise CommandError('--orders and --orders-per-payment must be positive')
+        if settings.PAYMENT_CALLBACK_SECRET:
+            return self._simulate(options)
+        if options['url']:
+            raise CommandError('Set PAYMENT_CALLBACK_SECRET to the secret of the server at --url')
+        # 回调在本进程内发送，未设置密钥时使用临时密钥签名和校验
+        with override_settings(PAYMENT_CALLBACK_SECRET=secrets.token_hex(32)):
+            return self._simulate(options)
+
+    def _simulate(self, options):
+        run_id = uuid.uuid4().hex[:8]
+        user = User.objects.create_user(
+            username=f'gateway-sim-{run_id}', email=f'gateway-sim-{run_id}@example.com', password=None,
+        )
+        spot = None
+        try:
+            spot, ticket_type, use_date, orders = self._create_orders(user, options['orders'])
+            payments, callbacks = self._build_callbacks(
+                orders, options['orders_per_payment'], options['duplicates'], run_id,
+            )
+            self.stdout.write(
+                f'Firing {len(callbacks)} callbacks for {len(payments)} payments '
+                f'({len(callbacks) - len(payments)} duplicates) ...'
+            )
+
+            send = self._sender(options['url'])
+            started = time.perf_counter()
+            if options['threads'] > 1:
+                with ThreadPoolExecutor(options['threads']) as pool:
+                    statuses = list(pool.map(send, callbacks))
+            else:
+                statuses = [send(callback) for callback in callbacks]
+            elapsed = time.perf_counter() - started
+            rejected = [status for status in statuses if status != 200]
+            self.stdout.write(f'Ingest:  {len(callbacks) / elapsed:,.0f} callbacks/s ({elapsed:.2f}s)')
+            if rejected:
+                raise CommandError(f'{len(rejected)} callbacks were rejected, e.g. HTTP {rejected[0]}')
+
+            queued = PaymentNotification.objects.filter(payment_serial__in=list(payments)).count()
+            self.stdout.write(f'Queued:  {queued} notifications (duplicates dropped: {len(callbacks) - queued})')
+            if queued != len(payments):
+                raise CommandError(f'Expected {len(payments)} queued notifications, found {queued}')
+            if options['no_process']:
+                return
+
+            started = time.perf_counter()
+            settled = 0
+            while True:
+                counts = payment_notifications.process_batch(batch_size=options['batch_size'])
+                settled += counts['processed']
+                if not counts['claimed']:
+                    break
+            elapsed = time.perf_counter() - started
+            self.stdout.write(f'Settle:  {settled / elapsed:,.0f} notifications/s ({elapsed:.2f}s)')
+
+            # 校验：每个订单都已支付且流水号正确，已售数量等于订单数（没有重复确认）
+            paid = dict(
+                Order.objects.filter(scenic_spot=spot, status=1).values_list('order_number', 'payment_serial')
+            )
+            wrong = [
+                order_number for serial, order_numbers in payments.items()
+                for order_number in order_numbers if paid.get(order_number) != serial
+            ]
+            sold = DateStock.objects.filter(ticket_type=ticket_type, use_date=use_date).aggregate(total=Sum('sold'))['total']
+            failed = PaymentNotification.objects.filter(payment_serial__in=list(payments)).exclude(status=1).count()
+            self.stdout.write(f'Paid:    {len(paid)}/{len(orders)} orders, sold={sold}, failed notifications={failed}')
+            if wrong or sold != len(orders) or failed:
+                raise CommandError(f'Verification failed: {len(wrong)} orders not settled by their payment')
+            self.stdout.write(self.style.SUCCESS('Every order was paid exactly once'))
+        finally:
+            PaymentNotification.objects.filter(payment_serial__startswith=f'SIM{run_id}').delete()
+            if spot is not None:
+                spot.delete()
+            user.delete()
@@ -0,0 +1,93 @@
+import multiprocessing
+import threading
+import time
+from array import array
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from ticket import id_generator
+
+
+def _generate(args):
+    # 子进程中生成count个ID，多个线程共享同一个生成器，返回每个线程生成的ID序列
+    node_id, count, threads = args
+    if node_id is None:
+        # 使用视图中同样的模块默认生成器：子进程从租约表占用各自的节点ID
+        generator = id_generator.get_generator()
+    else:
+        generator = id_generator.SnowflakeGenerator(node_id)
+
+    per_thread = count // threads
+    results = [array('Q') for _ in range(threads)]
+
+    def worker(output):
+        for _ in range(per_thread):
+            output.append(generator.next_id())
+
+    workers = [threading.Thread(target=worker, args=(output,)) for output in results]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    if node_id is None:
+        # 进程池的子进程退出时不执行atexit，主动释放节点ID
+        id_generator.release_node_id()
+    return generator.node_id, [output.tobytes() for output in results]
+
+
+class Command(BaseCommand):
+    help = 'Generate millions of Snowflake IDs across processes and threads and verify there are no collisions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=4, help='Number of worker processes')
+        parser.add_argument('--threads', type=int, default=2, help='Threads per process sharing one generator')
+        parser.add_argument('--count', type=int, default=500000, help='IDs generated per process')
+        parser.add_argument(
+            '--node-source', choices=['default', 'explicit'], default='default',
+            help='default: the per-process generator used by the views, node IDs claimed from the lease table; '
+                 'explicit: node ID = worker index',
+        )
+
+    def handle(self, *args, **options):
+        processes = options['processes']
+        threads = options['threads']
+        count = options['count'] - options['count'] % threads
+        if processes > id_generator.MAX_NODE_ID + 1:
+            raise CommandError(f'At most {id_generator.MAX_NODE_ID + 1} processes have distinct node IDs')
+
+        jobs = [
+            (index if options['node_source'] == 'explicit' else None, count, threads)
+            for index in range(processes)
+        ]
+        self.stdout.write(f'Generating {processes} processes x {count} IDs ({threads} threads each) ...')
+        started = time.perf_counter()
+        # 子进程不能共用父进程的数据库连接，fork前关闭，子进程各自重新连接
+        connections.close_all()
+        with multiprocessing.get_context('fork').Pool(processes) as pool:
+            results = pool.map(_generate, jobs)
+        elapsed = time.perf_counter() - started
+
+        node_ids = [node_id for node_id, _ in results]
+        if len(set(node_ids)) != len(node_ids):
+            raise CommandError(f'Worker processes share node IDs: {sorted(node_ids)}')
+
+        all_ids = array('Q')
+        for node_id, outputs in results:
+            for raw in outputs:
+                ids = array('Q')
+                ids.frombytes(raw)
+                # 同一线程先后拿到的ID必须严格递增
+                if any(ids[i] >= ids[i + 1] for i in range(len(ids) - 1)):
+                    raise CommandError(f'IDs from node {node_id} are not strictly increasing')
+                all_ids.extend(ids)
+
+        total = len(all_ids)
+        unique = len(set(all_ids))
+        self.stdout.write(f'Generated:  {total}')
+        self.stdout.write(f'Unique:     {unique}')
+        self.stdout.write(f'Elapsed:    {elapsed:.2f}s ({total / elapsed:,.0f} IDs/s)')
+        self.stdout.write(f'Sample:     {id_generator.new_order_number()} / {id_generator.new_payment_serial()}')
+        if unique != total:
+            raise CommandError(f'{total - unique} colliding IDs detected')
+        self.stdout.write(self.style.SUCCESS('No collisions detected'))
@@ -0,0 +1,83 @@
+# Generated by Django 6.0 on 2026-10-18 06:35
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import F
+from django.db.models.functions import Greatest
+
+
+def cancel_legacy_pending_orders(apps, schema_editor):
+    # 切换说明：本迁移之前创建的待支付订单没有库存预占记录，清理任务不会释放它们；
+    # 旧的下单流程在创建订单时已经扣减了stock并增加了sold，按新流程支付会再次增加sold。
+    # 因此迁移时按旧的cancel_order逻辑取消这些订单：恢复当日库存、扣回已售数量，
+    # 用户需要重新下单。部署前应先停止下单入口，避免迁移期间产生新的旧流程订单。
+    Order = apps.get_model("ticket", "Order")
+    DateStock = apps.get_model("ticket", "DateStock")
+
+    pending = Order.objects.filter(status=0)
+    for ticket_type_id, use_date, quantity in pending.filter(
+        ticket_type__isnull=False, use_date__isnull=False
+    ).values_list("ticket_type_id", "use_date", "quantity").iterator():
+        DateStock.objects.filter(ticket_type_id=ticket_type_id, use_date=use_date).update(
+            stock=F("stock") + quantity,
+            sold=Greatest(F("sold") - quantity, 0),
+        )
+    pending.update(status=2)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("ticket", "0002_order_payment_method_order_payment_serial_and_more"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="StockHold",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("use_date", models.DateField(verbose_name="使用日期")),
+                ("quantity", models.IntegerField(verbose_name="数量")),
+                (
+                    "expires_at",
+                    models.DateTimeField(db_index=True, verbose_name="过期时间"),
+                ),
+                (
+                    "created_at",
+                    models.DateTimeField(auto_now_add=True, verbose_name="创建时间"),
+                ),
+                (
+                    "order",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="stock_hold",
+                        to="ticket.order",
+                        verbose_name="订单",
+                    ),
+                ),
+                (
+                    "ticket_type",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="ticket.tickettype",
+                        verbose_name="门票类型",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "库存预占",
+                "verbose_name_plural": "库存预占",
+                "ordering": ["expires_at"],
+            },
+        ),
+        # 已取消的订单无法恢复为待支付，回滚时不做处理
+        migrations.RunPython(cancel_legacy_pending_orders, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 6.0 on 2026-10-18 11:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("ticket", "0003_stockhold"),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name="datestock",
+            options={
+                "ordering": ["use_date", "shard"],
+                "verbose_name": "日期库存",
+                "verbose_name_plural": "日期库存",
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name="datestock",
+            unique_together=set(),
+        ),
+        migrations.AddField(
+            model_name="datestock",
+            name="shard",
+            field=models.PositiveSmallIntegerField(default=0, verbose_name="分片序号"),
+        ),
+        migrations.AddField(
+            model_name="tickettype",
+            name="stock_shards",
+            field=models.PositiveSmallIntegerField(
+                default=1, verbose_name="库存分片数"
+            ),
+        ),
+        migrations.AlterUniqueTogether(
+            name="datestock",
+            unique_together={("ticket_type", "use_date", "shard")},
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 6.0 on 2026-10-18 12:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("ticket", "0004_tickettype_stock_shards"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="WaitingRoomCounter",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "next_admit_at",
+                    models.FloatField(default=0, verbose_name="下一个放行时间"),
+                ),
+                (
+                    "updated_at",
+                    models.DateTimeField(auto_now=True, verbose_name="更新时间"),
+                ),
+                (
+                    "scenic_spot",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="waiting_room_counter",
+                        to="ticket.scenicspot",
+                        verbose_name="景点",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "购票排队计数",
+                "verbose_name_plural": "购票排队计数",
+            },
+        ),
+    ]
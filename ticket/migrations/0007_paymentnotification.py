@@ -0,0 +1,81 @@
+# Generated by Django 6.0 on 2026-10-18 15:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("ticket", "0006_idempotencykey"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PaymentNotification",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "payment_serial",
+                    models.CharField(
+                        max_length=100, unique=True, verbose_name="支付流水号"
+                    ),
+                ),
+                (
+                    "payment_method",
+                    models.CharField(max_length=50, verbose_name="支付方式"),
+                ),
+                (
+                    "order_numbers",
+                    models.JSONField(default=list, verbose_name="订单号列表"),
+                ),
+                (
+                    "amount",
+                    models.DecimalField(
+                        decimal_places=2, max_digits=10, verbose_name="支付金额"
+                    ),
+                ),
+                ("payload", models.JSONField(default=dict, verbose_name="回调内容")),
+                (
+                    "status",
+                    models.IntegerField(
+                        choices=[(0, "待处理"), (1, "已处理"), (2, "处理失败")],
+                        db_index=True,
+                        default=0,
+                        verbose_name="处理状态",
+                    ),
+                ),
+                (
+                    "attempts",
+                    models.PositiveSmallIntegerField(
+                        default=0, verbose_name="处理次数"
+                    ),
+                ),
+                (
+                    "error",
+                    models.TextField(blank=True, default="", verbose_name="失败原因"),
+                ),
+                (
+                    "created_at",
+                    models.DateTimeField(auto_now_add=True, verbose_name="接收时间"),
+                ),
+                (
+                    "processed_at",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="处理时间"
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "支付通知",
+                "verbose_name_plural": "支付通知",
+            },
+        ),
+    ]
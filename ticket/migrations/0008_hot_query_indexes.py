@@ -0,0 +1,111 @@
+# Generated by Django 6.0 on 2026-10-18 09:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("ticket", "0007_paymentnotification"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="browsehistory",
+            index=models.Index(
+                fields=["user", "-browse_time"], name="ticket_browse_user_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="collection",
+            index=models.Index(
+                fields=["user", "-created_at"], name="ticket_collection_user_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="news",
+            index=models.Index(
+                fields=["is_announcement", "-created_at"],
+                name="ticket_news_type_created_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="news",
+            index=models.Index(fields=["-created_at"], name="ticket_news_created_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="order",
+            index=models.Index(
+                fields=["user", "-created_at"], name="ticket_order_user_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="order",
+            index=models.Index(
+                fields=["scenic_spot", "status", "created_at"],
+                name="ticket_order_spot_status_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="order",
+            index=models.Index(
+                fields=["status", "-created_at"], name="ticket_order_status_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="order",
+            index=models.Index(fields=["-created_at"], name="ticket_order_created_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="scenicspot",
+            index=models.Index(
+                fields=["is_hot", "-created_at"], name="ticket_spot_hot_created_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="scenicspot",
+            index=models.Index(
+                fields=["admin", "-created_at"], name="ticket_spot_admin_created_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="scenicspot",
+            index=models.Index(fields=["-created_at"], name="ticket_spot_created_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="scenicspotcomment",
+            index=models.Index(
+                fields=["scenic_spot", "-created_at"], name="ticket_comment_spot_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="scenicspotcomment",
+            index=models.Index(
+                fields=["user", "-created_at"], name="ticket_comment_user_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="scenicspotcomment",
+            index=models.Index(
+                fields=["is_replied", "-created_at"], name="ticket_comment_replied_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="scenicspotcomment",
+            index=models.Index(
+                fields=["-created_at"], name="ticket_comment_created_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="tickettype",
+            index=models.Index(
+                fields=["scenic_spot", "is_active"], name="ticket_tt_spot_active_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="tickettype",
+            index=models.Index(
+                fields=["scenic_spot", "-created_at"], name="ticket_tt_spot_created_idx"
+            ),
+        ),
+    ]
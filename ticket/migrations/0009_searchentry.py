@@ -0,0 +1,45 @@
+# Generated by Django 6.0 on 2026-10-18 11:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("ticket", "0008_hot_query_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SearchEntry",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("doc_type", models.CharField(max_length=20, verbose_name="文档类型")),
+                ("object_id", models.PositiveBigIntegerField(verbose_name="记录ID")),
+                ("term", models.CharField(max_length=20, verbose_name="词条")),
+                ("weight", models.PositiveIntegerField(default=1, verbose_name="权重")),
+            ],
+            options={
+                "verbose_name": "搜索索引",
+                "verbose_name_plural": "搜索索引",
+                "indexes": [
+                    models.Index(
+                        fields=["doc_type", "term", "-weight", "object_id"],
+                        name="ticket_search_term_idx",
+                    ),
+                    models.Index(
+                        fields=["doc_type", "object_id", "term", "weight"],
+                        name="ticket_search_object_idx",
+                    ),
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,90 @@
+# Generated by Django 6.0 on 2026-10-18 12:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("ticket", "0009_searchentry"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Tag",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "name",
+                    models.CharField(
+                        max_length=50, unique=True, verbose_name="标签名称"
+                    ),
+                ),
+                (
+                    "created_at",
+                    models.DateTimeField(auto_now_add=True, verbose_name="创建时间"),
+                ),
+            ],
+            options={
+                "verbose_name": "景点标签",
+                "verbose_name_plural": "景点标签",
+                "ordering": ["name"],
+            },
+        ),
+        migrations.CreateModel(
+            name="ScenicSpotTag",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "position",
+                    models.PositiveSmallIntegerField(default=0, verbose_name="顺序"),
+                ),
+                (
+                    "scenic_spot",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="tag_links",
+                        to="ticket.scenicspot",
+                        verbose_name="景点",
+                    ),
+                ),
+                (
+                    "tag",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="spot_links",
+                        to="ticket.tag",
+                        verbose_name="标签",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "景点标签关联",
+                "verbose_name_plural": "景点标签关联",
+                "ordering": ["position"],
+                "indexes": [
+                    models.Index(
+                        fields=["tag", "scenic_spot"], name="ticket_spot_tag_tag_idx"
+                    )
+                ],
+                "unique_together": {("scenic_spot", "tag")},
+            },
+        ),
+    ]
@@ -0,0 +1,71 @@
+# Generated by Django 6.0 on 2026-10-18 12:12
+
+from django.db import migrations
+
+
+def split_tags(text):
+    # 与ticket.tags.parse_tags一致：按中英文逗号分割，去掉空白和重复的标签
+    names = [name.strip()[:50] for name in (text or "").replace("，", ",").split(",")]
+    return list(dict.fromkeys(name for name in names if name))
+
+
+def copy_tags_to_table(apps, schema_editor):
+    # 把逗号分隔的ScenicSpot.tags拆分写入Tag和ScenicSpotTag
+    ScenicSpot = apps.get_model("ticket", "ScenicSpot")
+    Tag = apps.get_model("ticket", "Tag")
+    ScenicSpotTag = apps.get_model("ticket", "ScenicSpotTag")
+
+    spot_tags = {
+        spot_id: split_tags(tags)
+        for spot_id, tags in ScenicSpot.objects.values_list("id", "tags").iterator()
+    }
+    names = {name for tag_names in spot_tags.values() for name in tag_names}
+    Tag.objects.bulk_create(
+        [Tag(name=name) for name in sorted(names)],
+        ignore_conflicts=True,
+        batch_size=1000,
+    )
+    tag_ids = dict(Tag.objects.filter(name__in=names).values_list("name", "id"))
+    ScenicSpotTag.objects.bulk_create(
+        [
+            ScenicSpotTag(
+                scenic_spot_id=spot_id, tag_id=tag_ids[name], position=position
+            )
+            for spot_id, tag_names in spot_tags.items()
+            for position, name in enumerate(tag_names)
+        ],
+        batch_size=1000,
+    )
+
+
+def copy_tags_to_field(apps, schema_editor):
+    # 回滚：按顺序拼回逗号分隔的字符串
+    ScenicSpot = apps.get_model("ticket", "ScenicSpot")
+    Tag = apps.get_model("ticket", "Tag")
+    ScenicSpotTag = apps.get_model("ticket", "ScenicSpotTag")
+
+    spot_tags = {}
+    for spot_id, name in (
+        ScenicSpotTag.objects.order_by("scenic_spot_id", "position")
+        .values_list("scenic_spot_id", "tag__name")
+        .iterator()
+    ):
+        spot_tags.setdefault(spot_id, []).append(name)
+    spots = list(ScenicSpot.objects.only("id"))
+    for spot in spots:
+        spot.tags = ",".join(spot_tags.get(spot.id, []))[:100]
+    ScenicSpot.objects.bulk_update(spots, ["tags"], batch_size=1000)
+    # 清空标签表，重新执行迁移时从逗号分隔的字段重新拆分
+    ScenicSpotTag.objects.all().delete()
+    Tag.objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("ticket", "0010_tag"),
+    ]
+
+    operations = [
+        migrations.RunPython(copy_tags_to_table, copy_tags_to_field),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 6.0 on 2026-10-18 12:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("ticket", "0011_migrate_spot_tags"),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name="scenicspot",
+            name="tags",
+        ),
+        migrations.AddField(
+            model_name="scenicspot",
+            name="tags",
+            field=models.ManyToManyField(
+                blank=True,
+                related_name="scenic_spots",
+                through="ticket.ScenicSpotTag",
+                to="ticket.tag",
+                verbose_name="标签",
+            ),
+        ),
+    ]
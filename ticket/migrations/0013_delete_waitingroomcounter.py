@@ -0,0 +1,16 @@
+# Generated by Django 6.0 on 2026-10-18 15:02
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("ticket", "0012_scenicspot_tags_m2m"),
+    ]
+
+    operations = [
+        migrations.DeleteModel(
+            name="WaitingRoomCounter",
+        ),
+    ]
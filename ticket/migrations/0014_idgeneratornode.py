@@ -0,0 +1,42 @@
+# Generated by Django 6.0 on 2026-10-18 15:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("ticket", "0013_delete_waitingroomcounter"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="IdGeneratorNode",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "node_id",
+                    models.PositiveSmallIntegerField(
+                        unique=True, verbose_name="节点ID"
+                    ),
+                ),
+                ("owner", models.CharField(max_length=200, verbose_name="占用进程")),
+                (
+                    "expires_at",
+                    models.DateTimeField(db_index=True, verbose_name="过期时间"),
+                ),
+            ],
+            options={
+                "verbose_name": "订单号节点ID",
+                "verbose_name_plural": "订单号节点ID",
+            },
+        ),
+    ]
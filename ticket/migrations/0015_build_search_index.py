@@ -0,0 +1,47 @@
+# Generated by Django 6.0 on 2026-10-18 16:05
+
+from django.db import migrations
+
+from ticket import search
+
+
+def build_search_index(apps, schema_editor):
+    # 为迁移前已有的景点、资讯、留言和用户建立搜索索引；
+    # 用户名和邮箱改为按n元组索引，原有的用户索引一并重建
+    SearchEntry = apps.get_model("ticket", "SearchEntry")
+    SearchEntry.objects.all().delete()
+    for doc_type, (model, related, fields) in search.DOCUMENT_TYPES.items():
+        queryset = (
+            apps.get_model("ticket", model.__name__)
+            .objects.select_related(*related)
+            .order_by("id")
+        )
+        last_id = 0
+        while True:
+            batch = list(queryset.filter(id__gt=last_id)[:1000])
+            if not batch:
+                break
+            SearchEntry.objects.bulk_create(
+                [
+                    SearchEntry(
+                        doc_type=doc_type, object_id=obj.id, term=term, weight=weight
+                    )
+                    for obj in batch
+                    for term, weight in search.document_weights(
+                        doc_type, fields(obj)
+                    ).items()
+                ],
+                batch_size=1000,
+            )
+            last_id = batch[-1].id
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("ticket", "0014_idgeneratornode"),
+    ]
+
+    operations = [
+        migrations.RunPython(build_search_index, migrations.RunPython.noop),
+    ]
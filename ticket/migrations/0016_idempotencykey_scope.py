@@ -0,0 +1,22 @@
+# Generated by Django 6.0 on 2026-10-18 16:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("ticket", "0015_build_search_index"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="idempotencykey",
+            name="key",
+            field=models.CharField(max_length=64, verbose_name="幂等键"),
+        ),
+        migrations.AlterUniqueTogether(
+            name="idempotencykey",
+            unique_together={("user", "endpoint", "key")},
+        ),
+    ]
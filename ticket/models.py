@@ -132,8 +132,8 @@ class ScenicSpot(models.Model):
     is_hot = models.BooleanField(default=False, verbose_name='是否热门')
     # 景点地区，使用ForeignKey关联Region模型
     region = models.ForeignKey('Region', on_delete=models.SET_NULL, null=True, blank=True, verbose_name='地区')
-    # 景点标签，使用CharField存储，最大长度100，用于存储多个标签，以逗号分隔
-    tags = models.CharField(max_length=100, default='热门', verbose_name='标签', help_text='多个标签用逗号分隔')
+    # 景点标签，通过ScenicSpotTag中间表关联Tag模型，按录入顺序排列
+    tags = models.ManyToManyField('Tag', through='ScenicSpotTag', related_name='scenic_spots', blank=True, verbose_name='标签')
     # 景点评分，使用DecimalField存储，最大3位数字，1位小数，默认0.0
     rating = models.DecimalField(max_digits=3, decimal_places=1, default=0.0, verbose_name='评分')
     # 预约人数，使用IntegerField存储，默认0
@@ -153,6 +153,52 @@ class ScenicSpot(models.Model):
     class Meta:
         verbose_name = '景点信息'       # 模型的可读名称
         verbose_name_plural = verbose_name  # 复数形式的可读名称
+        indexes = [
+            # 首页热门景点：按是否热门筛选、创建时间倒序
+            models.Index(fields=['is_hot', '-created_at'], name='ticket_spot_hot_created_idx'),
+            # 景点管理员的景点列表：按管理员筛选、创建时间倒序
+            models.Index(fields=['admin', '-created_at'], name='ticket_spot_admin_created_idx'),
+            # 按创建时间倒序的景点列表；SQLite中布尔条件写作WHERE is_hot，无法使用上面的组合索引，按此索引倒序查找
+            models.Index(fields=['-created_at'], name='ticket_spot_created_idx'),
+        ]
+
+# 标签模型，景点通过ScenicSpotTag中间表关联多个标签
+class Tag(models.Model):
+    # 标签名称，使用CharField存储，最大长度50，必须唯一
+    name = models.CharField(max_length=50, unique=True, verbose_name='标签名称')
+    # 创建时间，使用DateTimeField存储，自动添加当前时间
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='创建时间')
+    # 显式定义objects管理器，解决IDE警告
+    objects = models.Manager()
+
+    # 模型元数据配置
+    class Meta:
+        verbose_name = '景点标签'       # 模型的可读名称
+        verbose_name_plural = verbose_name  # 复数形式的可读名称
+        ordering = ['name']             # 默认按标签名称排序
+
+# 景点标签关联模型，ScenicSpot.tags多对多关系的中间表
+class ScenicSpotTag(models.Model):
+    # 关联的景点，景点删除时关联记录也删除
+    scenic_spot = models.ForeignKey(ScenicSpot, on_delete=models.CASCADE, related_name='tag_links', verbose_name='景点')
+    # 关联的标签，标签删除时关联记录也删除
+    tag = models.ForeignKey(Tag, on_delete=models.CASCADE, related_name='spot_links', verbose_name='标签')
+    # 标签在景点中的顺序，从0开始，保持录入时的先后顺序
+    position = models.PositiveSmallIntegerField(default=0, verbose_name='顺序')
+    # 显式定义objects管理器，解决IDE警告
+    objects = models.Manager()
+
+    # 模型元数据配置
+    class Meta:
+        verbose_name = '景点标签关联'     # 模型的可读名称
+        verbose_name_plural = verbose_name  # 复数形式的可读名称
+        # 唯一约束：一个景点的同一标签只关联一次，同时用于按景点查找标签
+        unique_together = ('scenic_spot', 'tag')
+        ordering = ['position']            # 默认按标签顺序排列
+        indexes = [
+            # 按标签筛选景点、统计各标签的景点数
+            models.Index(fields=['tag', 'scenic_spot'], name='ticket_spot_tag_tag_idx'),
+        ]
 
 # 资讯公告模型，存储系统公告和旅游资讯
 class News(models.Model):
@@ -177,6 +223,12 @@ class News(models.Model):
         verbose_name = '资讯公告'       # 模型的可读名称
         verbose_name_plural = verbose_name  # 复数形式的可读名称
         ordering = ['-created_at']         # 默认按创建时间倒序排列
+        indexes = [
+            # 公告、资讯列表：按是否为公告筛选、创建时间倒序
+            models.Index(fields=['is_announcement', '-created_at'], name='ticket_news_type_created_idx'),
+            # 全部资讯列表：创建时间倒序
+            models.Index(fields=['-created_at'], name='ticket_news_created_idx'),
+        ]
 
 # 轮播图模型，用于首页轮播展示景点
 class Carousel(models.Model):
@@ -223,6 +275,8 @@ class TicketType(models.Model):
     is_active = models.BooleanField(default=True, verbose_name='是否激活')
     # 门票前缀，用于区分不同日期的门票
     prefix = models.CharField(max_length=20, blank=True, default='', verbose_name='前缀')
+    # 日期库存分片数，默认1表示单行库存；抢购门票可设置多个分片分散行锁竞争
+    stock_shards = models.PositiveSmallIntegerField(default=1, verbose_name='库存分片数')
     # 创建时间，使用DateTimeField存储，自动添加当前时间
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='创建时间')
     # 更新时间，使用DateTimeField存储，自动更新为当前时间
@@ -235,6 +289,12 @@ class TicketType(models.Model):
         verbose_name = '门票类型'         # 模型的可读名称
         verbose_name_plural = verbose_name  # 复数形式的可读名称
         ordering = ['-created_at']         # 默认按创建时间倒序排列
+        indexes = [
+            # 景点详情、购票页：景点下已激活的门票类型
+            models.Index(fields=['scenic_spot', 'is_active'], name='ticket_tt_spot_active_idx'),
+            # 景点管理员的门票列表：按景点筛选、创建时间倒序
+            models.Index(fields=['scenic_spot', '-created_at'], name='ticket_tt_spot_created_idx'),
+        ]
 
 # 日期库存模型，用于存储每日的门票库存信息
 class DateStock(models.Model):
@@ -246,6 +306,9 @@ class DateStock(models.Model):
     stock = models.IntegerField(default=1000, verbose_name='当天库存')
     # 当天已售
     sold = models.IntegerField(default=0, verbose_name='当天已售')
+    # 分片序号，未启用分片的门票类型只有0号分片
+    # 同一门票类型同一天的库存和已售为所有分片之和
+    shard = models.PositiveSmallIntegerField(default=0, verbose_name='分片序号')
     # 创建时间
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='创建时间')
     # 更新时间
@@ -256,8 +319,8 @@ class DateStock(models.Model):
     class Meta:
         verbose_name = '日期库存'
         verbose_name_plural = '日期库存'
-        ordering = ['use_date']
-        unique_together = ('ticket_type', 'use_date')
+        ordering = ['use_date', 'shard']
+        unique_together = ('ticket_type', 'use_date', 'shard')
 
 # 购物车模型，存储用户添加的景点门票
 class Cart(models.Model):
@@ -311,6 +374,16 @@ class ScenicSpotComment(models.Model):
         verbose_name = '景点留言'         # 模型的可读名称
         verbose_name_plural = verbose_name  # 复数形式的可读名称
         ordering = ['-created_at']         # 默认按创建时间倒序排列
+        indexes = [
+            # 景点详情、景点管理员的留言列表：按景点筛选、创建时间倒序
+            models.Index(fields=['scenic_spot', '-created_at'], name='ticket_comment_spot_idx'),
+            # 个人中心我的留言：按用户筛选、创建时间倒序
+            models.Index(fields=['user', '-created_at'], name='ticket_comment_user_idx'),
+            # 留言管理：按是否回复筛选、创建时间倒序
+            models.Index(fields=['is_replied', '-created_at'], name='ticket_comment_replied_idx'),
+            # 留言管理全部留言：创建时间倒序
+            models.Index(fields=['-created_at'], name='ticket_comment_created_idx'),
+        ]
 
 # 订单模型，存储用户的购票订单
 class Order(models.Model):
@@ -367,6 +440,114 @@ class Order(models.Model):
         verbose_name = '订单'            # 模型的可读名称
         verbose_name_plural = verbose_name  # 复数形式的可读名称
         ordering = ['-created_at']         # 默认按创建时间倒序排列
+        indexes = [
+            # 我的订单：按用户筛选、创建时间倒序
+            models.Index(fields=['user', '-created_at'], name='ticket_order_user_idx'),
+            # 景点管理员的订单列表和统计：按景点、状态筛选，按创建时间排序或范围查询
+            models.Index(fields=['scenic_spot', 'status', 'created_at'], name='ticket_order_spot_status_idx'),
+            # 订单管理和后台统计：按状态筛选、创建时间倒序
+            models.Index(fields=['status', '-created_at'], name='ticket_order_status_idx'),
+            # 全部订单列表、今日订单数：创建时间倒序或范围查询
+            models.Index(fields=['-created_at'], name='ticket_order_created_idx'),
+        ]
+
+# 库存预占模型，记录未支付订单占用的日期库存及其过期时间
+# 订单支付或取消时删除，过期未支付的记录由release_expired_holds命令批量释放
+class StockHold(models.Model):
+    # 关联的订单，一个待支付订单对应一条预占记录，订单删除时预占记录也删除
+    order = models.OneToOneField(Order, on_delete=models.CASCADE, related_name='stock_hold', verbose_name='订单')
+    # 预占的门票类型
+    ticket_type = models.ForeignKey(TicketType, on_delete=models.CASCADE, verbose_name='门票类型')
+    # 预占的使用日期
+    use_date = models.DateField(verbose_name='使用日期')
+    # 预占数量
+    quantity = models.IntegerField(verbose_name='数量')
+    # 过期时间，建立索引，清理任务按过期时间范围扫描
+    expires_at = models.DateTimeField(db_index=True, verbose_name='过期时间')
+    # 创建时间，使用DateTimeField存储，自动添加当前时间
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='创建时间')
+    # 显式定义objects管理器，解决IDE警告
+    objects = models.Manager()
+
+    # 模型元数据配置
+    class Meta:
+        verbose_name = '库存预占'         # 模型的可读名称
+        verbose_name_plural = verbose_name  # 复数形式的可读名称
+        ordering = ['expires_at']          # 默认按过期时间排序
+
+# 幂等键模型，记录客户端提交的幂等键及其创建的订单，重复提交时返回原订单
+class IdempotencyKey(models.Model):
+    # 客户端生成的幂等键，(用户, 入口, 幂等键)唯一约束保证同一个请求只会创建一次订单
+    key = models.CharField(max_length=64, verbose_name='幂等键')
+    # 提交请求的用户
+    user = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name='用户')
+    # 创建订单的入口，如buy_now、cart
+    endpoint = models.CharField(max_length=50, verbose_name='请求入口')
+    # 该请求创建的订单ID列表
+    order_ids = models.JSONField(default=list, verbose_name='订单ID列表')
+    # 创建时间，超过IDEMPOTENCY_KEY_TTL_HOURS后由cleanup_idempotency_keys命令清理
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='创建时间')
+    # 显式定义objects管理器，解决IDE警告
+    objects = models.Manager()
+
+    # 模型元数据配置
+    class Meta:
+        verbose_name = '幂等键'           # 模型的可读名称
+        verbose_name_plural = verbose_name  # 复数形式的可读名称
+        # 幂等键只在同一用户的同一入口内去重，其他用户或另一个入口使用相同的键按新请求处理
+        unique_together = ('user', 'endpoint', 'key')
+
+# 订单号生成器节点ID租约模型，每个运行中的进程占用一个节点ID，保证不同进程生成的ID不会重复
+class IdGeneratorNode(models.Model):
+    # Snowflake节点ID（0-1023），唯一约束保证同一时间只有一个进程占用
+    node_id = models.PositiveSmallIntegerField(unique=True, verbose_name='节点ID')
+    # 占用该节点ID的进程（主机名:进程ID:随机值）
+    owner = models.CharField(max_length=200, verbose_name='占用进程')
+    # 租约过期时间，进程定期续期；过期后其他进程可以重新占用
+    expires_at = models.DateTimeField(db_index=True, verbose_name='过期时间')
+    # 显式定义objects管理器，解决IDE警告
+    objects = models.Manager()
+
+    # 模型元数据配置
+    class Meta:
+        verbose_name = '订单号节点ID'     # 模型的可读名称
+        verbose_name_plural = verbose_name  # 复数形式的可读名称
+
+# 支付通知模型，支付平台的回调先写入该表，由process_payment_notifications命令批量处理
+class PaymentNotification(models.Model):
+    # 处理状态选项
+    STATUS_CHOICES = (
+        (0, '待处理'),  # 已接收，等待后台处理
+        (1, '已处理'),  # 订单已确认支付
+        (2, '处理失败'),  # 订单不存在、金额不符或订单状态不允许支付，需要人工处理
+    )
+    # 支付平台的支付流水号，唯一约束保证同一笔支付的重复回调只记录一次
+    payment_serial = models.CharField(max_length=100, unique=True, verbose_name='支付流水号')
+    # 支付方式
+    payment_method = models.CharField(max_length=50, verbose_name='支付方式')
+    # 本次支付包含的订单号列表
+    order_numbers = models.JSONField(default=list, verbose_name='订单号列表')
+    # 支付金额
+    amount = models.DecimalField(max_digits=10, decimal_places=2, verbose_name='支付金额')
+    # 回调原始内容，用于排查问题
+    payload = models.JSONField(default=dict, verbose_name='回调内容')
+    # 处理状态，后台任务按状态查询待处理的通知
+    status = models.IntegerField(choices=STATUS_CHOICES, default=0, db_index=True, verbose_name='处理状态')
+    # 处理次数
+    attempts = models.PositiveSmallIntegerField(default=0, verbose_name='处理次数')
+    # 处理失败的原因
+    error = models.TextField(blank=True, default='', verbose_name='失败原因')
+    # 接收时间，使用DateTimeField存储，自动添加当前时间
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='接收时间')
+    # 处理时间
+    processed_at = models.DateTimeField(null=True, blank=True, verbose_name='处理时间')
+    # 显式定义objects管理器，解决IDE警告
+    objects = models.Manager()
+
+    # 模型元数据配置
+    class Meta:
+        verbose_name = '支付通知'         # 模型的可读名称
+        verbose_name_plural = verbose_name  # 复数形式的可读名称
 
 # 收藏模型，用于用户收藏景点
 class Collection(models.Model):
@@ -386,6 +567,10 @@ class Collection(models.Model):
         # 唯一约束：一个用户只能收藏一个景点一次
         unique_together = ('user', 'scenic_spot')
         ordering = ['-created_at']         # 默认按创建时间倒序排列
+        indexes = [
+            # 个人中心我的收藏：按用户筛选、创建时间倒序
+            models.Index(fields=['user', '-created_at'], name='ticket_collection_user_idx'),
+        ]
 
 # 浏览历史模型，用于记录用户浏览景点的历史
 class BrowseHistory(models.Model):
@@ -402,4 +587,33 @@ class BrowseHistory(models.Model):
     class Meta:
         verbose_name = '浏览历史'         # 模型的可读名称
         verbose_name_plural = verbose_name  # 复数形式的可读名称
-        ordering = ['-browse_time']        # 默认按浏览时间倒序排列
\ No newline at end of file
+        ordering = ['-browse_time']        # 默认按浏览时间倒序排列
+        indexes = [
+            # 个人中心浏览历史：按用户筛选、浏览时间倒序
+            models.Index(fields=['user', '-browse_time'], name='ticket_browse_user_idx'),
+        ]
+
+# 搜索索引模型，倒排索引的一条记录：某个文档包含某个词条
+# 由ticket.search模块维护，景点、资讯、留言、用户保存或删除时通过信号同步
+class SearchEntry(models.Model):
+    # 文档类型，如spot、news、comment、user
+    doc_type = models.CharField(max_length=20, verbose_name='文档类型')
+    # 文档对应记录的ID
+    object_id = models.PositiveBigIntegerField(verbose_name='记录ID')
+    # 词条：中文连续的一到三个字、英文单词和数字的前缀
+    term = models.CharField(max_length=20, verbose_name='词条')
+    # 词条权重：各字段中出现次数乘以字段权重之和，用于相关度排序
+    weight = models.PositiveIntegerField(default=1, verbose_name='权重')
+    # 显式定义objects管理器，解决IDE警告
+    objects = models.Manager()
+
+    # 模型元数据配置
+    class Meta:
+        verbose_name = '搜索索引'         # 模型的可读名称
+        verbose_name_plural = verbose_name  # 复数形式的可读名称
+        indexes = [
+            # 按词条查找文档，同一词条内按权重倒序，单个词条的搜索直接按索引顺序取前几条
+            models.Index(fields=['doc_type', 'term', '-weight', 'object_id'], name='ticket_search_term_idx'),
+            # 更新或删除文档时按文档查找它的所有词条；多个词条的搜索按文档和词条逐个检查候选文档，包含权重避免回表
+            models.Index(fields=['doc_type', 'object_id', 'term', 'weight'], name='ticket_search_object_idx'),
+        ]
\ No newline at end of file
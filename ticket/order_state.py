@@ -0,0 +1,180 @@
+import logging
+
+from django.db import transaction
+from django.utils import timezone
+
+from . import inventory
+from .models import Order, StockHold
+
+# 配置日志记录
+logger = logging.getLogger(__name__)
+
+
+# =======================
+# 订单状态机
+# =======================
+# 所有订单状态变更都必须经过本模块，不再在视图中读取status判断后save()。
+# 每个状态变更都是带条件的 UPDATE ... WHERE id IN (...) AND status = 原状态，
+# 只有仍处于原状态的订单会被更新，并发的重复操作不会让订单两次变更。
+# 同一批订单的库存变化按(门票类型, 日期)合并，与状态更新在同一个事务中完成：
+#   pay            待支付 → 已支付        增加已售数量，删除库存预占
+#   cancel         待支付 → 已取消        归还剩余库存，删除库存预占
+#   request_refund 已支付 → 退款审核中    无库存变化
+#   approve_refund 退款审核中 → 已退款    归还剩余库存并扣回已售数量
+#   reject_refund  退款审核中 → 已支付    无库存变化
+
+# 订单状态，与Order.STATUS_CHOICES一致
+PENDING = 0
+PAID = 1
+CANCELLED = 2
+USED = 3
+REFUNDED = 4
+REFUND_REVIEW = 5
+
+# 动作: (原状态, 目标状态, 自动记录当前时间的字段)
+TRANSITIONS = {
+    'pay': (PENDING, PAID, 'payment_time'),
+    'cancel': (PENDING, CANCELLED, None),
+    'request_refund': (PAID, REFUND_REVIEW, 'refund_apply_time'),
+    'approve_refund': (REFUND_REVIEW, REFUNDED, 'refund_audit_time'),
+    'reject_refund': (REFUND_REVIEW, PAID, 'refund_audit_time'),
+}
+
+# 执行状态变更需要读取的订单字段
+ROW_FIELDS = ('id', 'status', 'ticket_type', 'use_date', 'quantity')
+
+
+class TransitionConflict(Exception):
+    """已锁定的订单状态与预期不符，整批回滚"""
+
+
+def _get_transition(action):
+    try:
+        return TRANSITIONS[action]
+    except KeyError:
+        raise ValueError(f'未知的订单状态变更: {action}')
+
+
+def update_status(order_ids, action, now=None, **fields):
+    """
+    带条件地更新订单状态：只更新仍处于原状态的订单
+
+    Args:
+        order_ids: 订单ID列表
+        action: 状态变更动作，TRANSITIONS中的键
+        now: 当前时间，默认timezone.now()
+        **fields: 同时更新的其他字段，如payment_method、refund_reason，可以是F()表达式
+
+    Returns:
+        int: 更新的订单数
+    """
+    source, target, time_field = _get_transition(action)
+    now = now or timezone.now()
+    if time_field:
+        fields.setdefault(time_field, now)
+    return Order.objects.filter(id__in=order_ids, status=source).update(status=target, updated_at=now, **fields)
+
+
+def apply_effects(action, orders):
+    """
+    执行一批订单状态变更带来的库存变化，必须与状态更新在同一个事务中调用
+
+    Args:
+        action: 状态变更动作
+        orders: 已完成状态变更的订单，需要有ROW_FIELDS中的字段
+    """
+    _get_transition(action)
+    stock_items = [
+        (order.ticket_type_id, order.use_date, order.quantity)
+        for order in orders
+        if order.ticket_type_id and order.use_date
+    ]
+    if action == 'pay':
+        # 确认库存：增加已售数量，剩余库存已在下单时预占
+        inventory.commit_stock_batch(stock_items)
+    elif action == 'cancel':
+        # 归还下单时预占的库存
+        inventory.release_stock_batch(stock_items)
+    elif action == 'approve_refund':
+        # 归还库存并扣回已售数量
+        inventory.release_stock_batch(stock_items, committed=True)
+
+    if action in ('pay', 'cancel'):
+        # 订单不再待支付，删除库存预占记录
+        StockHold.objects.filter(order_id__in=[order.id for order in orders]).delete()
+
+
+def apply_transition(orders, action, now=None, **fields):
+    """
+    对一批已锁定的订单执行状态变更和库存变化
+
+    Args:
+        orders: 已用select_for_update锁定、处于原状态的Order对象列表
+        action: 状态变更动作
+        now: 当前时间
+        **fields: 同时更新的其他字段
+
+    Raises:
+        TransitionConflict: 有订单已不在原状态
+    """
+    if not orders:
+        return
+    updated = update_status([order.id for order in orders], action, now=now, **fields)
+    if updated != len(orders):
+        raise TransitionConflict(f'{action}: 预期更新{len(orders)}个订单，实际更新{updated}个')
+    apply_effects(action, orders)
+
+
+def iter_transition(orders, action, batch_size=500, now=None, **fields):
+    """
+    按批执行状态变更，每批一个事务，适合数量很大的批量操作
+
+    每批按ID顺序锁定一批处于原状态的订单，带条件更新状态并合并执行库存变化。
+    调用方已开启事务时，每批作为其中的保存点。
+
+    Args:
+        orders: 要变更的订单QuerySet（调用方负责按用户、景点等限定范围）
+        action: 状态变更动作
+        batch_size: 每批订单数
+        now: 当前时间，默认timezone.now()
+        **fields: 同时更新的其他字段
+
+    Yields:
+        list: 每批完成变更的订单ID
+    """
+    source = _get_transition(action)[0]
+    now = now or timezone.now()
+    last_id = 0
+    while True:
+        with transaction.atomic():
+            batch = list(
+                orders.filter(status=source, id__gt=last_id)
+                .select_for_update(of=('self',))
+                .only(*ROW_FIELDS)
+                .order_by('id')[:batch_size]
+            )
+            apply_transition(batch, action, now=now, **fields)
+        if not batch:
+            return
+        last_id = batch[-1].id
+        logger.info(f"订单状态变更: 动作={action}, 订单数={len(batch)}")
+        yield [order.id for order in batch]
+        if len(batch) < batch_size:
+            return
+
+
+def transition(orders, action, now=None, **fields):
+    """
+    在一个事务中对一批订单执行状态变更
+
+    Args:
+        orders: 要变更的订单QuerySet
+        action: 状态变更动作
+        now: 当前时间
+        **fields: 同时更新的其他字段
+
+    Returns:
+        list: 完成变更的订单ID，不在原状态的订单不会出现在结果中
+    """
+    with transaction.atomic():
+        return [order_id for batch in iter_transition(orders, action, now=now, **fields) for order_id in batch]
@@ -0,0 +1,249 @@
+import hashlib
+import hmac
+import json
+import logging
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import payments
+from .models import Order, PaymentNotification
+
+# 配置日志记录
+logger = logging.getLogger(__name__)
+
+
+# =======================
+# 支付回调处理
+# =======================
+# 支付平台的回调分两步处理，回调请求不等待订单确认：
+#   1. 接收：payment_callback视图校验签名和内容后写入PaymentNotification表（一条INSERT）立即返回，
+#      支付流水号有唯一约束，重复回调被忽略
+#   2. 处理：process_payment_notifications命令批量读取待处理通知，
+#      在一个事务中通过payments.settle_orders确认所有订单
+# 结算按支付流水号幂等：通知只会处理一次，订单已用同一流水号支付时视为成功。
+#
+# 回调内容（JSON）：
+#   {"payment_serial": "...", "payment_method": "alipay", "order_numbers": ["ORD..."], "amount": "99.00"}
+# 签名：请求头 X-Payment-Signature = HMAC-SHA256(PAYMENT_CALLBACK_SECRET, 请求体) 的十六进制字符串
+
+SIGNATURE_HEADER = 'HTTP_X_PAYMENT_SIGNATURE'
+
+# 单个通知最多包含的订单数
+MAX_ORDERS_PER_NOTIFICATION = 100
+
+
+class InvalidNotification(Exception):
+    """回调内容格式错误"""
+
+
+def sign(body):
+    """
+    计算回调请求体的签名
+
+    Args:
+        body: 请求体，bytes
+
+    Returns:
+        str: 十六进制签名
+
+    Raises:
+        ImproperlyConfigured: 未设置PAYMENT_CALLBACK_SECRET
+    """
+    if not settings.PAYMENT_CALLBACK_SECRET:
+        raise ImproperlyConfigured('未设置PAYMENT_CALLBACK_SECRET环境变量')
+    return hmac.new(settings.PAYMENT_CALLBACK_SECRET.encode(), body, hashlib.sha256).hexdigest()
+
+
+def verify(body, signature):
+    """校验回调签名，使用常量时间比较；未设置签名密钥时拒绝所有回调"""
+    if not settings.PAYMENT_CALLBACK_SECRET:
+        logger.error("未设置PAYMENT_CALLBACK_SECRET环境变量，拒绝支付回调")
+        return False
+    return bool(signature) and hmac.compare_digest(sign(body), signature)
+
+
+def parse(body):
+    """
+    解析并校验回调内容
+
+    Args:
+        body: 请求体，bytes
+
+    Returns:
+        dict: 校验后的回调内容
+
+    Raises:
+        InvalidNotification: 内容格式错误
+    """
+    try:
+        data = json.loads(body)
+    except (TypeError, ValueError):
+        raise InvalidNotification('请求体不是有效的JSON')
+    if not isinstance(data, dict):
+        raise InvalidNotification('请求体必须是JSON对象')
+
+    payment_serial = data.get('payment_serial')
+    if not isinstance(payment_serial, str) or not 0 < len(payment_serial) <= 100:
+        raise InvalidNotification('payment_serial无效')
+
+    payment_method = data.get('payment_method')
+    if not isinstance(payment_method, str) or not 0 < len(payment_method) <= 50:
+        raise InvalidNotification('payment_method无效')
+
+    order_numbers = data.get('order_numbers')
+    if (
+        not isinstance(order_numbers, list)
+        or not 0 < len(order_numbers) <= MAX_ORDERS_PER_NOTIFICATION
+        or not all(isinstance(number, str) and number for number in order_numbers)
+    ):
+        raise InvalidNotification('order_numbers无效')
+
+    try:
+        amount = Decimal(str(data.get('amount')))
+    except InvalidOperation:
+        raise InvalidNotification('amount无效')
+    if not amount.is_finite() or amount < 0:
+        raise InvalidNotification('amount无效')
+
+    return {
+        'payment_serial': payment_serial,
+        'payment_method': payment_method,
+        'order_numbers': list(dict.fromkeys(order_numbers)),
+        'amount': amount,
+        'payload': data,
+    }
+
+
+def ingest(notification):
+    """
+    保存一条已校验的回调，同一支付流水号的重复回调被忽略
+
+    Args:
+        notification: parse()的返回值
+    """
+    PaymentNotification.objects.bulk_create(
+        [PaymentNotification(**notification)], ignore_conflicts=True
+    )
+
+
+def _settle_notifications(notifications, now):
+    """
+    确认一批已锁定通知中的订单并更新通知状态，返回(成功数, 失败数)
+    """
+    order_numbers = {number for notification in notifications for number in notification.order_numbers}
+    orders = {
+        order_number: (order_id, total_price)
+        for order_number, order_id, total_price in Order.objects.filter(
+            order_number__in=order_numbers
+        ).values_list('order_number', 'id', 'total_price')
+    }
+
+    # 先校验订单是否存在和金额，合格通知的所有订单一起结算
+    items = []
+    errors = {}
+    # 每个通知的结算结果在items中的起止位置
+    spans = {}
+    for notification in notifications:
+        missing = [number for number in notification.order_numbers if number not in orders]
+        if missing:
+            errors[notification.id] = f"订单不存在: {', '.join(missing)}"
+            continue
+        total = sum(orders[number][1] for number in notification.order_numbers)
+        if total != notification.amount:
+            errors[notification.id] = f'支付金额{notification.amount}与订单金额{total}不符'
+            continue
+        start = len(items)
+        items.extend(
+            (orders[number][0], notification.payment_method, notification.payment_serial)
+            for number in notification.order_numbers
+        )
+        spans[notification.id] = (start, len(items))
+
+    results = payments.settle_orders(items) if items else []
+
+    succeeded = []
+    for notification in notifications:
+        error = errors.get(notification.id)
+        if error is None:
+            start, end = spans[notification.id]
+            order_errors = [
+                f'{number}: {result.message}'
+                for number, result in zip(notification.order_numbers, results[start:end])
+                if not result.paid
+            ]
+            # 部分订单已取消或已用其他流水号支付，需要人工退款
+            error = '; '.join(order_errors)
+        if error:
+            # 失败的通知很少，逐条记录原因
+            logger.warning(f"支付通知处理失败: 流水号={notification.payment_serial}, 原因={error}")
+            PaymentNotification.objects.filter(id=notification.id).update(
+                status=2, error=error, attempts=F('attempts') + 1, processed_at=now,
+            )
+        else:
+            succeeded.append(notification.id)
+
+    if succeeded:
+        PaymentNotification.objects.filter(id__in=succeeded).update(
+            status=1, error='', attempts=F('attempts') + 1, processed_at=now,
+        )
+    return len(succeeded), len(notifications) - len(succeeded)
+
+
+def _lock_pending(queryset, limit):
+    # 跳过其他任务已锁定的通知，多个处理任务可以并行运行
+    return list(queryset.select_for_update(skip_locked=True).filter(status=0).order_by('id')[:limit])
+
+
+def process_batch(batch_size=None, now=None):
+    """
+    处理一批待处理的支付通知
+
+    整批在一个事务中结算；出现意外错误时整批回滚，再逐条处理，
+    出错的通知记录错误并在下一批重试，超过PAYMENT_NOTIFICATION_MAX_ATTEMPTS次后标记为处理失败。
+
+    Args:
+        batch_size: 每批数量，默认为settings.PAYMENT_NOTIFICATION_BATCH_SIZE
+        now: 当前时间，默认为timezone.now()
+
+    Returns:
+        dict: {'claimed': 读取的通知数, 'processed': 处理成功数, 'failed': 处理失败数}
+    """
+    batch_size = batch_size or getattr(settings, 'PAYMENT_NOTIFICATION_BATCH_SIZE', 200)
+    now = now or timezone.now()
+
+    try:
+        with transaction.atomic():
+            notifications = _lock_pending(PaymentNotification.objects.all(), batch_size)
+            processed, failed = _settle_notifications(notifications, now) if notifications else (0, 0)
+        return {'claimed': len(notifications), 'processed': processed, 'failed': failed}
+    except Exception:
+        logger.exception('批量处理支付通知出错，改为逐条处理')
+
+    counts = {'claimed': 0, 'processed': 0, 'failed': 0}
+    max_attempts = getattr(settings, 'PAYMENT_NOTIFICATION_MAX_ATTEMPTS', 5)
+    pending_ids = list(
+        PaymentNotification.objects.filter(status=0).order_by('id').values_list('id', flat=True)[:batch_size]
+    )
+    for notification_id in pending_ids:
+        try:
+            with transaction.atomic():
+                notifications = _lock_pending(PaymentNotification.objects.filter(id=notification_id), 1)
+                if not notifications:
+                    continue
+                processed, failed = _settle_notifications(notifications, now)
+        except Exception as e:
+            logger.exception(f"处理支付通知出错: ID={notification_id}")
+            PaymentNotification.objects.filter(id=notification_id).update(attempts=F('attempts') + 1, error=str(e))
+            PaymentNotification.objects.filter(id=notification_id, attempts__gte=max_attempts).update(status=2)
+            counts['claimed'] += 1
+            counts['failed'] += 1
+            continue
+        counts['claimed'] += 1
+        counts['processed'] += processed
+        counts['failed'] += failed
+    return counts
@@ -0,0 +1,144 @@
+import logging
+from collections import defaultdict
+
+from django.db import transaction
+from django.utils import timezone
+
+from . import id_generator, order_state
+from .models import Order
+
+# 配置日志记录
+logger = logging.getLogger(__name__)
+
+
+# =======================
+# 批量支付确认
+# =======================
+# 一次支付多个订单在一个事务中完成，查询次数与订单数量无关：
+#   1. 一条 SELECT ... FOR UPDATE 按ID顺序锁定所有订单，避免与过期清理、取消订单并发修改
+#   2. 同一笔支付（相同支付方式和流水号）的订单通过order_state用一条带条件的UPDATE标记为已支付
+#   3. 已售数量按(门票类型, 日期)合并，每组一条F()表达式UPDATE，一条DELETE删除库存预占记录
+# 不能支付的订单（不存在、不属于当前用户、状态不是待支付）逐个记录原因，不影响其他订单。
+
+# 失败原因代码
+REASON_NOT_FOUND = 'not_found'
+REASON_NOT_PENDING = 'not_pending'
+
+
+class PaymentResult:
+    """
+    单个订单的支付结果
+
+    Attributes:
+        order_id: 订单ID
+        order: Order对象，订单不存在时为None
+        paid: 是否支付成功
+        reason: 失败原因代码，成功时为None
+        message: 提示信息
+    """
+
+    def __init__(self, order_id, order=None, paid=False, reason=None, message=''):
+        self.order_id = order_id
+        self.order = order
+        self.paid = paid
+        self.reason = reason
+        self.message = message
+
+
+def _parse_order_ids(order_ids):
+    """去重并保持提交顺序，返回(有效的整数ID列表, 无效ID的失败结果)"""
+    ordered_ids = []
+    invalid = []
+    for order_id in order_ids:
+        try:
+            order_id = int(order_id)
+        except (TypeError, ValueError):
+            invalid.append(PaymentResult(order_id, reason=REASON_NOT_FOUND, message='订单不存在或已被删除'))
+        else:
+            if order_id not in ordered_ids:
+                ordered_ids.append(order_id)
+    return ordered_ids, invalid
+
+
+def settle_orders(items, user=None):
+    """
+    在一个事务中确认一批订单的支付，每个订单可以有各自的支付方式和支付流水号
+
+    传入支付流水号时按流水号幂等：订单已用同一流水号支付过，视为支付成功，不再重复确认库存。
+
+    Args:
+        items: [(订单ID, 支付方式, 支付流水号)] 列表
+        user: 订单所属用户，传入时只能支付该用户的订单
+
+    Returns:
+        list: PaymentResult列表，与items一一对应
+    """
+    results = []
+    paid_orders = []
+    with transaction.atomic():
+        orders = Order.objects.select_for_update(of=('self',)).filter(
+            id__in=[order_id for order_id, _, _ in items]
+        )
+        if user is not None:
+            orders = orders.filter(user=user)
+        orders = {order.id: order for order in orders.order_by('id')}
+
+        now = timezone.now()
+        for order_id, payment_method, payment_serial in items:
+            order = orders.get(order_id)
+            if order is None:
+                results.append(PaymentResult(order_id, reason=REASON_NOT_FOUND, message='订单不存在或您没有权限操作'))
+            elif order.status == order_state.PAID and payment_serial and order.payment_serial == payment_serial:
+                # 同一笔支付的重复通知
+                results.append(PaymentResult(order_id, order, paid=True, message='订单已支付'))
+            elif order.status != order_state.PENDING:
+                results.append(PaymentResult(
+                    order_id, order, reason=REASON_NOT_PENDING,
+                    message=f'订单状态为{order.get_status_display()}，不能支付',
+                ))
+            else:
+                order.status = order_state.PAID  # 更新订单状态为已支付
+                order.payment_method = payment_method
+                order.payment_time = now
+                order.payment_serial = payment_serial
+                order.updated_at = now
+                paid_orders.append(order)
+                results.append(PaymentResult(order_id, order, paid=True, message='支付成功'))
+
+        if paid_orders:
+            # 按支付分组，每笔支付一条UPDATE（bulk_update的CASE语句随行数增长很慢）
+            payments = defaultdict(list)
+            for order in paid_orders:
+                payments[(order.payment_method, order.payment_serial)].append(order.id)
+            for (payment_method, payment_serial), order_ids in payments.items():
+                updated = order_state.update_status(
+                    order_ids, 'pay', now=now, payment_method=payment_method, payment_serial=payment_serial,
+                )
+                if updated != len(order_ids):
+                    raise order_state.TransitionConflict(f'pay: 预期更新{len(order_ids)}个订单，实际更新{updated}个')
+            # 确认库存并删除库存预占记录
+            order_state.apply_effects('pay', paid_orders)
+
+    logger.info(
+        f"批量支付: 成功={[order.id for order in paid_orders]}, "
+        f"失败={[(result.order_id, result.reason) for result in results if not result.paid]}"
+    )
+    return results
+
+
+def confirm_orders(order_ids, payment_method, user=None):
+    """
+    确认支付一批订单，所有订单属于同一笔支付，使用同一个支付流水号
+
+    Args:
+        order_ids: 订单ID列表，可以是字符串，重复的ID只处理一次
+        payment_method: 支付方式
+        user: 订单所属用户，传入时只能支付该用户的订单
+
+    Returns:
+        list: PaymentResult列表，无效ID在前，其余顺序与order_ids一致
+    """
+    ordered_ids, invalid = _parse_order_ids(order_ids)
+    # 生成支付流水号（按时间递增，不会重复）
+    payment_serial = id_generator.new_payment_serial()
+    return invalid + settle_orders([(order_id, payment_method, payment_serial) for order_id in ordered_ids], user=user)
@@ -0,0 +1,120 @@
+import logging
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Category, Region
+
+# 配置日志记录
+logger = logging.getLogger(__name__)
+
+
+# =======================
+# 地区、分类参考数据缓存
+# =======================
+# 地区和分类数据量小、很少修改，却几乎每个列表页和表单都要读取。
+# 每个进程在内存中保存一份快照（按名称排序的Region、Category列表），首次使用时从数据库加载，之后直接返回：
+#   地区、分类通过save()/delete()修改时，signals在事务提交后更新缓存中的版本号，
+#   各进程读取时发现版本号与快照不同就重新加载；
+#   超过REFDATA_TTL_SECONDS秒也重新加载，兜底版本号被淘汰或缓存未在进程间共享的情况。
+# 快照中的对象由所有请求共享，只能读取，不能修改后保存；需要修改时按ID重新查询。
+
+VERSION_KEY = 'refdata:version'
+
+# 全国34个省级行政区，update_regions命令据此补齐地区数据
+PROVINCES = (
+    '北京市', '天津市', '河北省', '山西省', '内蒙古自治区',
+    '辽宁省', '吉林省', '黑龙江省', '上海市', '江苏省',
+    '浙江省', '安徽省', '福建省', '江西省', '山东省',
+    '河南省', '湖北省', '湖南省', '广东省', '广西壮族自治区',
+    '海南省', '重庆市', '四川省', '贵州省', '云南省',
+    '西藏自治区', '陕西省', '甘肃省', '青海省', '宁夏回族自治区',
+    '新疆维吾尔自治区', '香港特别行政区', '澳门特别行政区', '台湾省',
+)
+
+
+class Snapshot:
+    """
+    某一时刻的地区、分类数据，创建后不再修改
+
+    Args:
+        version: 加载时缓存中的版本号
+    """
+
+    def __init__(self, version):
+        self.version = version
+        self.loaded_at = time.monotonic()
+        self.regions = tuple(Region.objects.order_by('name'))
+        self.categories = tuple(Category.objects.order_by('name'))
+
+
+# 当前进程的快照，重新加载时整体替换，读取不需要加锁
+_snapshot = None
+_lock = threading.Lock()
+
+
+def _ttl_seconds():
+    return getattr(settings, 'REFDATA_TTL_SECONDS', 300)
+
+
+def _get_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # 并发初始化时只有一个值写入成功，以缓存中的值为准
+        cache.add(VERSION_KEY, uuid.uuid4().hex, None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def _get_snapshot():
+    global _snapshot
+    version = _get_version()
+    snapshot = _snapshot
+    if snapshot is not None and snapshot.version == version and time.monotonic() - snapshot.loaded_at < _ttl_seconds():
+        return snapshot
+    with _lock:
+        # 同时到达的请求只有第一个加载，其余等待后直接使用新快照
+        if _snapshot is snapshot:
+            _snapshot = Snapshot(version)
+            logger.info(f"加载地区分类数据: 地区数={len(_snapshot.regions)}, 分类数={len(_snapshot.categories)}")
+        return _snapshot
+
+
+def invalidate():
+    """地区或分类修改后使所有进程的快照失效，事务提交后生效"""
+    def bump():
+        global _snapshot
+        cache.set(VERSION_KEY, uuid.uuid4().hex, None)
+        # 缓存未在进程间共享时也保证本进程立即看到修改
+        _snapshot = None
+
+    transaction.on_commit(bump)
+
+
+def get_regions():
+    """
+    全部地区，按名称排序
+
+    Returns:
+        tuple: Region对象（只读）
+    """
+    return _get_snapshot().regions
+
+
+def get_categories():
+    """
+    全部景点分类，按名称排序
+
+    Returns:
+        tuple: Category对象（只读）
+    """
+    return _get_snapshot().categories
+
+
+def region_names():
+    """全部地区名称，按名称排序"""
+    return [region.name for region in get_regions()]
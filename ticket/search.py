@@ -0,0 +1,297 @@
+import logging
+import math
+import re
+import unicodedata
+from collections import Counter
+
+from django.conf import settings
+from django.db.models import Case, Count, F, FloatField, Q, Sum, Value, When
+
+from .models import News, ScenicSpot, ScenicSpotComment, SearchEntry, User
+
+# 配置日志记录
+logger = logging.getLogger(__name__)
+
+
+# =======================
+# 站内搜索
+# =======================
+# 搜索使用SearchEntry表中的倒排索引，代替对name、content等字段的 LIKE '%关键词%' 全表扫描：
+#   中文索引连续的一到三个字（n元组），搜索词按其中最长的n元组匹配，三个字以上按三元组匹配
+#   英文和数字按单词切分，索引单词的所有前缀（2个字符起），搜索词按前缀匹配
+#   用户名、邮箱需要按任意片段查找，这些文档类型的英文和数字也按一到三个字符的n元组索引，
+#   n元组命中后再用 icontains 在命中的少量记录中确认，结果与原来的 LIKE '%关键词%' 相同
+# 文档必须包含搜索词的所有词条才算命中，按 Σ 词条权重 × 逆文档频率 排序。
+# 各模型保存或删除时由signals同步索引；bulk_create、update()不触发信号，
+# 批量修改后需要运行 rebuild_search_index 命令重建。迁移0015为已有数据建立索引。
+
+# 中文字符（含扩展A区和兼容汉字）或连续的英文字母和数字
+_TOKEN_RE = re.compile(r'[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+|[0-9a-z]+')
+
+# 词条最大长度，与SearchEntry.term一致，更长的英文单词只索引前缀
+MAX_TERM_LENGTH = 20
+
+# 中文n元组的最大长度：三元组在百万级文档中仍然少见，多字搜索词只需检查少量候选文档
+NGRAM_SIZE = 3
+
+# 各文档类型的字段权重：名称、标题命中比正文命中排名更靠前
+# 文档类型: (模型, 预加载的关联字段, 返回[(文本, 权重)]的函数)
+DOCUMENT_TYPES = {
+    'spot': (
+        ScenicSpot, ('region',),
+        lambda spot: [(spot.name, 3), (spot.address, 1), (spot.region.name if spot.region else '', 1)],
+    ),
+    'news': (News, (), lambda news: [(news.title, 3), (news.content, 1)]),
+    'comment': (ScenicSpotComment, (), lambda comment: [(comment.content, 1)]),
+    'user': (User, (), lambda user: [(user.username, 3), (user.email, 1)]),
+}
+
+# 按任意片段匹配的文档类型及其确认用的字段，英文和数字也按n元组索引
+SUBSTRING_FIELDS = {
+    'user': ('username', 'email'),
+}
+
+
+def _runs(text):
+    # 统一全角半角和大小写后切分出中文片段和英文数字片段
+    return _TOKEN_RE.findall(unicodedata.normalize('NFKC', text or '').lower())
+
+
+def _is_cjk(run):
+    return not run[0].isascii()
+
+
+def tokenize(text, substrings=False):
+    """
+    切分文档文本，返回索引用的词条列表（可重复，重复次数即词频）
+
+    Args:
+        text: 文档文本
+        substrings: 英文和数字是否也按n元组切分
+
+    Returns:
+        list: 词条列表
+    """
+    terms = []
+    for run in _runs(text):
+        if substrings or _is_cjk(run):
+            for size in range(1, NGRAM_SIZE + 1):
+                terms.extend(run[i:i + size] for i in range(len(run) - size + 1))
+        elif len(run) == 1:
+            terms.append(run)
+        else:
+            terms.extend(run[:i] for i in range(2, min(len(run), MAX_TERM_LENGTH) + 1))
+    return terms
+
+
+def query_terms(query, substrings=False):
+    """
+    切分搜索词，返回去重后的词条列表
+
+    Args:
+        query: 搜索词
+        substrings: 英文和数字是否也按n元组切分，与tokenize一致
+
+    Returns:
+        list: 词条列表，搜索词中没有可检索的字符时为空
+    """
+    terms = []
+    for run in _runs(query):
+        if substrings or _is_cjk(run):
+            size = min(len(run), NGRAM_SIZE)
+            terms.extend(run[i:i + size] for i in range(len(run) - size + 1))
+        else:
+            terms.append(run[:MAX_TERM_LENGTH])
+    return list(dict.fromkeys(terms))
+
+
+def document_weights(doc_type, fields):
+    """
+    文档各词条的权重：各字段词频乘以字段权重后合并
+
+    Args:
+        doc_type: 文档类型
+        fields: [(文本, 字段权重)]
+
+    Returns:
+        Counter: {词条: 权重}
+    """
+    substrings = doc_type in SUBSTRING_FIELDS
+    weights = Counter()
+    for text, weight in fields:
+        for term, count in Counter(tokenize(text, substrings)).items():
+            weights[term] += count * weight
+    return weights
+
+
+def index_documents(doc_type, documents):
+    """
+    写入一批文档的索引，替换这些文档原有的索引
+
+    Args:
+        doc_type: 文档类型
+        documents: {记录ID: [(文本, 字段权重)]}
+    """
+    if not documents:
+        return
+    SearchEntry.objects.filter(doc_type=doc_type, object_id__in=list(documents)).delete()
+    SearchEntry.objects.bulk_create([
+        SearchEntry(doc_type=doc_type, object_id=object_id, term=term, weight=weight)
+        for object_id, fields in documents.items()
+        for term, weight in document_weights(doc_type, fields).items()
+    ], batch_size=1000)
+
+
+def remove_documents(doc_type, object_ids):
+    """删除一批文档的索引"""
+    SearchEntry.objects.filter(doc_type=doc_type, object_id__in=list(object_ids)).delete()
+
+
+def index_objects(doc_type, objects):
+    """
+    按DOCUMENT_TYPES中的字段写入一批模型对象的索引
+
+    Args:
+        doc_type: 文档类型
+        objects: 模型对象列表
+    """
+    fields = DOCUMENT_TYPES[doc_type][2]
+    index_documents(doc_type, {obj.id: fields(obj) for obj in objects})
+
+
+def rebuild(doc_type, batch_size=1000):
+    """
+    重建一种文档类型的全部索引
+
+    Args:
+        doc_type: 文档类型
+        batch_size: 每批读取的记录数
+
+    Returns:
+        int: 写入索引的记录数
+    """
+    model, related, _ = DOCUMENT_TYPES[doc_type]
+    SearchEntry.objects.filter(doc_type=doc_type).delete()
+    queryset = model.objects.select_related(*related).order_by('id')
+    last_id = 0
+    total = 0
+    while True:
+        batch = list(queryset.filter(id__gt=last_id)[:batch_size])
+        if not batch:
+            logger.info(f"重建搜索索引: 类型={doc_type}, 记录数={total}")
+            return total
+        index_objects(doc_type, batch)
+        total += len(batch)
+        last_id = batch[-1].id
+
+
+def _term_frequencies(doc_type, terms):
+    # 每个词条出现在多少个文档中（文档频率）
+    return dict(
+        SearchEntry.objects.filter(doc_type=doc_type, term__in=terms)
+        .order_by().values_list('term').annotate(count=Count('id'))
+    )
+
+
+def _candidates(doc_type, terms, frequencies):
+    # 只在最少见词条的文档中查找，需要检查的记录数取决于最少见的词条
+    rarest = min(terms, key=frequencies.get)
+    return SearchEntry.objects.filter(
+        doc_type=doc_type, term__in=terms,
+        object_id__in=SearchEntry.objects.filter(doc_type=doc_type, term=rarest).values('object_id'),
+    )
+
+
+def matching(doc_type, query):
+    """
+    包含搜索词所有词条的文档ID，用作 id__in 等条件的子查询，不排序不限制数量
+
+    Args:
+        doc_type: 文档类型
+        query: 搜索词
+
+    Returns:
+        QuerySet: 文档ID的值查询集
+    """
+    terms = query_terms(query, doc_type in SUBSTRING_FIELDS)
+    if not terms:
+        return SearchEntry.objects.none().values('object_id')
+    if len(terms) == 1:
+        matched = SearchEntry.objects.filter(doc_type=doc_type, term=terms[0]).values('object_id')
+    else:
+        matched = (
+            SearchEntry.objects.filter(doc_type=doc_type, term__in=terms)
+            .values('object_id').annotate(matched=Count('id')).filter(matched=len(terms))
+            .values('object_id')
+        )
+    if doc_type not in SUBSTRING_FIELDS:
+        return matched
+    # n元组都命中不代表整个搜索词连续出现，在命中的记录中按字段确认
+    contains = Q()
+    for field in SUBSTRING_FIELDS[doc_type]:
+        contains |= Q(**{f'{field}__icontains': query.strip()})
+    return DOCUMENT_TYPES[doc_type][0].objects.filter(contains, id__in=matched).values('id')
+
+
+def ranked(doc_type, query, within=None):
+    """
+    按相关度排序的文档ID查询集，不限制数量，可以直接分页（count()统计命中数，切片取一页）
+
+    Args:
+        doc_type: 文档类型
+        query: 搜索词
+        within: 只在这些记录ID中搜索（ID列表或值查询集），为None时不筛选
+
+    Returns:
+        QuerySet: 按相关度从高到低排列的object_id值查询集
+    """
+    terms = query_terms(query, doc_type in SUBSTRING_FIELDS)
+    if not terms:
+        return SearchEntry.objects.none().values_list('object_id', flat=True)
+
+    if len(terms) == 1:
+        # 单个词条：索引已按权重倒序，按索引顺序读取
+        entries = SearchEntry.objects.filter(doc_type=doc_type, term=terms[0])
+        if within is not None:
+            entries = entries.filter(object_id__in=within)
+        return entries.order_by('-weight', 'object_id').values_list('object_id', flat=True)
+
+    frequencies = _term_frequencies(doc_type, terms)
+    if len(frequencies) < len(terms):
+        # 有词条没有出现在任何文档中
+        return SearchEntry.objects.none().values_list('object_id', flat=True)
+    # 相对逆文档频率：越少见的词条权重越高，最常见的词条为1
+    most_common = max(frequencies.values())
+    idf = {term: 1 + math.log(most_common / count) for term, count in frequencies.items()}
+    score = Sum(
+        F('weight') * Case(
+            *[When(term=term, then=Value(value)) for term, value in idf.items()],
+            default=Value(0.0), output_field=FloatField(),
+        )
+    )
+    candidates = _candidates(doc_type, terms, frequencies)
+    if within is not None:
+        candidates = candidates.filter(object_id__in=within)
+    return (
+        candidates
+        .values('object_id').annotate(matched=Count('id'), score=score)
+        .filter(matched=len(terms)).order_by('-score', 'object_id')
+        .values_list('object_id', flat=True)
+    )
+
+
+def search(doc_type, query, limit=None, within=None):
+    """
+    按相关度排序搜索文档，返回前limit条
+
+    Args:
+        doc_type: 文档类型
+        query: 搜索词
+        limit: 最多返回的结果数，默认为settings.SEARCH_RESULT_LIMIT
+        within: 只在这些记录ID中搜索（ID列表或值查询集），先筛选再截取前limit条；为None时不筛选
+
+    Returns:
+        list: 按相关度从高到低排列的记录ID
+    """
+    limit = limit or getattr(settings, 'SEARCH_RESULT_LIMIT', 1000)
+    return list(ranked(doc_type, query, within=within)[:limit])
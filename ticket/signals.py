@@ -0,0 +1,216 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import autocomplete, facets, homepage, refdata, search, spot_detail, stock_calendar, tags
+from .models import Carousel, Category, DateStock, News, Region, ScenicSpot, ScenicSpotComment, TicketType, User
+
+
+# =======================
+# 月历库存缓存失效信号
+# =======================
+# 通过save()/delete()修改的DateStock和TicketType在这里使缓存失效；
+# inventory模块中F()表达式的UPDATE不触发信号，由inventory自行调用失效函数。
+
+@receiver([post_save, post_delete], sender=DateStock)
+def invalidate_date_stock_calendar(sender, instance, **kwargs):
+    spot_id = TicketType.objects.filter(id=instance.ticket_type_id).values_list('scenic_spot_id', flat=True).first()
+    if spot_id:
+        stock_calendar.invalidate_month(spot_id, instance.use_date)
+
+
+@receiver([post_save, post_delete], sender=TicketType)
+def invalidate_ticket_type_calendar(sender, instance, **kwargs):
+    stock_calendar.invalidate_spot(instance.scenic_spot_id)
+
+
+# =======================
+# 搜索索引同步信号
+# =======================
+# 通过save()/delete()修改的景点、资讯、留言、用户在这里同步SearchEntry；
+# 只更新了与搜索无关的字段（如登录时间）时跳过。
+
+# 各文档类型参与索引的字段
+SEARCH_FIELDS = {
+    'spot': {'name', 'address', 'region', 'region_id'},
+    'news': {'title', 'content'},
+    'comment': {'content'},
+    'user': {'username', 'email'},
+}
+
+SEARCH_MODELS = {ScenicSpot: 'spot', News: 'news', ScenicSpotComment: 'comment', User: 'user'}
+
+
+# 按模型分别注册：不指定sender的post_delete接收函数会让所有模型的批量删除逐条发送信号
+@receiver(post_save, sender=ScenicSpot)
+@receiver(post_save, sender=News)
+@receiver(post_save, sender=ScenicSpotComment)
+@receiver(post_save, sender=User)
+def update_search_index(sender, instance, update_fields=None, **kwargs):
+    doc_type = SEARCH_MODELS[sender]
+    if update_fields is not None and not SEARCH_FIELDS[doc_type] & set(update_fields):
+        return
+    search.index_objects(doc_type, [instance])
+
+
+@receiver(post_delete, sender=ScenicSpot)
+@receiver(post_delete, sender=News)
+@receiver(post_delete, sender=ScenicSpotComment)
+@receiver(post_delete, sender=User)
+def remove_search_index(sender, instance, **kwargs):
+    search.remove_documents(SEARCH_MODELS[sender], [instance.id])
+
+
+@receiver(post_save, sender=Region)
+def update_region_search_index(sender, instance, created, **kwargs):
+    # 地区名称参与景点索引，地区改名后重建该地区景点的索引
+    if not created:
+        search.index_objects('spot', list(instance.scenicspot_set.select_related('region')))
+
+
+
+# =======================
+# 景点自动补全索引同步信号
+# =======================
+# 只更新了与补全无关的字段时跳过；批量更新由自动补全索引定时重新加载同步。
+
+# 参与自动补全的字段：名称用于匹配，是否上架决定是否出现，是否热门和预约人数决定排名
+AUTOCOMPLETE_FIELDS = {'name', 'is_active', 'is_hot', 'booking_count'}
+
+
+@receiver(post_save, sender=ScenicSpot)
+def update_autocomplete_index(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and not AUTOCOMPLETE_FIELDS & set(update_fields):
+        return
+    autocomplete.update_spot(instance)
+
+
+@receiver(post_delete, sender=ScenicSpot)
+def remove_autocomplete_index(sender, instance, **kwargs):
+    autocomplete.remove_spot(instance.id)
+
+
+# =======================
+# 景点分面统计失效信号
+# =======================
+# 景点新增删除、地区或分类变化，地区改名删除时更新分面版本号；
+# 标签由ticket.tags批量修改，在tags模块中使分面统计失效。
+
+# 参与分面统计的景点字段
+FACET_FIELDS = {'region', 'region_id', 'category'}
+
+
+@receiver(post_save, sender=ScenicSpot)
+def invalidate_spot_facets(sender, instance, created, update_fields=None, **kwargs):
+    if not created and update_fields is not None and not FACET_FIELDS & set(update_fields):
+        return
+    facets.invalidate()
+
+
+@receiver(post_delete, sender=ScenicSpot)
+@receiver(post_save, sender=Region)
+@receiver(post_delete, sender=Region)
+def invalidate_facets(sender, **kwargs):
+    facets.invalidate()
+
+
+# =======================
+# 景点默认标签信号
+# =======================
+# 新建的景点带有默认标签，和原来ScenicSpot.tags字段的默认值一样；
+# 后台表单随后按录入的标签调用set_spot_tags替换。bulk_create不触发信号，不添加默认标签。
+
+@receiver(post_save, sender=ScenicSpot)
+def add_default_spot_tags(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        tags.set_spot_tags(instance, tags.DEFAULT_TAGS)
+
+
+# =======================
+# 首页片段缓存失效信号
+# =======================
+# 只使受影响的首页区域失效。修改已有的资讯、景点时无法得知修改前是否在首页展示
+# （公告改为资讯、热门景点取消热门），这时按可能受影响的区域处理。
+
+# 首页展示的景点字段：热门景点区域展示这些字段，轮播图区域展示名称和简介
+HOMEPAGE_SPOT_FIELDS = {'name', 'description', 'image', 'category', 'rating', 'booking_count', 'price', 'is_hot'}
+
+
+@receiver([post_save, post_delete], sender=Carousel)
+def invalidate_homepage_carousels(sender, **kwargs):
+    homepage.invalidate('carousels')
+
+
+@receiver(post_save, sender=News)
+def invalidate_homepage_news(sender, instance, created, **kwargs):
+    if created:
+        homepage.invalidate(homepage.news_section(instance))
+    else:
+        # 可能修改了是否为公告，公告和资讯区域都失效
+        homepage.invalidate('announcements', 'news')
+
+
+@receiver(post_delete, sender=News)
+def remove_homepage_news(sender, instance, **kwargs):
+    homepage.invalidate(homepage.news_section(instance))
+
+
+@receiver(post_save, sender=ScenicSpot)
+def invalidate_homepage_spot(sender, instance, created, update_fields=None, **kwargs):
+    if update_fields is not None and not HOMEPAGE_SPOT_FIELDS & set(update_fields):
+        return
+    sections = []
+    # 新增的非热门景点不会出现在首页；已有景点可能刚取消热门
+    if instance.is_hot or not created:
+        sections.append('hot_spots')
+    if not created and Carousel.objects.filter(scenic_spot=instance, is_active=True).exists():
+        sections.append('carousels')
+    if sections:
+        homepage.invalidate(*sections)
+
+
+@receiver(post_delete, sender=ScenicSpot)
+def remove_homepage_spot(sender, instance, **kwargs):
+    # 景点的轮播图级联删除，由轮播图的信号处理
+    if instance.is_hot:
+        homepage.invalidate('hot_spots')
+
+
+# =======================
+# 景点详情缓存失效信号
+# =======================
+# 景点修改删除、留言新增回复删除、留言用户改名换头像时使景点详情缓存失效；
+# 标签由ticket.tags批量修改，在tags模块中使详情缓存失效。
+
+# 景点详情页展示的留言用户字段
+SPOT_DETAIL_USER_FIELDS = {'username', 'avatar'}
+
+
+@receiver([post_save, post_delete], sender=ScenicSpot)
+def invalidate_spot_detail(sender, instance, **kwargs):
+    spot_detail.invalidate_spots([instance.id])
+
+
+@receiver([post_save, post_delete], sender=ScenicSpotComment)
+def invalidate_comment_spot_detail(sender, instance, **kwargs):
+    spot_detail.invalidate_spots([instance.scenic_spot_id])
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_comment_spot_details(sender, instance, created, update_fields=None, **kwargs):
+    if created or update_fields is not None and not SPOT_DETAIL_USER_FIELDS & set(update_fields):
+        return
+    spot_detail.invalidate_spots(
+        ScenicSpotComment.objects.filter(user=instance).values_list('scenic_spot_id', flat=True).distinct()
+    )
+
+
+# =======================
+# 地区、分类参考数据失效信号
+# =======================
+# 地区、分类通过save()/delete()修改后，各进程在下一次读取时重新加载。
+
+
+@receiver([post_save, post_delete], sender=Region)
+@receiver([post_save, post_delete], sender=Category)
+def invalidate_refdata(sender, **kwargs):
+    refdata.invalidate()
\ No newline at end of file
@@ -0,0 +1,156 @@
+import logging
+import threading
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from . import tags
+from .models import ScenicSpot, ScenicSpotComment
+
+# 配置日志记录
+logger = logging.getLogger(__name__)
+
+
+# =======================
+# 景点详情对象缓存
+# =======================
+# 景点详情页需要的景点、标签、留言整体缓存，缓存键包含两个版本号：
+#   景点版本：景点修改删除、标签变化、留言新增回复删除、留言用户改名换头像时更新
+#   全局版本：批量移除标签等影响大量景点的修改时更新
+# 写入时（signals模块和tags模块）更新版本号，详情页只在缓存未命中时查询数据库。
+# 版本号使用随机值而不是自增计数，版本键被淘汰后也不会与旧缓存重名。
+# 命中、未命中次数按进程统计，每LOG_INTERVAL次查询记录一次日志。
+
+CACHE_PREFIX = 'spot_detail'
+
+GLOBAL_VERSION_KEY = f'{CACHE_PREFIX}:version'
+
+# 每多少次查询记录一次命中率
+LOG_INTERVAL = 1000
+
+# 留言只读取详情页展示的字段，缓存中不保存用户的其他信息（如密码哈希）
+COMMENT_FIELDS = ('content', 'reply', 'reply_time', 'is_replied', 'created_at', 'user__username', 'user__avatar')
+
+# 当前进程的命中、未命中次数
+_stats = {'hits': 0, 'misses': 0}
+_stats_lock = threading.Lock()
+
+
+def _spot_version_key(spot_id):
+    return f'{CACHE_PREFIX}:version:{spot_id}'
+
+
+def _get_versions(*keys):
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            # 并发初始化时只有一个值写入成功，以缓存中的值为准
+            cache.add(key, uuid.uuid4().hex, None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def _bump(keys):
+    # 事务提交后再更新版本号，避免其他请求在提交前用旧数据重建缓存
+    transaction.on_commit(lambda: cache.set_many({key: uuid.uuid4().hex for key in keys}, None))
+
+
+def invalidate_spots(spot_ids):
+    """
+    使景点的详情缓存失效，事务提交后生效
+
+    Args:
+        spot_ids: 景点ID列表
+    """
+    keys = [_spot_version_key(spot_id) for spot_id in set(spot_ids)]
+    if keys:
+        _bump(keys)
+
+
+def invalidate_all():
+    """使所有景点的详情缓存失效，事务提交后生效"""
+    _bump([GLOBAL_VERSION_KEY])
+
+
+def _record(hit):
+    with _stats_lock:
+        _stats['hits' if hit else 'misses'] += 1
+        total = _stats['hits'] + _stats['misses']
+        hits = _stats['hits']
+    if total % LOG_INTERVAL == 0:
+        logger.info(f"景点详情缓存: 查询={total}, 命中={hits}, 命中率={hits / total:.1%}")
+
+
+def get_stats():
+    """
+    当前进程的景点详情缓存命中统计
+
+    Returns:
+        dict: {'hits': 命中次数, 'misses': 未命中次数, 'hit_rate': 命中率}
+    """
+    with _stats_lock:
+        hits, misses = _stats['hits'], _stats['misses']
+    return {'hits': hits, 'misses': misses, 'hit_rate': hits / (hits + misses) if hits + misses else 0.0}
+
+
+def reset_stats():
+    """清零当前进程的命中统计"""
+    with _stats_lock:
+        _stats['hits'] = _stats['misses'] = 0
+
+
+def get_version(spot_id):
+    """
+    景点详情当前的版本号，景点、标签、留言变化后改变，不查询数据库
+
+    Args:
+        spot_id: 景点ID
+
+    Returns:
+        str: 全局版本号和景点版本号
+    """
+    global_version, spot_version = _get_versions(GLOBAL_VERSION_KEY, _spot_version_key(spot_id))
+    return f'{global_version}:{spot_version}'
+
+
+def get_timeout():
+    """景点详情缓存和留言列表片段缓存的过期时间（秒）"""
+    return getattr(settings, 'SPOT_DETAIL_CACHE_TIMEOUT', 600)
+
+
+def _load(spot_id):
+    spot = ScenicSpot.objects.filter(id=spot_id).prefetch_related(tags.TAG_PREFETCH).first()
+    if spot is None:
+        return None
+    comments = (
+        ScenicSpotComment.objects.filter(scenic_spot=spot).select_related('user')
+        .only(*COMMENT_FIELDS).order_by('-created_at')
+    )
+    return {'spot': spot, 'tags_list': tags.tag_names(spot), 'comments': list(comments)}
+
+
+def get_detail(spot_id):
+    """
+    获取景点详情页的数据，优先读取缓存
+
+    Args:
+        spot_id: 景点ID
+
+    Returns:
+        dict: {'spot': ScenicSpot, 'tags_list': [标签名称], 'comments': [ScenicSpotComment], 'version': 版本号}，
+              留言按创建时间倒序排列；景点不存在时为None（不缓存）
+    """
+    version = get_version(spot_id)
+    key = f'{CACHE_PREFIX}:{spot_id}:{version}'
+
+    detail = cache.get(key)
+    _record(detail is not None)
+    if detail is None:
+        detail = _load(spot_id)
+        if detail is None:
+            return None
+        cache.set(key, detail, get_timeout())
+    # 模板中留言列表的片段缓存使用同样的版本号
+    return {**detail, 'version': version}
@@ -0,0 +1,124 @@
+import calendar
+import logging
+import uuid
+from datetime import date
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import TicketType
+
+# 配置日志记录
+logger = logging.getLogger(__name__)
+
+
+# =======================
+# 月历库存缓存
+# =======================
+# 景点每个月的 门票类型 × 日期 剩余库存表格整体缓存，缓存键包含两个版本号：
+#   景点版本：门票类型新增、修改、删除时更新（名称、价格、默认库存、上下架都会影响表格）
+#   月份版本：该景点在该月任一天的DateStock变化时更新
+# 版本号变化后旧缓存不再被读取，等待自然过期，不需要逐个删除。
+# 版本号使用随机值而不是自增计数，版本键被淘汰后也不会与旧缓存重名。
+# DateStock的库存扣减使用F()表达式UPDATE，不触发模型信号，由inventory模块显式调用失效函数。
+
+CACHE_PREFIX = 'stock_calendar'
+
+
+def _spot_version_key(spot_id):
+    return f'{CACHE_PREFIX}:spot:{spot_id}'
+
+
+def _month_version_key(spot_id, year, month):
+    return f'{CACHE_PREFIX}:month:{spot_id}:{year}-{month:02d}'
+
+
+def _get_versions(*keys):
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            # 并发初始化时只有一个值写入成功，以缓存中的值为准
+            cache.add(key, uuid.uuid4().hex, None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def _bump(key):
+    # 事务提交后再更新版本号，避免其他请求在提交前用旧数据重建缓存
+    transaction.on_commit(lambda: cache.set(key, uuid.uuid4().hex, None))
+
+
+def invalidate_month(spot_id, use_date):
+    """
+    DateStock变化后使该景点对应月份的月历缓存失效
+
+    Args:
+        spot_id: 景点ID
+        use_date: 发生变化的日期，date对象或"YYYY-MM-DD"字符串
+    """
+    if isinstance(use_date, str):
+        use_date = date.fromisoformat(use_date)
+    _bump(_month_version_key(spot_id, use_date.year, use_date.month))
+
+
+def invalidate_spot(spot_id):
+    """
+    门票类型变化后使该景点所有月份的月历缓存失效
+
+    Args:
+        spot_id: 景点ID
+    """
+    _bump(_spot_version_key(spot_id))
+
+
+def _build_month_grid(spot_id, year, month):
+    # 延迟导入，inventory模块在顶层导入了本模块
+    from .inventory import get_stock_calendar
+
+    days_in_month = calendar.monthrange(year, month)[1]
+    first_day = date(year, month, 1)
+    last_day = date(year, month, days_in_month)
+
+    ticket_types = TicketType.objects.filter(scenic_spot_id=spot_id, is_active=True).order_by('type', 'price', 'id')
+    stocks = get_stock_calendar(ticket_types, first_day, last_day)
+    return {
+        'month': f'{year}-{month:02d}',
+        'days': [first_day.replace(day=day).strftime('%Y-%m-%d') for day in range(1, days_in_month + 1)],
+        'ticket_types': [
+            {
+                'id': ticket_type.id,
+                'name': ticket_type.name,
+                'type': ticket_type.type,
+                'price': str(ticket_type.price),
+                # 按日期顺序排列的剩余库存
+                'stocks': list(stocks.get(ticket_type.id, {}).values()),
+            }
+            for ticket_type in ticket_types
+        ],
+    }
+
+
+def get_month_grid(spot_id, year, month):
+    """
+    获取景点某月的库存表格，优先读取缓存
+
+    Args:
+        spot_id: 景点ID
+        year: 年份
+        month: 月份
+
+    Returns:
+        dict: {'month': 'YYYY-MM', 'days': [日期字符串], 'ticket_types': [{门票类型信息, 'stocks': [每天剩余库存]}]}
+    """
+    spot_version, month_version = _get_versions(
+        _spot_version_key(spot_id), _month_version_key(spot_id, year, month)
+    )
+    key = f'{CACHE_PREFIX}:grid:{spot_id}:{year}-{month:02d}:{spot_version}:{month_version}'
+
+    grid = cache.get(key)
+    if grid is None:
+        grid = _build_month_grid(spot_id, year, month)
+        cache.set(key, grid, getattr(settings, 'STOCK_CALENDAR_CACHE_SECONDS', 300))
+        logger.info(f"重建月历库存缓存: 景点={spot_id}, 月份={grid['month']}")
+    return grid
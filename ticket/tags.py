@@ -0,0 +1,152 @@
+import logging
+
+from django.db import transaction
+from django.db.models import Count
+
+from . import facets, spot_detail
+from .models import ScenicSpotTag, Tag
+
+# 配置日志记录
+logger = logging.getLogger(__name__)
+
+
+# =======================
+# 景点标签
+# =======================
+# 标签保存在Tag表中，景点通过ScenicSpotTag关联，position保持录入顺序。
+# 按标签筛选和统计各标签的景点数都在数据库中完成，使用ScenicSpotTag的(tag, scenic_spot)索引。
+# 列表页读取标签时使用 prefetch_related(TAG_PREFETCH)，一次查询取出当前页所有景点的标签。
+# 这里的批量写入不触发模型信号，修改后调用facets.invalidate()使分面统计失效，
+# 并使相关景点的详情缓存失效。
+
+# 预加载景点标签的关联路径，ScenicSpotTag默认按position排序
+TAG_PREFETCH = 'tag_links__tag'
+
+# 标签名称最大长度，与Tag.name一致
+MAX_TAG_LENGTH = 50
+
+# 新建景点的默认标签，与原来ScenicSpot.tags字段的默认值一致；录入了标签时由set_spot_tags替换
+DEFAULT_TAGS = ['热门']
+
+
+def parse_tags(text):
+    """
+    解析表单中逗号分隔的标签（中英文逗号均可）
+
+    Args:
+        text: 标签字符串
+
+    Returns:
+        list: 去掉空白和重复后的标签名称，保持原有顺序
+    """
+    names = [name.strip()[:MAX_TAG_LENGTH] for name in (text or '').replace('，', ',').split(',')]
+    return list(dict.fromkeys(name for name in names if name))
+
+
+def tag_names(spot):
+    """
+    景点的标签名称，按录入顺序排列；已预加载TAG_PREFETCH时不再查询数据库
+
+    Args:
+        spot: ScenicSpot对象
+
+    Returns:
+        list: 标签名称
+    """
+    return [link.tag.name for link in spot.tag_links.all()]
+
+
+def set_spot_tags(spot, names):
+    """
+    替换景点的全部标签，不存在的标签自动创建
+
+    Args:
+        spot: ScenicSpot对象
+        names: 标签名称列表，按顺序保存
+    """
+    names = list(dict.fromkeys(names))
+    with transaction.atomic():
+        # 并发创建同名标签时忽略唯一约束冲突，随后统一按名称读取ID
+        Tag.objects.bulk_create([Tag(name=name) for name in names], ignore_conflicts=True)
+        tag_ids = dict(Tag.objects.filter(name__in=names).values_list('name', 'id'))
+        ScenicSpotTag.objects.filter(scenic_spot=spot).delete()
+        ScenicSpotTag.objects.bulk_create([
+            ScenicSpotTag(scenic_spot=spot, tag_id=tag_ids[name], position=position)
+            for position, name in enumerate(names)
+        ])
+    # 批量写入不触发模型信号，显式使分面统计和景点详情缓存失效
+    facets.invalidate()
+    spot_detail.invalidate_spots([spot.id])
+
+
+def filter_by_tag(spots, name):
+    """
+    筛选带有某个标签的景点
+
+    Args:
+        spots: ScenicSpot查询集
+        name: 标签名称
+
+    Returns:
+        QuerySet: 筛选后的查询集
+    """
+    return spots.filter(tag_links__tag__name=name)
+
+
+def tag_counts(spots=None):
+    """
+    按标签分组统计景点数，只访问标签关联表
+
+    Args:
+        spots: ScenicSpot查询集，只统计其中的景点；为None时统计全部景点
+
+    Returns:
+        QuerySet: [{'tag_id': 标签ID, 'count': 景点数}]，按景点数从多到少排序
+    """
+    links = ScenicSpotTag.objects.all()
+    if spots is not None:
+        links = links.filter(scenic_spot__in=spots.order_by().values('id'))
+    # 按tag_id分组，不连接Tag表：连接后SQLite会逐个标签在IN列表中查找，景点多时慢得多
+    return links.values('tag_id').annotate(count=Count('id')).order_by('-count', 'tag_id')
+
+
+def tag_facets(spots=None, limit=None):
+    """
+    统计各标签的景点数，用于标签筛选项
+
+    Args:
+        spots: ScenicSpot查询集，只统计其中的景点；为None时统计全部景点
+        limit: 最多返回的标签数，为None时返回全部
+
+    Returns:
+        list: [{'name': 标签名称, 'count': 景点数}]，按景点数从多到少排序
+    """
+    counts = tag_counts(spots)
+    if limit is not None:
+        counts = counts[:limit]
+    counts = list(counts)
+    names = dict(Tag.objects.filter(id__in=[row['tag_id'] for row in counts]).values_list('id', 'name'))
+    return [{'name': names[row['tag_id']], 'count': row['count']} for row in counts if row['tag_id'] in names]
+
+
+def remove_tags(names):
+    """
+    从所有景点中移除标签并删除标签本身，每个标签一条DELETE，不逐个保存景点
+
+    Args:
+        names: 标签名称列表
+
+    Returns:
+        dict: {标签名称: 移除的景点数}，不存在的标签不包含在内
+    """
+    removed = {}
+    for tag_id, name in Tag.objects.filter(name__in=names).values_list('id', 'name'):
+        # 删除标签时级联删除关联记录：ScenicSpotTag没有信号和下级关联，按tag_id一条DELETE完成
+        _, deleted = Tag.objects.filter(id=tag_id).delete()
+        removed[name] = deleted.get(ScenicSpotTag._meta.label, 0)
+        logger.info(f"移除景点标签: 标签={name}, 景点数={removed[name]}")
+    if removed:
+        facets.invalidate()
+        # 可能涉及大量景点，更新全局版本号使所有景点详情缓存失效
+        spot_detail.invalidate_all()
+    return removed
@@ -1,3 +1,1169 @@
-from django.test import TestCase
+import json
+import threading
+import time
+import uuid
+from datetime import date, datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock, skipIf
 
-# Create your tests here.
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import (
+    autocomplete, facets, id_generator, idempotency, inventory, order_state, payment_notifications, payments, search,
+    spot_detail, tags, weather_api,
+)
+from .models import (
+    BrowseHistory, Carousel, Cart, Collection, DateStock, IdGeneratorNode, News, Order, PaymentNotification, Region,
+    ScenicSpot, ScenicSpotComment, ScenicSpotTag, StockHold, Tag, TicketType, User,
+)
+
+
+# =======================
+# 库存读取查询次数
+# =======================
+# 景点的门票类型越多，库存读取的查询次数也不能增加：
+# 先统计只有1个门票类型时的查询次数，再断言有多个门票类型时查询次数相同。
+
+@override_settings(WAITING_ROOM={'ENABLED': False})
+class StockQueryCountTests(TestCase):
+    # 对比的门票类型数量
+    MANY = 20
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='stock-query', email='stock-query@example.com', password=None)
+        self.client.force_login(self.user)
+        self.use_date = date.today() + timedelta(days=1)
+
+    def _create_spot(self, size):
+        # 创建包含size个门票类型的景点，一半门票类型带有日期库存记录
+        spot = ScenicSpot.objects.create(
+            name=f'查询数景点{size}', description='test', price=0, image='test.jpg', address='test', opening_hours='',
+        )
+        for i in range(size):
+            ticket_type = TicketType.objects.create(scenic_spot=spot, name=f'门票{i}', price=0, stock=100)
+            if i % 2 == 0:
+                inventory.set_date_stock(ticket_type, self.use_date, 50)
+        return spot
+
+    def _assert_constant(self, read):
+        """
+        断言read在1个和MANY个门票类型的景点上执行相同次数的查询
+
+        Args:
+            read: 参数为景点的函数
+        """
+        one, many = self._create_spot(1), self._create_spot(self.MANY)
+        with CaptureQueriesContext(connection) as context:
+            read(one)
+        with self.assertNumQueries(len(context.captured_queries)):
+            read(many)
+
+    def _ticket_types(self, spot):
+        return TicketType.objects.filter(scenic_spot=spot, is_active=True)
+
+    def test_with_date_stock(self):
+        self._assert_constant(lambda spot: list(inventory.with_date_stock(self._ticket_types(spot), self.use_date)))
+
+    def test_stock_calendar(self):
+        end_date = self.use_date + timedelta(days=30)
+        self._assert_constant(
+            lambda spot: inventory.get_stock_calendar(self._ticket_types(spot), self.use_date, end_date)
+        )
+
+    def test_get_ticket_stocks_for_date(self):
+        url = reverse('ticket:get_ticket_stocks')
+        self._assert_constant(lambda spot: self.client.get(url, {'date': self.use_date, 'spot_id': spot.id}))
+
+    def test_get_ticket_stocks_for_range(self):
+        url = reverse('ticket:get_ticket_stocks')
+        end_date = self.use_date + timedelta(days=30)
+        self._assert_constant(
+            lambda spot: self.client.get(url, {'start_date': self.use_date, 'end_date': end_date, 'spot_id': spot.id})
+        )
+
+    def test_buy_ticket_page(self):
+        self._assert_constant(lambda spot: self.client.get(reverse('ticket:buy_ticket', args=[spot.id])))
+
+
+# =======================
+# 订单号节点ID租约
+# =======================
+# 节点ID租约在调用方事务之外提交，使用TransactionTestCase，测试不在事务中执行。
+
+class NodeLeaseTests(TransactionTestCase):
+
+    def test_processes_get_distinct_node_ids(self):
+        leases = [id_generator.NodeLease() for _ in range(5)]
+        self.assertEqual(len({lease.node_id for lease in leases}), 5)
+
+    def test_released_node_id_is_reused(self):
+        lease = id_generator.NodeLease()
+        lease.release()
+        self.assertFalse(lease.is_valid())
+        self.assertEqual(id_generator.NodeLease().node_id, lease.node_id)
+
+    def test_expired_lease_is_taken_over(self):
+        lease = id_generator.NodeLease()
+        other = id_generator.NodeLease()
+        IdGeneratorNode.objects.filter(node_id=lease.node_id).update(expires_at=timezone.now() - timedelta(seconds=1))
+        successor = id_generator.NodeLease()
+        self.assertEqual(successor.node_id, lease.node_id)
+        # 被接管的进程续期失败，其他租约不受影响
+        self.assertFalse(lease.renew())
+        self.assertTrue(other.renew())
+
+    def test_generator_claims_a_new_node_id_after_the_lease_expires(self):
+        try:
+            first = id_generator.get_generator()
+            id_generator._lease.valid_until = 0
+            second = id_generator.get_generator()
+            # 旧租约在数据库中过期之前仍被占用，新生成器使用另一个节点ID
+            self.assertNotEqual(first.node_id, second.node_id)
+        finally:
+            id_generator.release_node_id()
+
+    def test_lease_claimed_in_a_rolled_back_transaction_is_discarded(self):
+        try:
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                id_generator.get_generator()
+                lease = id_generator._lease
+                # 事务提交前只在本事务中有效
+                self.assertTrue(lease.is_valid())
+                raise RuntimeError
+            self.assertFalse(lease.is_valid())
+            self.assertFalse(IdGeneratorNode.objects.exists())
+            id_generator.get_generator()
+            self.assertIsNot(id_generator._lease, lease)
+            self.assertTrue(IdGeneratorNode.objects.filter(node_id=id_generator._lease.node_id).exists())
+        finally:
+            id_generator.release_node_id()
+
+
+# =======================
+# 热点查询的执行计划
+# =======================
+# 生成分布在多个用户、景点、状态上的数据并更新统计信息，对视图中每个热点查询执行EXPLAIN，
+# 有查询全表扫描时失败。新增热点查询时在_hot_queries中补充。
+# MySQL的ANALYZE TABLE会隐式提交事务，使用TransactionTestCase。
+
+class QueryPlanTests(TransactionTestCase):
+    USERS = 20
+    SPOTS = 200
+    ORDERS = 5000
+
+    def setUp(self):
+        self.users, self.spots, self.ticket_types, self.spot_tags = self._seed()
+        self._analyze()
+
+    def _seed(self):
+        # 生成分布在多个用户、景点、状态上的数据，让优化器看到真实的选择性
+        users = [
+            User.objects.create_user(
+                username=f'plan-check-{i}', email=f'plan-check-{i}@example.com', password=None,
+            )
+            for i in range(self.USERS)
+        ]
+        ScenicSpot.objects.bulk_create([
+            ScenicSpot(
+                name=f'查询计划景点{i}', description='test', price=0, image='test.jpg',
+                address='test', opening_hours='', admin=users[i % len(users)], is_hot=i % 5 == 0,
+            )
+            for i in range(self.SPOTS)
+        ], batch_size=500)
+        # MySQL的bulk_create不返回自增ID，重新读取
+        spots = list(ScenicSpot.objects.filter(name__startswith='查询计划景点').order_by('id'))
+        TicketType.objects.bulk_create([
+            TicketType(scenic_spot=spot, name=f'门票{i}', price=10, stock=100, is_active=i != 2)
+            for spot in spots for i in range(3)
+        ], batch_size=500)
+        ticket_types = list(TicketType.objects.filter(scenic_spot__in=spots).select_related('scenic_spot'))
+        use_date = date.today() + timedelta(days=1)
+        DateStock.objects.bulk_create([
+            DateStock(ticket_type=ticket_type, use_date=use_date + timedelta(days=day), stock=100)
+            for ticket_type in ticket_types for day in range(7)
+        ], batch_size=500)
+        Order.objects.bulk_create([
+            Order(
+                user=users[i % len(users)], scenic_spot=ticket_types[i % len(ticket_types)].scenic_spot,
+                ticket_type=ticket_types[i % len(ticket_types)], use_date=use_date, quantity=1,
+                total_price=10, status=i % 6, order_number=f'PLAN{i:08d}',
+            )
+            for i in range(self.ORDERS)
+        ], batch_size=500)
+        ScenicSpotComment.objects.bulk_create([
+            ScenicSpotComment(
+                scenic_spot=spots[i % len(spots)], user=users[i % len(users)], content='test', is_replied=i % 3 == 0,
+            )
+            for i in range(self.ORDERS // 2)
+        ], batch_size=500)
+        BrowseHistory.objects.bulk_create([
+            BrowseHistory(scenic_spot=spots[i % len(spots)], user=users[i % len(users)])
+            for i in range(self.ORDERS // 2)
+        ], batch_size=500)
+        Collection.objects.bulk_create([
+            Collection(user=user, scenic_spot=spot) for user in users for spot in spots[::2]
+        ], batch_size=500)
+        Cart.objects.bulk_create([
+            Cart(user=user, scenic_spot=spot, ticket_type=ticket_types[0], use_date=use_date)
+            for user in users for spot in spots[:3]
+        ], batch_size=500)
+        # 每个景点两个标签，标签之间的景点数不同
+        Tag.objects.bulk_create([Tag(name=f'plan-check-{i}') for i in range(10)])
+        spot_tags = list(Tag.objects.filter(name__startswith='plan-check-').order_by('name'))
+        ScenicSpotTag.objects.bulk_create([
+            ScenicSpotTag(scenic_spot=spot, tag=spot_tags[(i * i + offset) % len(spot_tags)], position=offset)
+            for i, spot in enumerate(spots) for offset in range(2)
+        ], batch_size=500)
+        News.objects.bulk_create([
+            News(title='plan-check', content='test', is_announcement=i % 4 == 0)
+            for i in range(self.ORDERS // 10)
+        ], batch_size=500)
+        return users, spots, ticket_types, spot_tags
+
+    @staticmethod
+    def _analyze():
+        # 更新统计信息，优化器按新数据的分布选择执行计划
+        tables = [
+            model._meta.db_table for model in (
+                BrowseHistory, Carousel, Cart, Collection, DateStock, News, Order, PaymentNotification,
+                ScenicSpot, ScenicSpotComment, ScenicSpotTag, StockHold, Tag, TicketType,
+            )
+        ]
+        with connection.cursor() as cursor:
+            if connection.vendor == 'mysql':
+                cursor.execute('ANALYZE TABLE ' + ', '.join(connection.ops.quote_name(table) for table in tables))
+                cursor.fetchall()
+            else:
+                for table in tables:
+                    cursor.execute('ANALYZE ' + connection.ops.quote_name(table))
+
+    def _hot_queries(self):
+        users, spots, ticket_types, spot_tags = self.users, self.spots, self.ticket_types, self.spot_tags
+        # 与视图中的查询条件和排序保持一致，新增热点查询时在这里补充；
+        # 视图中用于count()和aggregate()的查询不排序，这里用order_by()去掉默认排序
+        user = users[0]
+        admin_spot_ids = ScenicSpot.objects.filter(admin=user).values_list('id', flat=True)
+        spot = spots[0]
+        now = timezone.now()
+        day_start = timezone.make_aware(datetime.combine(date.today(), datetime.min.time()))
+        day_end = day_start + timedelta(days=1)
+        return [
+            # 首页
+            ('index: announcements', News.objects.filter(is_announcement=True).order_by('-created_at')[:3]),
+            ('index: latest news', News.objects.filter(is_announcement=False).order_by('-created_at')[:4]),
+            ('index: hot spots', ScenicSpot.objects.filter(is_hot=True).order_by('-created_at')[:6]),
+            ('news_list: all', News.objects.all().order_by('-created_at')[:10]),
+            # 景点列表的标签筛选和各标签景点数
+            (
+                'scenic_spots: by tag',
+                tags.filter_by_tag(ScenicSpot.objects.order_by('id'), spot_tags[0].name)[:9],
+            ),
+            ('scenic_spots: tag facets', tags.tag_counts()[:20]),
+            (
+                'scenic_spots: tag facets by tag',
+                tags.tag_counts(tags.filter_by_tag(ScenicSpot.objects.all(), spot_tags[0].name))[:20],
+            ),
+            ('spot_detail: tags', ScenicSpotTag.objects.filter(scenic_spot=spot).select_related('tag')),
+            # 景点详情、购票
+            ('spot_detail: ticket types', TicketType.objects.filter(scenic_spot=spot, is_active=True)),
+            ('spot_detail: comments', ScenicSpotComment.objects.filter(scenic_spot=spot).order_by('-created_at')),
+            (
+                'buy_ticket: date stock',
+                DateStock.objects.filter(ticket_type=ticket_types[0], use_date=date.today() + timedelta(days=1)),
+            ),
+            # 个人中心
+            ('profile: orders', Order.objects.filter(user=user).order_by('-created_at')[:10]),
+            (
+                'profile: favorites',
+                Collection.objects.filter(user=user).select_related('scenic_spot').order_by('-created_at'),
+            ),
+            (
+                'profile: browse history',
+                BrowseHistory.objects.filter(user=user).select_related('scenic_spot').order_by('-browse_time'),
+            ),
+            (
+                'profile: comments',
+                ScenicSpotComment.objects.filter(user=user).select_related('scenic_spot').order_by('-created_at'),
+            ),
+            ('cart', Cart.objects.filter(user=user)),
+            # 景点管理员后台
+            ('scenic_admin: spots', ScenicSpot.objects.filter(admin=user).order_by('-created_at')),
+            (
+                'scenic_admin: ticket types',
+                TicketType.objects.filter(scenic_spot__id__in=admin_spot_ids).order_by('-created_at'),
+            ),
+            (
+                'scenic_admin: orders',
+                Order.objects.filter(scenic_spot__id__in=admin_spot_ids).order_by('-created_at')[:10],
+            ),
+            (
+                'scenic_admin: orders by status',
+                Order.objects.filter(scenic_spot__id__in=admin_spot_ids, status=1).order_by('-created_at')[:10],
+            ),
+            (
+                'scenic_admin: daily orders',
+                Order.objects.filter(
+                    scenic_spot__id__in=admin_spot_ids, created_at__gte=day_start, created_at__lt=day_end,
+                ).order_by(),
+            ),
+            (
+                'scenic_admin: comments',
+                ScenicSpotComment.objects.filter(scenic_spot__id__in=admin_spot_ids).order_by('-created_at')[:10],
+            ),
+            ('scenic_admin: visits', BrowseHistory.objects.filter(scenic_spot__id__in=admin_spot_ids).order_by()),
+            (
+                'scenic_admin: refund review',
+                Order.objects.filter(scenic_spot=spot, status=5).order_by('id')[:500],
+            ),
+            # 平台管理员后台
+            (
+                'admin_index: today orders',
+                Order.objects.filter(created_at__gte=day_start, created_at__lt=day_end).order_by(),
+            ),
+            ('admin_index: recent orders', Order.objects.order_by('-created_at')[:2]),
+            ('admin_index: paid orders', Order.objects.filter(status=1).order_by()),
+            (
+                'admin_index: pending comments',
+                ScenicSpotComment.objects.filter(is_replied=False).order_by('-created_at')[:2],
+            ),
+            (
+                'admin: orders',
+                Order.objects.select_related('user', 'scenic_spot', 'ticket_type').order_by('-created_at')[:10],
+            ),
+            (
+                'admin: orders by status',
+                Order.objects.select_related('user', 'scenic_spot', 'ticket_type')
+                .filter(status=0).order_by('-created_at')[:10],
+            ),
+            (
+                'admin: comments',
+                ScenicSpotComment.objects.select_related('user', 'scenic_spot').order_by('-created_at')[:10],
+            ),
+            (
+                'admin: comments by reply',
+                ScenicSpotComment.objects.select_related('user', 'scenic_spot')
+                .filter(is_replied=True).order_by('-created_at')[:10],
+            ),
+            # 后台任务
+            ('release_expired_holds', StockHold.objects.filter(expires_at__lte=now).order_by('expires_at')[:500]),
+            (
+                'process_payment_notifications',
+                PaymentNotification.objects.filter(status=0).order_by('id')[:200],
+            ),
+        ]
+
+    def _explain(self, queryset):
+        """
+        执行EXPLAIN
+
+        Returns:
+            tuple: (执行计划文本, 全表扫描的表)
+        """
+        sql, params = queryset.query.get_compiler(using=queryset.db).as_sql()
+        # 按索引顺序扫描整个表只有带LIMIT（取前N条）时才会提前结束
+        limited = queryset.query.high_mark is not None
+        full_scans = []
+        lines = []
+        with connection.cursor() as cursor:
+            if connection.vendor == 'sqlite':
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+                for row in cursor.fetchall():
+                    detail = row[-1]
+                    lines.append(detail)
+                    # SCAN 表名 不带USING INDEX即为全表扫描；带USING INDEX但没有LIMIT时同样读取全部行
+                    if detail.startswith('SCAN ') and (' USING ' not in detail or not limited):
+                        full_scans.append(detail.split()[1])
+            elif connection.vendor == 'mysql':
+                cursor.execute('EXPLAIN ' + sql, params)
+                columns = [column[0] for column in cursor.description]
+                for row in cursor.fetchall():
+                    row = dict(zip(columns, row))
+                    lines.append(
+                        f"{row['table']}: type={row['type']} key={row['key']} rows={row['rows']} {row['Extra'] or ''}"
+                    )
+                    # type=ALL 为全表扫描，type=index 为全索引扫描（没有LIMIT时读取全部行）
+                    if row['type'] == 'ALL' or (row['type'] == 'index' and not limited):
+                        full_scans.append(row['table'])
+            else:
+                cursor.execute('EXPLAIN ' + sql, params)
+                for (detail,) in cursor.fetchall():
+                    lines.append(detail)
+                    if 'Seq Scan on ' in detail:
+                        full_scans.append(detail.split('Seq Scan on ')[1].split()[0])
+        return '\n'.join(lines), full_scans
+
+    def test_hot_queries_use_an_index(self):
+        for name, queryset in self._hot_queries():
+            with self.subTest(name):
+                plan, full_scans = self._explain(queryset)
+                self.assertFalse(full_scans, f"全表扫描: {', '.join(full_scans)}\n{plan}")
+
+
+# =======================
+# 站内搜索
+# =======================
+# 用户名、邮箱按任意片段匹配，与原来的 icontains 结果相同；
+# 景点列表按相关度排序的全部结果在数据库中分页，列表与分面统计的是同一组景点。
+
+class SearchTests(TestCase):
+
+    def test_user_matches_any_substring(self):
+        user = User.objects.create_user(username='zhangsan2024', email='traveler@example.com', password=None)
+        User.objects.create_user(username='lisi', email='lisi@example.org', password=None)
+        for query in ('zhangsan2024', 'ngsan', '2024', 'avele', 'R@EXAMPLE.C'):
+            with self.subTest(query=query):
+                self.assertEqual(list(search.matching('user', query)), [{'id': user.id}])
+        # n元组都出现但不连续时不匹配
+        self.assertEqual(list(search.matching('user', 'zhan2024')), [])
+
+    def test_listing_and_facets_count_the_same_matches(self):
+        # 执行事务提交后的回调，更新分面统计的版本号
+        with self.captureOnCommitCallbacks(execute=True):
+            east, west = Region.objects.create(name='东部'), Region.objects.create(name='西部')
+            for i in range(12):
+                ScenicSpot.objects.create(
+                    name=f'湖景{i}', description='test', price=0, image='test.jpg', address='test', opening_hours='',
+                    region=east if i < 11 else west,
+                )
+        # 结果数超过SEARCH_RESULT_LIMIT时，列表仍可翻到全部结果，与分面统计一致
+        with self.settings(SEARCH_RESULT_LIMIT=2):
+            response = self.client.get(reverse('ticket:scenic_spots'), {'search': '湖景'})
+            regions = {item['name']: item['count'] for item in response.context['regions']}
+            self.assertEqual(regions, {'东部': 11, '西部': 1})
+            self.assertEqual(response.context['spots'].paginator.count, 12)
+            response = self.client.get(reverse('ticket:scenic_spots'), {'search': '湖景', 'page': 2})
+            self.assertEqual(len(response.context['spots'].object_list), 3)
+            response = self.client.get(reverse('ticket:scenic_spots'), {'search': '湖景', 'region': '西部'})
+        self.assertEqual([spot.name for spot in response.context['spots'].object_list], ['湖景11'])
+
+
+# =======================
+# 订单测试数据
+# =======================
+
+class OrderFixtures:
+    """创建景点、门票类型和预占了库存的待支付订单"""
+
+    def _create_ticket_type(self, stock=10, shards=1):
+        spot = ScenicSpot.objects.create(
+            name='订单测试景点', description='test', price=0, image='test.jpg', address='test', opening_hours='',
+        )
+        return TicketType.objects.create(scenic_spot=spot, name='成人票', price=10, stock=stock, stock_shards=shards)
+
+    def _place_order(self, user, ticket_type, use_date, quantity=1):
+        # 与下单视图相同：先预占库存，再创建订单和库存预占记录
+        inventory.reserve_stock(ticket_type, use_date, quantity)
+        order = Order.objects.create(
+            user=user, scenic_spot=ticket_type.scenic_spot, ticket_type=ticket_type, use_date=use_date,
+            quantity=quantity, total_price=ticket_type.price * quantity, order_number=f'T{uuid.uuid4().hex[:20]}',
+        )
+        inventory.create_hold(order)
+        return order
+
+    def _totals(self, ticket_type, use_date):
+        return inventory.get_date_stock_totals(ticket_type, use_date)
+
+
+# =======================
+# 过期库存预占的释放
+# =======================
+# 清理任务与支付确认都先锁订单、再删除预占记录；正在支付的订单被跳过，不会被取消。
+
+class StockHoldReleaseTests(OrderFixtures, TransactionTestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='hold-release', email='hold@example.com', password=None)
+        self.ticket_type = self._create_ticket_type()
+        self.use_date = date.today() + timedelta(days=1)
+        self.order = self._place_order(self.user, self.ticket_type, self.use_date, quantity=2)
+        StockHold.objects.update(expires_at=timezone.now() - timedelta(minutes=1))
+
+    def _pay(self):
+        return payments.settle_orders([(self.order.id, 'alipay', 'HOLD-SERIAL')])[0]
+
+    def test_expired_pending_order_is_cancelled(self):
+        self.assertEqual(inventory.release_expired_holds(), (1, 1))
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, order_state.CANCELLED)
+        self.assertEqual(self._totals(self.ticket_type, self.use_date), {'stock': 10, 'sold': 0})
+        self.assertFalse(StockHold.objects.exists())
+
+    def test_order_paid_before_the_sweep_is_kept(self):
+        self.assertTrue(self._pay().paid)
+        self.assertEqual(inventory.release_expired_holds(), (0, 0))
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, order_state.PAID)
+        self.assertEqual(self._totals(self.ticket_type, self.use_date), {'stock': 8, 'sold': 2})
+
+    def test_order_cancelled_by_the_sweep_cannot_be_paid(self):
+        inventory.release_expired_holds()
+        result = self._pay()
+        self.assertFalse(result.paid)
+        self.assertEqual(result.reason, payments.REASON_NOT_PENDING)
+        self.assertEqual(self._totals(self.ticket_type, self.use_date), {'stock': 10, 'sold': 0})
+
+    @skipUnlessDBFeature('has_select_for_update_skip_locked')
+    def test_order_being_paid_is_skipped_by_the_sweep(self):
+        locked, proceed = threading.Event(), threading.Event()
+        results = []
+
+        def pay():
+            # 模拟支付确认：锁定订单后暂停，清理任务在此期间运行
+            try:
+                with transaction.atomic():
+                    list(Order.objects.select_for_update().filter(id=self.order.id))
+                    locked.set()
+                    proceed.wait(10)
+                    results.append(self._pay())
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=pay)
+        thread.start()
+        locked.wait(10)
+        try:
+            self.assertEqual(inventory.release_expired_holds(), (0, 0))
+        finally:
+            proceed.set()
+            thread.join()
+        self.assertTrue(results[0].paid)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, order_state.PAID)
+        self.assertEqual(self._totals(self.ticket_type, self.use_date), {'stock': 8, 'sold': 2})
+        self.assertFalse(StockHold.objects.exists())
+
+
+# =======================
+# 库存预占与确认
+# =======================
+# 库存扣减是带条件的单条UPDATE（stock >= 数量），库存为0时不能再预占；
+# 批量预占中库存不足的项不扣减，调用方事务回滚时全部预占一起撤销。
+
+class InventoryTests(OrderFixtures, TestCase):
+
+    def setUp(self):
+        self.use_date = date.today() + timedelta(days=1)
+
+    def test_reserve_stops_at_zero_stock(self):
+        ticket_type = self._create_ticket_type(stock=2)
+        inventory.reserve_stock(ticket_type, self.use_date, 2)
+        with self.assertRaises(inventory.InsufficientStockError) as context:
+            inventory.reserve_stock(ticket_type, self.use_date, 1)
+        self.assertEqual(context.exception.available, 0)
+        self.assertEqual(self._totals(ticket_type, self.use_date), {'stock': 0, 'sold': 0})
+
+    def test_sharded_reserve_combines_shards_and_stops_at_zero(self):
+        # 4张库存拆为2、1、1三个分片，任何一个分片都不够3张
+        ticket_type = self._create_ticket_type(stock=4, shards=3)
+        inventory.reserve_stock(ticket_type, self.use_date, 3)
+        with self.assertRaises(inventory.InsufficientStockError):
+            inventory.reserve_stock(ticket_type, self.use_date, 2)
+        inventory.reserve_stock(ticket_type, self.use_date, 1)
+        self.assertEqual(self._totals(ticket_type, self.use_date), {'stock': 0, 'sold': 0})
+        self.assertFalse(DateStock.objects.filter(ticket_type=ticket_type, stock__lt=0).exists())
+
+    def test_update_falls_back_to_shard_zero(self):
+        # 日期库存只有0号分片（分片数调大后尚未重新拆分的日期）
+        ticket_type = self._create_ticket_type(stock=10)
+        inventory.reserve_stock(ticket_type, self.use_date, 3)
+        TicketType.objects.filter(id=ticket_type.id).update(stock_shards=4)
+        items = [(ticket_type.id, self.use_date, 3)]
+        with mock.patch('ticket.inventory.random.randrange', return_value=3):
+            inventory.commit_stock_batch(items)
+            inventory.release_stock_batch([(ticket_type.id, self.use_date, 1)], committed=True)
+        self.assertEqual(self._totals(ticket_type, self.use_date), {'stock': 8, 'sold': 2})
+        self.assertEqual(DateStock.objects.filter(ticket_type=ticket_type).count(), 1)
+
+    def test_batch_skips_the_line_without_stock(self):
+        first, second = self._create_ticket_type(stock=5), self._create_ticket_type(stock=1)
+        results = inventory.reserve_stock_batch([
+            (first, self.use_date, 2), (second, self.use_date, 2), (first, self.use_date, 3), (first, self.use_date, 1),
+        ])
+        self.assertIsNone(results[0])
+        self.assertIsInstance(results[1], inventory.InsufficientStockError)
+        self.assertIsNone(results[2])
+        # 同一门票类型的前两项已用完库存
+        self.assertIsInstance(results[3], inventory.InsufficientStockError)
+        self.assertEqual(self._totals(first, self.use_date)['stock'], 0)
+        self.assertEqual(self._totals(second, self.use_date)['stock'], 1)
+
+    def test_batch_is_rolled_back_with_the_transaction(self):
+        first, second = self._create_ticket_type(stock=5), self._create_ticket_type(stock=5)
+        inventory.reserve_stock(first, self.use_date, 1)
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            inventory.reserve_stock_batch([(first, self.use_date, 2), (second, self.use_date, 2)])
+            raise RuntimeError
+        self.assertEqual(self._totals(first, self.use_date)['stock'], 4)
+        self.assertEqual(self._totals(second, self.use_date), None)
+
+
+# =======================
+# 下单幂等键
+# =======================
+
+class IdempotencyTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='idem-a', email='idem-a@example.com', password=None)
+        self.other = User.objects.create_user(username='idem-b', email='idem-b@example.com', password=None)
+
+    def test_repeated_key_is_a_replay(self):
+        record, first = idempotency.claim(self.user, 'same-key', 'buy_now')
+        idempotency.complete(record, [1])
+        replay, first_again = idempotency.claim(self.user, 'same-key', 'buy_now')
+        self.assertTrue(first)
+        self.assertFalse(first_again)
+        self.assertEqual(replay.order_ids, [1])
+
+    def test_key_is_scoped_to_user_and_endpoint(self):
+        idempotency.claim(self.user, 'same-key', 'buy_now')
+        for user, endpoint in ((self.other, 'buy_now'), (self.user, 'cart')):
+            with self.subTest(user=user.username, endpoint=endpoint):
+                record, first = idempotency.claim(user, 'same-key', endpoint)
+                self.assertTrue(first)
+                self.assertEqual((record.user, record.endpoint), (user, endpoint))
+
+
+# =======================
+# 支付回调
+# =======================
+# 回调先校验签名再写入通知队列，由process_batch批量结算。
+# 同一流水号的通知只结算一次；订单已支付或已取消时通知标记为处理失败，订单和库存不变。
+
+@override_settings(PAYMENT_CALLBACK_SECRET='test-callback-secret')
+class PaymentCallbackTests(OrderFixtures, TransactionTestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='callback', email='callback@example.com', password=None)
+        self.ticket_type = self._create_ticket_type()
+        self.use_date = date.today() + timedelta(days=1)
+        self.order = self._place_order(self.user, self.ticket_type, self.use_date, quantity=2)
+
+    def _post(self, payment_serial, signature=None):
+        body = json.dumps({
+            'payment_serial': payment_serial, 'payment_method': 'alipay',
+            'order_numbers': [self.order.order_number], 'amount': str(self.order.total_price),
+        }).encode()
+        if signature is None:
+            signature = payment_notifications.sign(body)
+        return self.client.post(
+            reverse('ticket:payment_callback'), body, content_type='application/json',
+            HTTP_X_PAYMENT_SIGNATURE=signature,
+        )
+
+    def test_bad_signature_is_rejected(self):
+        for signature in ('', '0' * 64):
+            with self.subTest(signature=signature):
+                self.assertEqual(self._post('BAD-SIGNATURE', signature).status_code, 403)
+        self.assertFalse(PaymentNotification.objects.exists())
+
+    def test_replayed_notification_settles_once(self):
+        self.assertEqual(self._post('SERIAL-1').status_code, 200)
+        self.assertEqual(self._post('SERIAL-1').status_code, 200)
+        self.assertEqual(payment_notifications.process_batch(), {'claimed': 1, 'processed': 1, 'failed': 0})
+        # 处理完成后再次收到的重复通知不会重新入队
+        self._post('SERIAL-1')
+        self.assertEqual(payment_notifications.process_batch(), {'claimed': 0, 'processed': 0, 'failed': 0})
+        self.order.refresh_from_db()
+        self.assertEqual((self.order.status, self.order.payment_serial), (order_state.PAID, 'SERIAL-1'))
+        self.assertEqual(self._totals(self.ticket_type, self.use_date), {'stock': 8, 'sold': 2})
+
+    def test_notification_for_a_paid_order_is_ignored(self):
+        payments.settle_orders([(self.order.id, 'wechat', 'SERIAL-1')])
+        self._post('SERIAL-2')
+        self.assertEqual(payment_notifications.process_batch(), {'claimed': 1, 'processed': 0, 'failed': 1})
+        self.order.refresh_from_db()
+        self.assertEqual((self.order.payment_method, self.order.payment_serial), ('wechat', 'SERIAL-1'))
+        self.assertEqual(self._totals(self.ticket_type, self.use_date), {'stock': 8, 'sold': 2})
+        self.assertEqual(PaymentNotification.objects.get().status, 2)
+
+    def test_notification_for_a_cancelled_order_is_ignored(self):
+        order_state.transition(Order.objects.filter(id=self.order.id), 'cancel')
+        self._post('SERIAL-1')
+        self.assertEqual(payment_notifications.process_batch(), {'claimed': 1, 'processed': 0, 'failed': 1})
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, order_state.CANCELLED)
+        self.assertEqual(self._totals(self.ticket_type, self.use_date), {'stock': 10, 'sold': 0})
+
+
+# =======================
+# 订单状态机
+# =======================
+# 每个状态变更只对仍处于原状态的订单生效，库存变化和预占记录删除只执行一次；
+# 重复的支付、取消、退款不改变订单和库存。
+
+class OrderStateTests(OrderFixtures, TransactionTestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='order-state', email='state@example.com', password=None)
+        self.ticket_type = self._create_ticket_type()
+        self.use_date = date.today() + timedelta(days=1)
+        self.order = self._place_order(self.user, self.ticket_type, self.use_date, quantity=2)
+        self.orders = Order.objects.filter(id=self.order.id)
+
+    def _status(self):
+        return self.orders.values_list('status', flat=True).get()
+
+    def _pay(self, payment_serial='SERIAL-1'):
+        return payments.settle_orders([(self.order.id, 'alipay', payment_serial)])[0]
+
+    def test_illegal_transitions_are_rejected(self):
+        for action in ('request_refund', 'approve_refund', 'reject_refund'):
+            with self.subTest(action=action):
+                self.assertEqual(order_state.transition(self.orders, action), [])
+                self.assertEqual(order_state.update_status([self.order.id], action), 0)
+        self.assertEqual(self._status(), order_state.PENDING)
+        with self.assertRaises(ValueError):
+            order_state.update_status([self.order.id], 'ship')
+
+    def test_conflicting_batch_is_rolled_back(self):
+        other = self._place_order(self.user, self.ticket_type, self.use_date, quantity=1)
+        self._pay()
+        with self.assertRaises(order_state.TransitionConflict), transaction.atomic():
+            locked = list(Order.objects.filter(id__in=[self.order.id, other.id]).only(*order_state.ROW_FIELDS))
+            order_state.apply_transition(locked, 'cancel')
+        # 另一个订单的取消随整批回滚
+        self.assertEqual(Order.objects.get(id=other.id).status, order_state.PENDING)
+        self.assertEqual(self._totals(self.ticket_type, self.use_date), {'stock': 7, 'sold': 2})
+
+    def test_double_pay_is_a_no_op(self):
+        self.assertTrue(self._pay().paid)
+        # 同一流水号的重复确认视为成功，其他流水号被拒绝，已售数量只增加一次
+        self.assertTrue(self._pay().paid)
+        self.assertEqual(self._pay('SERIAL-2').reason, payments.REASON_NOT_PENDING)
+        self.assertEqual(self._status(), order_state.PAID)
+        self.assertEqual(self._totals(self.ticket_type, self.use_date), {'stock': 8, 'sold': 2})
+        self.assertFalse(StockHold.objects.exists())
+
+    def test_double_cancel_releases_stock_once(self):
+        self.assertEqual(order_state.transition(self.orders, 'cancel'), [self.order.id])
+        self.assertEqual(order_state.transition(self.orders, 'cancel'), [])
+        self.assertEqual(self._pay().reason, payments.REASON_NOT_PENDING)
+        self.assertEqual(self._status(), order_state.CANCELLED)
+        self.assertEqual(self._totals(self.ticket_type, self.use_date), {'stock': 10, 'sold': 0})
+        self.assertFalse(StockHold.objects.exists())
+
+    def test_double_refund_releases_stock_once(self):
+        self._pay()
+        self.assertEqual(order_state.transition(self.orders, 'request_refund'), [self.order.id])
+        self.assertEqual(order_state.transition(self.orders, 'request_refund'), [])
+        self.assertEqual(order_state.transition(self.orders, 'approve_refund'), [self.order.id])
+        self.assertEqual(order_state.transition(self.orders, 'approve_refund'), [])
+        self.assertEqual(order_state.transition(self.orders, 'request_refund'), [])
+        self.assertEqual(self._status(), order_state.REFUNDED)
+        self.assertEqual(self._totals(self.ticket_type, self.use_date), {'stock': 10, 'sold': 0})
+
+    def test_rejected_refund_keeps_the_sale(self):
+        self._pay()
+        order_state.transition(self.orders, 'request_refund')
+        self.assertEqual(order_state.transition(self.orders, 'reject_refund'), [self.order.id])
+        self.assertEqual(order_state.transition(self.orders, 'approve_refund'), [])
+        self.assertEqual(self._status(), order_state.PAID)
+        self.assertEqual(self._totals(self.ticket_type, self.use_date), {'stock': 8, 'sold': 2})
+
+
+# =======================
+# 景点名称自动补全
+# =======================
+# 建议结果按是否热门、预约人数排序，名称、全拼、拼音首字母的前缀都能匹配。
+# 测试直接调用load()和rebuild()，不启动后台线程。
+
+class AutocompleteTests(TestCase):
+
+    def setUp(self):
+        self.addCleanup(self._reset)
+        self._create('故宫博物院', is_hot=True, booking_count=10)
+        self._create('故宫角楼', booking_count=1000)
+        self._create('鼓浪屿', booking_count=5)
+        self._create('古北水镇', booking_count=50000, is_active=False)
+
+    @staticmethod
+    def _reset():
+        autocomplete._spots = {}
+        autocomplete._index = None
+        autocomplete._dirty = False
+
+    def _create(self, name, is_hot=False, booking_count=0, is_active=True):
+        return ScenicSpot.objects.create(
+            name=name, description='test', price=0, image='test.jpg', address='test', opening_hours='',
+            is_hot=is_hot, booking_count=booking_count, is_active=is_active,
+        )
+
+    def _names(self, index, prefix):
+        return [name for _, name in index.suggest(autocomplete.normalize(prefix), 10)]
+
+    def test_name_prefix_is_ranked_by_hot_then_bookings(self):
+        index = autocomplete.load()
+        self.assertEqual(self._names(index, '故宫'), ['故宫博物院', '故宫角楼'])
+        self.assertEqual(self._names(index, ' 故 宫 角 '), ['故宫角楼'])
+        # 下架的景点不出现在建议中
+        self.assertEqual(self._names(index, '古北'), [])
+
+    @skipIf(autocomplete.lazy_pinyin is None, 'pypinyin未安装')
+    def test_pinyin_and_initials_match(self):
+        index = autocomplete.load()
+        for prefix, names in (
+            ('gugong', ['故宫博物院', '故宫角楼']),
+            ('GG', ['故宫博物院', '故宫角楼']),
+            ('g', ['故宫博物院', '故宫角楼', '鼓浪屿']),
+            ('gulang', ['鼓浪屿']),
+            ('gly', ['鼓浪屿']),
+            # 超过预先计算长度的前缀在排好序的键中二分查找
+            ('gugongjiao', ['故宫角楼']),
+            ('ggbwy', ['故宫博物院']),
+        ):
+            with self.subTest(prefix=prefix):
+                self.assertEqual(self._names(index, prefix), names)
+
+    def test_saved_spots_are_applied_on_rebuild(self):
+        autocomplete.load()
+        spot = self._create('颐和园', is_hot=True)
+        ScenicSpot.objects.filter(name='鼓浪屿').get().delete()
+        # 修改只进入内存中的景点数据，重建快照后才能查询到
+        self.assertEqual(self._names(autocomplete._index, '颐和'), [])
+        index = autocomplete.rebuild()
+        self.assertEqual(self._names(index, '颐和'), ['颐和园'])
+        self.assertEqual(self._names(index, '鼓浪'), [])
+        spot.is_active = False
+        spot.save()
+        self.assertEqual(self._names(autocomplete.rebuild(), '颐和'), [])
+
+
+# =======================
+# 景点默认标签
+# =======================
+# 新建景点和原来ScenicSpot.tags字段的默认值一样带有“热门”标签，录入的标签替换默认标签。
+
+class DefaultTagTests(TestCase):
+
+    def _create(self, name):
+        return ScenicSpot.objects.create(
+            name=name, description='test', price=0, image='test.jpg', address='test', opening_hours='',
+        )
+
+    def test_new_spot_gets_the_default_tags(self):
+        spot = self._create('默认标签景点')
+        self.assertEqual(tags.tag_names(spot), tags.DEFAULT_TAGS)
+        # 修改已有景点不再添加默认标签
+        tags.set_spot_tags(spot, [])
+        spot.name = '默认标签景点（修改）'
+        spot.save()
+        self.assertEqual(tags.tag_names(spot), [])
+
+    def test_entered_tags_replace_the_default(self):
+        spot = self._create('录入标签景点')
+        tags.set_spot_tags(spot, tags.parse_tags('古镇，夜景'))
+        self.assertEqual(tags.tag_names(spot), ['古镇', '夜景'])
+
+
+# =======================
+# 景点列表分面统计
+# =======================
+# 位图索引统计的各筛选项景点数与数据库COUNT一致，景点修改提交后立即反映在统计中。
+
+class FacetTests(TestCase):
+    REGIONS = ('华北', '华东', '西南')
+    CATEGORIES = ('自然风光类', '人文古迹类')
+    TAGS = ('亲子', '登山', '夜景')
+
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            regions = [Region.objects.create(name=name) for name in self.REGIONS]
+            for i in range(30):
+                spot = ScenicSpot.objects.create(
+                    name=f'分面景点{i}', description='test', price=0, image='test.jpg', address='test',
+                    opening_hours='', region=regions[i % 3] if i % 7 else None, category=self.CATEGORIES[i % 2],
+                )
+                tags.set_spot_tags(spot, [name for j, name in enumerate(self.TAGS) if (i >> j) & 1])
+
+    def _db_count(self, filters):
+        spots = ScenicSpot.objects.all()
+        if filters['region']:
+            spots = spots.filter(region__name=filters['region'])
+        if filters['category']:
+            spots = spots.filter(category=filters['category'])
+        if filters['tag']:
+            spots = tags.filter_by_tag(spots, filters['tag'])
+        return spots.count()
+
+    def _assert_matches_db(self, filters):
+        counts = facets.get_facets(**filters)
+        self.assertEqual(counts['total'], self._db_count(filters))
+        for dimension in ('region', 'category', 'tag'):
+            for item in counts[dimension]:
+                with self.subTest(filters=filters, dimension=dimension, value=item['name']):
+                    self.assertEqual(item['count'], self._db_count({**filters, dimension: item['name']}))
+
+    def test_counts_match_the_database(self):
+        for region in ('', '华东'):
+            for category in ('', '人文古迹类'):
+                for tag in ('', '登山'):
+                    self._assert_matches_db({'region': region, 'category': category, 'tag': tag})
+
+    def test_counts_follow_committed_edits(self):
+        filters = {'region': '华北', 'category': '', 'tag': ''}
+        self._assert_matches_db(filters)
+        with self.captureOnCommitCallbacks(execute=True):
+            spot = ScenicSpot.objects.filter(region__name='华东').first()
+            spot.region = Region.objects.get(name='华北')
+            spot.save()
+            tags.set_spot_tags(spot, ['新标签'])
+            ScenicSpot.objects.filter(region__name='西南').first().delete()
+        self._assert_matches_db(filters)
+        self._assert_matches_db({'region': '', 'category': '', 'tag': '新标签'})
+
+
+# =======================
+# 首页片段缓存
+# =======================
+# 首页各区域的数据通过save()/delete()修改后，事务提交时更新区域版本号，下一次请求立即看到修改。
+
+class HomepageCacheTests(TestCase):
+
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.spots = [
+                ScenicSpot.objects.create(
+                    name=f'首页景点{i}', description='test', price=10, image='test.jpg', address='test',
+                    opening_hours='', category='自然风光类', is_hot=True,
+                )
+                for i in range(12)
+            ]
+            for i, spot in enumerate(self.spots[:5]):
+                Carousel.objects.create(scenic_spot=spot, image='test.jpg', order=i)
+            for i in range(8):
+                News.objects.create(title=f'首页公告{i}', content='test', is_announcement=True)
+                News.objects.create(title=f'首页资讯{i}', content='test')
+
+    def _get(self):
+        return self.client.get(reverse('ticket:index')).content.decode()
+
+    def test_edits_show_up_after_commit(self):
+        self._get()
+        with self.captureOnCommitCallbacks() as callbacks:
+            announcement = News.objects.get(title='首页公告7')
+            announcement.title = '首页公告已修改'
+            announcement.save()
+        # 版本号在事务提交后才更新，提交前仍返回缓存的页面
+        self.assertNotIn('首页公告已修改', self._get())
+        for callback in callbacks:
+            callback()
+        self.assertIn('首页公告已修改', self._get())
+
+    def test_every_section_is_invalidated(self):
+        self._get()
+        with self.captureOnCommitCallbacks(execute=True):
+            news = News.objects.get(title='首页资讯7')
+            news.is_announcement = True
+            news.save()
+            hot_spot = self.spots[-1]
+            hot_spot.is_hot = False
+            hot_spot.save()
+            carousel_spot = self.spots[0]
+            carousel_spot.name = '首页景点轮播已修改'
+            carousel_spot.save()
+            Carousel.objects.get(scenic_spot=self.spots[1]).delete()
+        content = self._get()
+        # 资讯区域展示最新4条，移走一条后第5新的资讯补上
+        self.assertIn('首页资讯3<', content)
+        self.assertNotIn(f'{hot_spot.name}<', content)
+        # 轮播图标题只出现在轮播区域
+        self.assertIn('text-shadow mb-2">首页景点轮播已修改<', content)
+        self.assertNotIn(f'text-shadow mb-2">{self.spots[1].name}<', content)
+
+
+# =======================
+# 景点详情对象缓存
+# =======================
+# 留言新增、回复、删除，景点和标签修改后，事务提交时更新景点版本号，下一次请求立即看到修改。
+
+class SpotDetailCacheTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='detail-cache', email='detail@example.com', password=None)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.spot = ScenicSpot.objects.create(
+                name='详情缓存景点', description='test', price=10, image='test.jpg', address='test',
+                opening_hours='', category='自然风光类',
+            )
+            tags.set_spot_tags(self.spot, ['详情标签'])
+        self.url = reverse('ticket:scenic_spot_detail', kwargs={'spot_id': self.spot.id})
+
+    def _get(self):
+        return self.client.get(self.url).content.decode()
+
+    def test_cached_detail_skips_the_database(self):
+        self._get()
+        spot_detail.reset_stats()
+        detail = spot_detail.get_detail(self.spot.id)
+        self.assertEqual(spot_detail.get_stats()['hits'], 1)
+        self.assertEqual(detail['tags_list'], ['详情标签'])
+
+    def test_edits_show_up_after_commit(self):
+        self._get()
+        with self.captureOnCommitCallbacks() as callbacks:
+            ScenicSpotComment.objects.create(scenic_spot=self.spot, user=self.user, content='新的留言')
+        # 版本号在事务提交后才更新，提交前仍返回缓存的内容
+        self.assertNotIn('新的留言', self._get())
+        for callback in callbacks:
+            callback()
+        self.assertIn('新的留言', self._get())
+
+    def test_every_edit_is_invalidated(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            comment = ScenicSpotComment.objects.create(scenic_spot=self.spot, user=self.user, content='已有留言')
+        self._get()
+        with self.captureOnCommitCallbacks(execute=True):
+            comment.reply = '管理员回复'
+            comment.is_replied = True
+            comment.save()
+        self.assertIn('管理员回复', self._get())
+        with self.captureOnCommitCallbacks(execute=True):
+            self.spot.opening_hours = '修改后的开放时间'
+            self.spot.save()
+        self.assertIn('修改后的开放时间', self._get())
+        with self.captureOnCommitCallbacks(execute=True):
+            tags.set_spot_tags(self.spot, ['新的详情标签'])
+        self.assertIn('新的详情标签', self._get())
+        with self.captureOnCommitCallbacks(execute=True):
+            comment.delete()
+        self.assertNotIn('已有留言', self._get())
+
+
+# =======================
+# 天气查询缓存
+# =======================
+# WEATHER_API['URL']指向本地的模拟天气服务，统计上游请求次数；过期时间缩短到零点几秒。
+
+class _FakeWeatherHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.calls += 1
+        time.sleep(server.delay)
+        if server.failing:
+            self.send_response(500)
+            self.end_headers()
+            return
+        body = json.dumps({
+            'cod': 200,
+            'main': {'temp_min': 3, 'temp_max': 12, 'humidity': 40},
+            'weather': [{'description': '晴'}],
+            'wind': {'deg': 90, 'speed': 3},
+        }).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@mock.patch.object(weather_api, 'API_MODE', 'real')
+class WeatherCacheTests(TestCase):
+
+    DELAY = 0.05
+    TTL = 0.3
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), _FakeWeatherHandler)
+        self.server.daemon_threads = True
+        self.server.lock = threading.Lock()
+        self.server.calls = 0
+        self.server.delay = self.DELAY
+        self.server.failing = False
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+        settings_override = override_settings(WEATHER_API={
+            'URL': f'http://127.0.0.1:{self.server.server_port}/weather', 'API_KEY': 'test',
+            'TIMEOUT': 1, 'MAX_ATTEMPTS': 1, 'TTL': self.TTL, 'STALE_TTL': 60, 'NEGATIVE_TTL': self.TTL,
+        })
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        # 每个测试使用不同的地区，缓存键互不影响
+        self.region = f'测试城市{uuid.uuid4().hex[:8]}'
+        self.key = weather_api._cache_key(self.region, date.today().strftime('%Y-%m-%d'))
+        self.addCleanup(cache.delete_many, [self.key, weather_api._lock_key(self.key)])
+
+    def _lookup(self):
+        return weather_api.get_weather_by_region(self.region, date.today())
+
+    def _wait_for_calls(self, expected):
+        deadline = time.time() + 5
+        while self.server.calls < expected and time.time() < deadline:
+            time.sleep(0.01)
+        # 等待后台刷新写入缓存
+        time.sleep(self.DELAY * 2)
+
+    def test_lookups_within_ttl_use_the_cache(self):
+        first = self._lookup()
+        self.assertTrue(first['success'])
+        self.assertEqual(first['weather'], '晴')
+        for _ in range(10):
+            self.assertEqual(self._lookup(), first)
+        self.assertEqual(self.server.calls, 1)
+
+    def test_concurrent_cold_lookups_make_one_upstream_call(self):
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(self._lookup())) for _ in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(results), 10)
+        self.assertTrue(all(result['success'] and result['weather'] == '晴' for result in results))
+        self.assertEqual(self.server.calls, 1)
+
+    def test_stale_result_is_returned_while_refreshing_in_background(self):
+        first = self._lookup()
+        time.sleep(self.TTL + 0.05)
+        self.server.delay = 0.5
+        started = time.perf_counter()
+        for _ in range(5):
+            self.assertEqual(self._lookup(), first)
+        # 旧结果立即返回，不等待上游
+        self.assertLess(time.perf_counter() - started, 0.25)
+        self._wait_for_calls(2)
+        time.sleep(0.5)
+        self.assertEqual(self.server.calls, 2)
+        # 后台刷新后重新进入TTL，不再请求上游
+        self.assertEqual(self._lookup(), first)
+        self.assertEqual(self.server.calls, 2)
+
+    def test_failed_refresh_keeps_the_stale_result(self):
+        first = self._lookup()
+        time.sleep(self.TTL + 0.05)
+        self.server.failing = True
+        self.assertEqual(self._lookup(), first)
+        self._wait_for_calls(2)
+        self.assertEqual(self._lookup(), first)
+        self.assertEqual(self.server.calls, 2)
+
+    def test_upstream_errors_are_cached_for_negative_ttl(self):
+        self.server.failing = True
+        self.assertFalse(self._lookup()['success'])
+        for _ in range(10):
+            self.assertFalse(self._lookup()['success'])
+        self.assertEqual(self.server.calls, 1)
+        time.sleep(self.TTL + 0.05)
+        self.server.failing = False
+        self.assertTrue(self._lookup()['success'])
+        self.assertEqual(self.server.calls, 2)
+
+    def test_lock_held_by_another_process_is_not_released(self):
+        # 其他进程持有锁且一直没有写入结果：等待超时后直接请求，但不删除对方的锁
+        cache.add(weather_api._lock_key(self.key), 1, 60)
+        self.assertTrue(self._lookup()['success'])
+        self.assertEqual(self.server.calls, 1)
+        self.assertEqual(cache.get(weather_api._lock_key(self.key)), 1)
@@ -72,6 +72,8 @@ urlpatterns = [
     
     # 确认支付URL：/confirm_payment/ 映射到views.confirm_payment视图函数
     path('confirm_payment/', views.confirm_payment, name='confirm_payment'),
+    # 支付回调URL：/payment_callback/ 映射到views.payment_callback视图函数，供支付平台通知支付结果
+    path('payment_callback/', views.payment_callback, name='payment_callback'),
     
     # 删除购物车项URL：/cart/delete/<int:cart_id>/ 映射到views.delete_cart_item视图函数
     path('cart/delete/<int:cart_id>/', views.delete_cart_item, name='delete_cart_item'),
@@ -84,9 +86,15 @@ urlpatterns = [
 
     # 获取景点列表API：/api/scenic_spots/ 映射到views.get_scenic_spots_api视图函数
     path('api/scenic_spots/', views.get_scenic_spots_api, name='get_scenic_spots_api'),
+    # 景点自动补全API：/api/scenic_spots/suggest/?q=前缀 映射到views.scenic_spot_suggest_api视图函数
+    path('api/scenic_spots/suggest/', views.scenic_spot_suggest_api, name='scenic_spot_suggest_api'),
     
     # 获取门票库存API：/api/get_ticket_stocks/ 映射到views.get_ticket_stocks视图函数
     path('api/get_ticket_stocks/', views.get_ticket_stocks, name='get_ticket_stocks'),
+    # 购票排队状态API：/api/waiting_room/[景点ID]/status/ 映射到views.waiting_room_status视图函数
+    path('api/waiting_room/<int:spot_id>/status/', views.waiting_room_status, name='waiting_room_status'),
+    # 月历库存API：/api/stock_calendar/[景点ID]/?month=YYYY-MM 映射到views.get_stock_calendar视图函数
+    path('api/stock_calendar/<int:spot_id>/', views.get_stock_calendar, name='get_stock_calendar'),
     
     # 景点管理员后台URL
     # 景点管理景点信息管理
@@ -107,12 +115,16 @@ urlpatterns = [
     path('scenic_admin/ticket_types/batch_operate/', views.scenic_admin_batch_operate_ticket_types, name='scenic_admin_batch_operate_ticket_types'),
     # 更新日期库存
     path('scenic_admin/update_date_stock/', views.scenic_admin_update_date_stock, name='scenic_admin_update_date_stock'),
+    # 批量更新日期库存
+    path('scenic_admin/bulk_update_date_stock/', views.scenic_admin_bulk_update_date_stock, name='scenic_admin_bulk_update_date_stock'),
     # 订单管理
     path('scenic_admin/orders/', views.scenic_admin_orders, name='scenic_admin_orders'),
     # 订单退款（审核通过）
     path('scenic_admin/order/refund/<int:order_id>/', views.scenic_admin_refund_order, name='scenic_admin_refund_order'),
     # 订单退款（审核拒绝）
     path('scenic_admin/order/refund/reject/<int:order_id>/', views.scenic_admin_refund_reject, name='scenic_admin_refund_reject'),
+    # 批量处理退款（按景点和使用日期审核通过或拒绝）
+    path('scenic_admin/order/refund/bulk/', views.scenic_admin_bulk_refund, name='scenic_admin_bulk_refund'),
     # 订单详情
     path('scenic_admin/order/detail/<int:order_id>/', views.scenic_admin_order_detail, name='scenic_admin_order_detail'),
     # 留言管理
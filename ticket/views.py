@@ -5,25 +5,74 @@ from django.contrib import messages
 from django.contrib.auth import login, logout
 # 导入登录装饰器，用于保护需要登录才能访问的视图
 from django.contrib.auth.decorators import login_required
-# 导入Django ORM模型模块
-from django.db import models
+# 导入Django ORM模型模块和事务模块
+from django.db import models, transaction
+# 导入项目配置
+from django.conf import settings
 # 导入时区模块，用于处理时间
 from django.utils import timezone
-# 导入JsonResponse，用于返回JSON响应
-from django.http import JsonResponse
+# 导入HttpResponse、JsonResponse和StreamingHttpResponse，用于返回缓存的页面、JSON响应和逐步输出的响应
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+# 导入CSRF豁免装饰器，用于接收外部系统的回调请求
+from django.views.decorators.csrf import csrf_exempt
 from django.shortcuts import render, redirect, reverse
 # 导入分页模块
 from django.core.paginator import Paginator, PageNotAnInteger, EmptyPage
 
 # 导入自定义模型，用于数据库查询
-from .models import ScenicSpot, News, Carousel, User, Cart, Order, ScenicSpotComment, TicketType, BrowseHistory, Category, Region, Collection, DateStock
+from .models import ScenicSpot, News, Carousel, User, Cart, Order, ScenicSpotComment, TicketType, BrowseHistory, Category, Region, Collection
+# 导入日期库存服务，所有库存扣减、确认和归还都通过该模块完成
+from . import inventory
+# 导入购票排队模块，热门景点开售时按速率放行用户进入购票页面
+from . import waiting_room
+# 导入月历库存模块，按月缓存景点各门票类型每天的剩余库存
+from . import stock_calendar
+# 导入下单幂等模块，重复提交的下单请求返回原订单
+from . import idempotency
+# 导入订单号生成器，订单号和支付流水号都由它生成
+from . import id_generator
+# 导入购物车批量结算服务，一个事务内完成库存预占、创建订单和清理购物车
+from . import checkout
+# 导入批量支付模块，一个事务内确认多个订单的支付
+from . import payments
+# 导入支付回调模块，支付平台的通知先入队再批量处理
+from . import payment_notifications
+# 导入订单状态机，所有订单状态变更都通过该模块完成
+from . import order_state
+# 导入站内搜索模块，通过倒排索引查找景点、资讯、留言和用户
+from . import search
+# 导入景点自动补全模块，支持按名称、全拼和拼音首字母前缀补全
+from . import autocomplete
+# 导入景点标签模块，标签的解析、保存、筛选和统计
+from . import tags
+# 导入景点分面统计模块，统计各筛选项的景点数
+from . import facets
+# 导入首页片段缓存模块，首页各区域按版本号缓存渲染结果
+from . import homepage
+# 导入景点详情缓存模块，景点、标签和留言按版本号缓存
+from . import spot_detail
+# 导入地区、分类参考数据缓存模块，列表页和表单从进程内存读取地区和分类
+from . import refdata
+# 导入HTTP缓存模块，为景点、资讯页面和景点列表API提供条件请求和Cache-Control
+from . import http_cache
 
 
 # 首页视图函数，处理网站首页的请求
 # request: HTTP请求对象，包含用户请求的所有信息
 def index(request):
-    # 从数据库中获取所有激活状态的轮播图，按轮播顺序排序
-    carousels = Carousel.objects.filter(is_active=True)
+    # 各区域片段缓存的版本号，后台修改轮播图、资讯、景点后对应区域的版本号变化
+    versions = homepage.get_versions()
+    # 未登录且没有待显示提示消息的访客看到的页面完全相同，直接返回缓存的整个页面
+    # len()只统计消息数量，不会把消息标记为已显示
+    page_cacheable = not request.user.is_authenticated and not len(messages.get_messages(request))
+    if page_cacheable:
+        content = homepage.get_page(versions)
+        if content is not None:
+            return HttpResponse(content)
+
+    # 以下查询只是构建QuerySet，只有首页片段缓存未命中、模板渲染对应区域时才访问数据库
+    # 从数据库中获取所有激活状态的轮播图，按轮播顺序排序，同时取出关联景点
+    carousels = Carousel.objects.filter(is_active=True).select_related('scenic_spot')
     # 从数据库中获取所有标记为公告的资讯，按创建时间倒序排列，只取前3条
     announcements = News.objects.filter(is_announcement=True).order_by('-created_at')[:3]
     # 从数据库中获取所有非公告的旅游资讯，按创建时间倒序排列，只取前4条
@@ -37,9 +86,14 @@ def index(request):
         'announcements': announcements,  # 公告数据
         'latest_news': latest_news,  # 最新资讯数据
         'hot_spots': hot_spots,  # 热门景点数据
+        'homepage_versions': versions,  # 各区域片段缓存的版本号
+        'homepage_cache_timeout': getattr(settings, 'HOMEPAGE_CACHE_TIMEOUT', 600),  # 片段缓存时间
     }
     # 渲染index.html模板，将上下文数据传递给模板
-    return render(request, 'index.html', context)
+    response = render(request, 'index.html', context)
+    if page_cacheable:
+        homepage.set_page(versions, response.content)
+    return response
 
 
 # 登录视图函数，处理用户登录请求
@@ -309,9 +363,10 @@ def scenic_admin_add_scenic_spot(request):
                 # 设置默认值，因为模板中没有这些字段
                 opening_hours='',
                 is_hot=False,
-                region=None,
-                tags=''
+                region=None
             )
+            # 模板中没有标签字段，和原来的tags=''一样不带标签，去掉新建景点的默认标签
+            tags.set_spot_tags(scenic_spot, [])
             
             # 重新排序display_id
             reorder_scenic_display_ids()
@@ -411,8 +466,17 @@ def scenic_admin_ticket_types(request):
     scenic_spots = ScenicSpot.objects.filter(admin=admin)
     scenic_ids = scenic_spots.values_list('id', flat=True)
     
-    # 获取当前管理员管理的景点的门票类型
-    ticket_types = TicketType.objects.filter(scenic_spot__id__in=scenic_ids).order_by('-created_at')
+    # 获取选择的日期，如果没有或为空则使用当天日期
+    from datetime import date, datetime
+    today = date.today().strftime('%Y-%m-%d')
+    selected_date = request.GET.get('selected_date') or today
+    selected_date_obj = datetime.strptime(selected_date, '%Y-%m-%d').date()
+    
+    # 获取当前管理员管理的景点的门票类型，同一条查询附加所选日期的库存汇总
+    ticket_types = inventory.with_date_stock(
+        TicketType.objects.filter(scenic_spot__id__in=scenic_ids).order_by('-created_at'),
+        selected_date_obj
+    )
     
     # 分页处理，每页显示10个门票类型
     paginator = Paginator(ticket_types, 10)
@@ -426,19 +490,13 @@ def scenic_admin_ticket_types(request):
         # 如果页码超出范围，返回最后一页
         ticket_types_paginated = paginator.page(paginator.num_pages)
     
-    # 获取选择的日期，如果没有或为空则使用当天日期
-    from datetime import date
-    today = date.today().strftime('%Y-%m-%d')
-    selected_date = request.GET.get('selected_date') or today
-    
     # 预处理日期库存数据
     ticket_data = []
     for ticket in ticket_types_paginated:
-        # 解析日期字符串为date对象
-        from datetime import datetime
-        selected_date_obj = datetime.strptime(selected_date, '%Y-%m-%d').date()
-        # 获取对应日期的库存记录
-        date_stock = ticket.datestock_set.filter(use_date=selected_date_obj).first()
+        # 对应日期的库存汇总（分片模式下为所有分片之和），没有库存记录时为None
+        date_stock = None
+        if ticket.date_stock_rows:
+            date_stock = {'stock': ticket.available_stock, 'sold': ticket.date_sold}
         
         # 添加到数据列表
         ticket_data.append({
@@ -446,9 +504,13 @@ def scenic_admin_ticket_types(request):
             'date_stock': date_stock
         })
     
+    # 批量修改库存时可选择的全部门票类型
+    ticket_type_choices = TicketType.objects.filter(scenic_spot__id__in=scenic_ids).order_by('-created_at').values('id', 'name')
+    
     # 构建上下文数据
     context = {
         'ticket_data': ticket_data,
+        'ticket_type_choices': ticket_type_choices,
         'selected_date': selected_date,
         'today': today,
         'paginator': paginator,
@@ -496,10 +558,7 @@ def scenic_admin_add_ticket_type(request):
                 from datetime import datetime
                 selected_date_obj = datetime.strptime(selected_date, '%Y-%m-%d').date()
                 # 创建对应日期的库存记录
-                ticket_type.datestock_set.create(
-                    use_date=selected_date_obj,
-                    stock=stock
-                )
+                inventory.set_date_stock(ticket_type, selected_date_obj, stock)
             
             messages.success(request, '新增门票类型成功')
             # 重定向时保留当前选择的日期
@@ -561,14 +620,8 @@ def scenic_admin_edit_ticket_type(request, ticket_id):
             if selected_date:
                 from datetime import datetime
                 selected_date_obj = datetime.strptime(selected_date, '%Y-%m-%d').date()
-                # 获取或创建对应日期的库存记录
-                date_stock, created = ticket_type.datestock_set.get_or_create(
-                    use_date=selected_date_obj,
-                    defaults={'stock': stock}
-                )
-                # 更新该日期的库存数量
-                date_stock.stock = stock
-                date_stock.save()
+                # 更新或创建对应日期的库存记录
+                inventory.set_date_stock(ticket_type, selected_date_obj, stock)
             
             messages.success(request, '编辑门票类型成功')
             # 重定向时保留当前选择的日期
@@ -646,6 +699,8 @@ def scenic_admin_update_date_stock(request):
         ticket_type_id = request.POST.get('ticket_type_id')
         use_date = request.POST.get('use_date')
         stock = request.POST.get('stock')
+        # 库存分片数，为空时保持门票类型当前的设置
+        shards = request.POST.get('stock_shards')
         
         try:
             # 获取当前景点管理员
@@ -659,12 +714,12 @@ def scenic_admin_update_date_stock(request):
                 scenic_spot__id__in=scenic_ids
             )
             
+            # 调整分片数（抢购门票开启分片模式），已有的未来库存会按新分片数重新拆分
+            if shards:
+                inventory.set_stock_shards(ticket_type, shards)
+            
             # 更新或创建DateStock记录
-            date_stock, created = DateStock.objects.update_or_create(
-                ticket_type=ticket_type,
-                use_date=use_date,
-                defaults={'stock': stock}
-            )
+            inventory.set_date_stock(ticket_type, use_date, stock)
             
             messages.success(request, f'成功更新 {use_date} 的库存')
         except Exception as e:
@@ -674,6 +729,55 @@ def scenic_admin_update_date_stock(request):
     return redirect(f"{reverse('ticket:scenic_admin_ticket_types')}?selected_date={use_date}")
 
 
+# 批量更新日期库存视图
+# 一次请求为多个门票类型在日期范围内（可按星期筛选）设置库存或增减库存
+@scenic_admin_required
+def scenic_admin_bulk_update_date_stock(request):
+    from datetime import date, datetime
+    selected_date = request.POST.get('start_date') or date.today().strftime('%Y-%m-%d')
+    
+    if request.method == 'POST':
+        # 获取门票类型ID列表、日期范围、星期筛选、修改方式和数值
+        ticket_type_ids = request.POST.getlist('ticket_type_ids')
+        start_date = request.POST.get('start_date')
+        end_date = request.POST.get('end_date')
+        weekdays = [int(weekday) for weekday in request.POST.getlist('weekdays')]
+        mode = request.POST.get('mode', 'set')
+        value = request.POST.get('value')
+        
+        try:
+            if not ticket_type_ids:
+                raise ValueError('请选择门票类型')
+            start_date_obj = datetime.strptime(start_date, '%Y-%m-%d').date()
+            end_date_obj = datetime.strptime(end_date, '%Y-%m-%d').date()
+            if end_date_obj < start_date_obj:
+                raise ValueError('结束日期不能早于开始日期')
+            # 限制单次修改的日期范围，最多一年
+            if (end_date_obj - start_date_obj).days > 366:
+                raise ValueError('单次最多修改一年的库存')
+            value = int(value)
+            
+            # 验证门票类型是否属于当前管理员
+            admin = request.user
+            scenic_ids = ScenicSpot.objects.filter(admin=admin).values_list('id', flat=True)
+            ticket_types = list(TicketType.objects.filter(id__in=ticket_type_ids, scenic_spot__id__in=scenic_ids))
+            if not ticket_types:
+                raise ValueError('门票类型不存在或无权限访问')
+            
+            dates = inventory.expand_dates(start_date_obj, end_date_obj, weekdays)
+            if mode == 'delta':
+                written = inventory.bulk_set_date_stock(ticket_types, dates, delta=value)
+            else:
+                written = inventory.bulk_set_date_stock(ticket_types, dates, stock=value)
+            
+            messages.success(request, f'成功更新 {len(ticket_types)} 个门票类型、{len(dates)} 天共 {written} 条库存')
+        except Exception as e:
+            messages.error(request, f'批量更新库存失败: {str(e)}')
+    
+    # 重定向回门票类型列表页，显示开始日期的库存
+    return redirect(f"{reverse('ticket:scenic_admin_ticket_types')}?selected_date={selected_date}")
+
+
 # 订单管理视图
 @scenic_admin_required
 def scenic_admin_orders(request):
@@ -701,10 +805,10 @@ def scenic_admin_orders(request):
 
     # 根据搜索条件筛选
     if search_query:
+        # 订单号按任意片段匹配，用户名和邮箱通过搜索索引按任意片段查找
         orders = orders.filter(
             models.Q(order_number__icontains=search_query) |
-            models.Q(user__username__icontains=search_query) |
-            models.Q(user__email__icontains=search_query)
+            models.Q(user_id__in=search.matching('user', search_query))
         )
 
     # 按创建时间倒序排序
@@ -722,13 +826,19 @@ def scenic_admin_orders(request):
         # 如果页码超出范围，返回最后一页
         orders_paginated = paginator.page(paginator.num_pages)
 
+    # 批量处理退款的景点选项，附带每个景点退款审核中的订单数
+    refund_spots = scenic_spots.annotate(
+        refund_review_count=models.Count('order', filter=models.Q(order__status=order_state.REFUND_REVIEW))
+    ).order_by('id')
+
     # 构建上下文数据
     context = {
         'orders': orders_paginated,
         'current_status': status,
         'search_query': search_query,
         'paginator': paginator,
-        'page_obj': orders_paginated
+        'page_obj': orders_paginated,
+        'refund_spots': refund_spots,
     }
 
     return render(request, 'scenic_admin/orders.html', context)
@@ -763,9 +873,10 @@ def scenic_admin_comments(request):
 
     # 根据搜索条件筛选
     if search_query:
+        # 通过搜索索引查找用户名和留言内容
         comments = comments.filter(
-            models.Q(user__username__icontains=search_query) |
-            models.Q(content__icontains=search_query)
+            models.Q(user_id__in=search.matching('user', search_query)) |
+            models.Q(id__in=search.matching('comment', search_query))
         )
 
     # 按创建时间倒序排序
@@ -851,7 +962,7 @@ def scenic_admin_delete_comment(request, comment_id):
 @scenic_admin_required
 def scenic_admin_statistics(request):
     # 导入日期处理模块
-    from datetime import date, timedelta
+    from datetime import date, datetime, timedelta
     import json
 
     # 获取当前景点管理员
@@ -889,17 +1000,22 @@ def scenic_admin_statistics(request):
 
     # 计算每天的订单数和销售额
     for d in last_7_days:
+        # 按创建时间范围查询以使用索引，created_at__date会对每一行做日期转换
+        day_start = timezone.make_aware(datetime.combine(d, datetime.min.time()))
+        day_end = day_start + timedelta(days=1)
         # 当天订单数
         day_orders = Order.objects.filter(
             scenic_spot__id__in=scenic_ids,
-            created_at__date=d
+            created_at__gte=day_start,
+            created_at__lt=day_end
         ).count()
         order_counts.append(day_orders)
         
         # 当天销售额
         day_sales = Order.objects.filter(
             scenic_spot__id__in=scenic_ids,
-            created_at__date=d,
+            created_at__gte=day_start,
+            created_at__lt=day_end,
             status=1
         ).aggregate(
             total=models.Sum('total_price')
@@ -1213,7 +1329,7 @@ def admin_required(view_func):
 @admin_required
 def admin_index(request):
     # 导入日期处理模块
-    from datetime import date
+    from datetime import date, datetime, timedelta
 
     # 从数据库获取统计数据
     total_users = User.objects.count()  # 总用户数
@@ -1221,7 +1337,11 @@ def admin_index(request):
 
     # 今日订单数：查询今天创建的订单
     today = date.today()
-    today_orders = Order.objects.filter(created_at__date=today).count()  # 今日订单
+    # 按创建时间范围查询以使用索引，created_at__date会对每一行做日期转换
+    day_start = timezone.make_aware(datetime.combine(today, datetime.min.time()))
+    today_orders = Order.objects.filter(
+        created_at__gte=day_start, created_at__lt=day_start + timedelta(days=1)
+    ).count()  # 今日订单
 
     # 总销售额：计算所有已支付订单的总价之和
     total_sales = Order.objects.filter(status=1).aggregate(
@@ -1529,15 +1649,16 @@ def admin_category_list(request):
     # 获取当前页码，默认为1
     page = request.GET.get('page', 1)
 
-    # 基础查询集
-    categories = Category.objects.all()
+    # 全部分类，从参考数据缓存读取，按名称排序
+    categories = refdata.get_categories()
 
-    # 根据搜索关键词筛选分类
+    # 根据搜索关键词筛选分类（名称或描述包含关键词，不区分大小写）
     if search_keyword:
-        categories = categories.filter(
-            models.Q(name__icontains=search_keyword) |
-            models.Q(description__icontains=search_keyword)
-        )
+        keyword = search_keyword.lower()
+        categories = [
+            category for category in categories
+            if keyword in category.name.lower() or keyword in (category.description or '').lower()
+        ]
 
     # 分页处理，每页显示10个分类
     paginator = Paginator(categories, 10)
@@ -1668,22 +1789,19 @@ def admin_scenic_list(request):
 
     # 根据搜索关键词筛选景点
     if search_keyword:
-        scenic_spots = scenic_spots.filter(
-            models.Q(name__icontains=search_keyword) |
-            models.Q(address__icontains=search_keyword) |
-            models.Q(region__name__icontains=search_keyword)
-        )
+        # 通过搜索索引查找景点名称、地址和地区名称
+        scenic_spots = scenic_spots.filter(id__in=search.matching('spot', search_keyword))
 
     # 统计不同状态的景点数量
     total_scenic_spots = ScenicSpot.objects.count()
     hot_spots = ScenicSpot.objects.filter(is_hot=True).count()
     recommended_spots = ScenicSpot.objects.filter(is_hot=True).count()  # 可以根据实际字段调整
 
-    # 获取所有地区（用于筛选）
-    regions = Region.objects.all()
+    # 获取所有地区（用于筛选），从参考数据缓存读取
+    regions = refdata.get_regions()
 
-    # 景点分类选项：从Category模型获取所有分类
-    categories = Category.objects.all()
+    # 景点分类选项：从参考数据缓存读取所有分类
+    categories = refdata.get_categories()
 
     # 分页处理
     paginator = Paginator(scenic_spots, 10)  # 每页显示10个景点
@@ -1716,12 +1834,13 @@ def admin_region_list(request):
     # 获取当前页码，默认为1
     page = request.GET.get('page', 1)
 
-    # 基础查询集，按ID大小排序
-    regions = Region.objects.order_by('id')
+    # 全部地区，从参考数据缓存读取，按ID大小排序
+    regions = sorted(refdata.get_regions(), key=lambda region: region.id)
 
-    # 根据搜索关键词筛选地区
+    # 根据搜索关键词筛选地区（名称包含关键词，不区分大小写）
     if search_keyword:
-        regions = regions.filter(name__icontains=search_keyword)
+        keyword = search_keyword.lower()
+        regions = [region for region in regions if keyword in region.name.lower()]
 
     # 分页处理，每页显示10个地区
     paginator = Paginator(regions, 10)
@@ -1928,7 +2047,7 @@ def admin_add_scenic(request):
         price = request.POST.get('price')
         total_tickets = request.POST.get('total_tickets')
         opening_hours = request.POST.get('opening_hours')
-        tags = request.POST.get('tags')
+        tags_text = request.POST.get('tags')
         is_hot = request.POST.get('is_hot') == 'on'
         address = request.POST.get('address')
         description = request.POST.get('description')
@@ -1938,9 +2057,9 @@ def admin_add_scenic(request):
         if not name or not region or not category or not price or not opening_hours or not address or not description or not image:
             messages.error(request, '请填写所有必填字段')
             # 获取所有分类选项
-            categories = Category.objects.all()
+            categories = refdata.get_categories()
             # 获取所有地区选项
-            regions = Region.objects.all()
+            regions = refdata.get_regions()
             return render(request, 'admin/add_scenic.html', {'categories': categories, 'regions': regions})
 
         try:
@@ -1952,12 +2071,13 @@ def admin_add_scenic(request):
                 price=float(price),
                 total_tickets=int(total_tickets) if total_tickets else 0,
                 opening_hours=opening_hours,
-                tags=tags,
                 is_hot=is_hot,
                 address=address,
                 description=description,
                 image=image
             )
+            # 保存景点标签
+            tags.set_spot_tags(scenic_spot, tags.parse_tags(tags_text))
 
             # 重新排序display_id
             reorder_scenic_display_ids()
@@ -1971,16 +2091,16 @@ def admin_add_scenic(request):
             # 显示错误消息
             messages.error(request, f'添加景点失败: {str(e)}')
             # 获取所有分类选项
-            categories = Category.objects.all()
+            categories = refdata.get_categories()
             # 获取所有地区选项
-            regions = Region.objects.all()
+            regions = refdata.get_regions()
             return render(request, 'admin/add_scenic.html', {'categories': categories, 'regions': regions})
 
     # GET请求，渲染新增景点表单
     # 获取所有分类选项
-    categories = Category.objects.all()
+    categories = refdata.get_categories()
     # 获取所有地区选项
-    regions = Region.objects.all()
+    regions = refdata.get_regions()
     return render(request, 'admin/add_scenic.html', {'categories': categories, 'regions': regions})
 
 
@@ -2003,7 +2123,7 @@ def admin_edit_scenic(request, spot_id):
         price = request.POST.get('price')
         total_tickets = request.POST.get('total_tickets')
         opening_hours = request.POST.get('opening_hours')
-        tags = request.POST.get('tags')
+        tags_text = request.POST.get('tags')
         is_hot = request.POST.get('is_hot') == 'on'
         address = request.POST.get('address')
         description = request.POST.get('description')
@@ -2013,10 +2133,10 @@ def admin_edit_scenic(request, spot_id):
         if not name or not region or not category or not price or not opening_hours or not address or not description:
             messages.error(request, '请填写所有必填字段')
             # 获取所有分类选项
-            categories = Category.objects.all()
+            categories = refdata.get_categories()
             # 获取所有地区选项
-            regions = Region.objects.all()
-            return render(request, 'admin/edit_scenic.html', {'scenic_spot': scenic_spot, 'categories': categories, 'regions': regions})
+            regions = refdata.get_regions()
+            return render(request, 'admin/edit_scenic.html', {'scenic_spot': scenic_spot, 'categories': categories, 'regions': regions, 'tags_text': tags_text})
 
         try:
             # 更新景点信息
@@ -2026,7 +2146,6 @@ def admin_edit_scenic(request, spot_id):
             scenic_spot.price = float(price)
             scenic_spot.total_tickets = int(total_tickets) if total_tickets else 0
             scenic_spot.opening_hours = opening_hours
-            scenic_spot.tags = tags
             scenic_spot.is_hot = is_hot
             scenic_spot.address = address
             scenic_spot.description = description
@@ -2037,6 +2156,8 @@ def admin_edit_scenic(request, spot_id):
 
             # 保存更新后的景点信息到数据库
             scenic_spot.save()
+            # 保存景点标签
+            tags.set_spot_tags(scenic_spot, tags.parse_tags(tags_text))
 
             # 显示成功消息
             messages.success(request, '景点信息更新成功')
@@ -2047,17 +2168,17 @@ def admin_edit_scenic(request, spot_id):
             # 显示错误消息
             messages.error(request, f'更新景点失败: {str(e)}')
             # 获取所有分类选项
-            categories = Category.objects.all()
+            categories = refdata.get_categories()
             # 获取所有地区选项
-            regions = Region.objects.all()
-            return render(request, 'admin/edit_scenic.html', {'scenic_spot': scenic_spot, 'categories': categories, 'regions': regions})
+            regions = refdata.get_regions()
+            return render(request, 'admin/edit_scenic.html', {'scenic_spot': scenic_spot, 'categories': categories, 'regions': regions, 'tags_text': tags_text})
 
     # GET请求，渲染编辑景点表单，传递当前景点数据
     # 获取所有分类选项
-    categories = Category.objects.all()
+    categories = refdata.get_categories()
     # 获取所有地区选项
-    regions = Region.objects.all()
-    return render(request, 'admin/edit_scenic.html', {'scenic_spot': scenic_spot, 'categories': categories, 'regions': regions})
+    regions = refdata.get_regions()
+    return render(request, 'admin/edit_scenic.html', {'scenic_spot': scenic_spot, 'categories': categories, 'regions': regions, 'tags_text': ','.join(tags.tag_names(scenic_spot))})
 
 
 
@@ -2082,11 +2203,11 @@ def admin_order_list(request):
 
     # 根据搜索关键词筛选：可搜索订单号、用户名、用户邮箱或景点名称
     if search_keyword:
+        # 订单号按任意片段匹配，用户和景点通过搜索索引查找
         orders = orders.filter(
             models.Q(order_number__icontains=search_keyword) |
-            models.Q(user__username__icontains=search_keyword) |
-            models.Q(user__email__icontains=search_keyword) |
-            models.Q(scenic_spot__name__icontains=search_keyword)
+            models.Q(user_id__in=search.matching('user', search_keyword)) |
+            models.Q(scenic_spot_id__in=search.matching('spot', search_keyword))
         )
 
     # 按创建时间倒序排序
@@ -2188,9 +2309,10 @@ def admin_comment_list(request):
 
     # 根据搜索关键词筛选：可搜索用户名或留言内容
     if search_keyword:
+        # 通过搜索索引查找用户名和留言内容
         comments = comments.filter(
-            models.Q(user__username__icontains=search_keyword) |
-            models.Q(content__icontains=search_keyword)
+            models.Q(user_id__in=search.matching('user', search_keyword)) |
+            models.Q(id__in=search.matching('comment', search_keyword))
         )
 
     # 统计不同回复状态的留言数量
@@ -2273,10 +2395,8 @@ def admin_announcement_list(request):
 
     # 根据搜索关键词筛选：可搜索公告标题或内容
     if search_keyword:
-        announcements = announcements.filter(
-            models.Q(title__icontains=search_keyword) |
-            models.Q(content__icontains=search_keyword)
-        )
+        # 通过搜索索引查找标题和内容
+        announcements = announcements.filter(id__in=search.matching('news', search_keyword))
 
     # 统计公告数量
     total_announcements = News.objects.filter(is_announcement=True).count()
@@ -2422,10 +2542,8 @@ def admin_news_list(request):
 
     # 根据搜索关键词筛选：可搜索资讯标题或内容
     if search_keyword:
-        news_list = news_list.filter(
-            models.Q(title__icontains=search_keyword) |
-            models.Q(content__icontains=search_keyword)
-        )
+        # 通过搜索索引查找标题和内容
+        news_list = news_list.filter(id__in=search.matching('news', search_keyword))
 
     # 统计资讯数量
     total_news = News.objects.filter(is_announcement=False).count()
@@ -2679,21 +2797,33 @@ def admin_password_change(request):
 
 
 # 获取景点列表API视图函数，用于登录页面的景点选择下拉框
+# 景点没有变化时返回304，浏览器和反向代理可以缓存
+@http_cache.cache_policy('api', etag_func=http_cache.scenic_spots_api_etag)
 def get_scenic_spots_api(request):
-    # 获取所有景点
-    scenic_spots = ScenicSpot.objects.all()
+    # 获取所有景点，只读取ID和名称
+    scenic_spots = ScenicSpot.objects.values_list('id', 'name')
     # 构建景点列表数据
     scenic_spots_data = [
         {
-            'id': spot.id,
-            'name': spot.name
+            'id': spot_id,
+            'name': name
         }
-        for spot in scenic_spots
+        for spot_id, name in scenic_spots
     ]
     # 返回JSON响应
     return JsonResponse(scenic_spots_data, safe=False)
 
 
+# 景点搜索框自动补全API视图函数，输入名称、全拼或拼音首字母的前缀，返回匹配的景点
+def scenic_spot_suggest_api(request):
+    # 获取用户输入的内容和建议数
+    query = request.GET.get('q', '')
+    limit = request.GET.get('limit', '')
+    limit = int(limit) if limit.isdigit() and int(limit) > 0 else None
+    # 返回JSON响应
+    return JsonResponse({'success': True, 'suggestions': autocomplete.suggest(query, limit)})
+
+
 # 注册视图函数，处理用户注册请求
 def register(request):
     # 判断请求方法是否为POST（表单提交）
@@ -2855,52 +2985,49 @@ def scenic_spots(request):
     region_filter = request.GET.get('region', '')
     # 获取分类筛选条件
     category_filter = request.GET.get('category', '')
+    # 获取标签筛选条件
+    tag_filter = request.GET.get('tag', '')
     # 获取当前页码，默认为1
     page = request.GET.get('page', 1)
-
-    # 基础查询集
-    spots = ScenicSpot.objects.all()
-
-    # 根据搜索关键词筛选
-    if search_keyword:
-        spots = spots.filter(name__icontains=search_keyword) | spots.filter(
-            address__icontains=search_keyword) | spots.filter(region__name__icontains=search_keyword)
+    # 上一页/下一页链接带有相邻页首尾景点的ID，按ID定位，不需要跳过前面的行
+    after_id = request.GET.get('after', '')
+    before_id = request.GET.get('before', '')
+    # "全部地区"、"全部分类"表示不筛选
+    if region_filter == '全部地区':
+        region_filter = ''
+    if category_filter == '全部分类':
+        category_filter = ''
+
+    # 基础查询集：按ID排序保证分页稳定，预加载地区避免每个景点单独查询
+    spots = ScenicSpot.objects.select_related('region').order_by('id')
 
     # 根据地区筛选
-    if region_filter and region_filter != '全部地区':
+    if region_filter:
         # 按省份名称筛选
         spots = spots.filter(region__name=region_filter)
 
     # 根据分类筛选
-    if category_filter and category_filter != '全部分类':
+    if category_filter:
         spots = spots.filter(category=category_filter)
 
-    # 获取所有地区（用于筛选），只显示省份数据
-    provinces = [
-        '北京市', '天津市', '河北省', '山西省', '内蒙古自治区',
-        '辽宁省', '吉林省', '黑龙江省', '上海市', '江苏省',
-        '浙江省', '安徽省', '福建省', '江西省', '山东省',
-        '河南省', '湖北省', '湖南省', '广东省', '广西壮族自治区',
-        '海南省', '重庆市', '四川省', '贵州省', '云南省',
-        '西藏自治区', '陕西省', '甘肃省', '青海省', '宁夏回族自治区',
-        '新疆维吾尔自治区', '香港特别行政区', '澳门特别行政区', '台湾省'
-    ]
-    regions = sorted(provinces)
-    # 获取所有分类（用于筛选）
-    # 从Category模型获取分类列表，确保分类名称完整
-    categories = Category.objects.values_list('name', flat=True).distinct().order_by('name')
-
-    # 预处理景点数据，将tags转换为列表
-    spots_with_tags = []
-    for spot in spots:
-        # 将tags字符串分割为列表
-        tags_list = [tag.strip() for tag in spot.tags.split(',') if tag.strip()]
-        # 将处理后的tags列表添加到spot对象中
-        spot.tags_list = tags_list
-        spots_with_tags.append(spot)
+    # 根据标签筛选，在标签关联表中按标签查找
+    if tag_filter:
+        spots = tags.filter_by_tag(spots, tag_filter)
 
-    # 分页处理
-    paginator = Paginator(spots_with_tags, 9)  # 每页显示9个景点
+    # 根据搜索关键词筛选：在搜索索引中查找名称、地址或地区名称包含关键词的景点，按相关度排序
+    search_ids = ranked_ids = None
+    if search_keyword:
+        # 地区、分类、标签条件在索引查询中筛选；按相关度排序的全部结果在数据库中分页，不截取
+        within = spots.order_by().values('id') if region_filter or category_filter or tag_filter else None
+        ranked_ids = search.ranked('spot', search_keyword, within=within)
+        # 分面统计同样基于搜索词匹配的全部景点，与可翻页的结果一致，只在分面缓存未命中时查询
+        search_ids = search.matching('spot', search_keyword).values_list('object_id', flat=True)
+
+    # 各地区、分类、标签的景点数（用于筛选），在当前搜索结果和其他筛选条件下统计
+    facet_counts = facets.get_facets(region_filter, category_filter, tag_filter, search_keyword, search_ids)
+
+    # 分页处理：在数据库中分页，只读取当前页的景点；搜索时对按相关度排序的景点ID查询集分页
+    paginator = Paginator(spots if ranked_ids is None else ranked_ids, 9)  # 每页显示9个景点
     try:
         spots_paginated = paginator.page(page)
     except PageNotAnInteger:
@@ -2908,14 +3035,46 @@ def scenic_spots(request):
     except EmptyPage:
         spots_paginated = paginator.page(paginator.num_pages)
 
+    # 默认的LIMIT/OFFSET需要跳过前面所有的行，页码越大越慢，改用以下方式读取当前页：
+    if ranked_ids is not None:
+        # 搜索结果：按当前页的景点ID读取，保持相关度顺序
+        page_ids = list(spots_paginated.object_list)
+        spots_by_id = spots.in_bulk(page_ids)
+        spots_paginated.object_list = [spots_by_id[spot_id] for spot_id in page_ids if spot_id in spots_by_id]
+    elif after_id.isdigit():
+        # 下一页：ID大于上一页最后一个景点
+        spots_paginated.object_list = list(spots.filter(id__gt=after_id)[:paginator.per_page])
+    elif before_id.isdigit():
+        # 上一页：ID小于下一页第一个景点，倒序读取后再反转
+        spots_paginated.object_list = list(spots.filter(id__lt=before_id).order_by('-id')[:paginator.per_page])[::-1]
+    elif spots_paginated.number > paginator.num_pages // 2:
+        # 后半部分的页码从末尾倒序读取，跳过的行数不超过总数的一半
+        offset = paginator.count - spots_paginated.end_index()
+        limit = spots_paginated.end_index() - spots_paginated.start_index() + 1
+        spots_paginated.object_list = list(spots.order_by('-id')[offset:offset + limit])[::-1]
+    else:
+        spots_paginated.object_list = list(spots_paginated.object_list)
+
+    # 一次查询取出当前页所有景点的标签
+    models.prefetch_related_objects(spots_paginated.object_list, tags.TAG_PREFETCH)
+    for spot in spots_paginated.object_list:
+        spot.tags_list = tags.tag_names(spot)
+
     # 构建上下文
     context = {
         'spots': spots_paginated,
+        # 页码导航只显示当前页附近和首尾的页码，景点很多时不必渲染所有页码
+        'page_range': paginator.get_elided_page_range(spots_paginated.number, on_each_side=2, on_ends=1),
+        # 当前页首尾景点的ID，用于上一页/下一页链接；搜索结果按相关度排序，不按ID定位
+        'first_spot_id': spots_paginated.object_list[0].id if spots_paginated.object_list and ranked_ids is None else '',
+        'last_spot_id': spots_paginated.object_list[-1].id if spots_paginated.object_list and ranked_ids is None else '',
         'search_keyword': search_keyword,
         'region_filter': region_filter,
         'category_filter': category_filter,
-        'regions': regions,
-        'categories': categories,
+        'tag_filter': tag_filter,
+        'regions': facet_counts['region'],
+        'categories': facet_counts['category'],
+        'tag_facets': facet_counts['tag'][:20],
     }
 
     # 渲染scenic_spots.html模板，将数据传递给模板
@@ -2924,18 +3083,16 @@ def scenic_spots(request):
 
 # 景点详情视图函数，处理单个景点的详情页请求
 # spot_id: 景点ID，从URL中获取
+# 未登录访客再次访问时，景点、标签、留言没有变化则返回304
+@http_cache.cache_policy('page', etag_func=http_cache.spot_detail_etag)
 def scenic_spot_detail(request, spot_id):
-    # 根据景点ID从数据库中获取景点信息
-    try:
-        spot = ScenicSpot.objects.get(id=spot_id)
-    except ScenicSpot.DoesNotExist:
+    # 获取景点、标签（按录入顺序）和留言（按创建时间倒序），优先读取缓存，未命中时查询数据库
+    detail = spot_detail.get_detail(spot_id)
+    if detail is None:
         # 景点不存在时显示错误信息并重定向到首页
         messages.error(request, '该景点不存在或已被删除')
         return redirect(reverse('ticket:index'))
-    # 将tags字符串分割为列表
-    tags_list = [tag.strip() for tag in spot.tags.split(',')]
-    # 获取该景点的所有留言，按创建时间倒序排列
-    comments = ScenicSpotComment.objects.filter(scenic_spot=spot).order_by('-created_at')
+    spot = detail['spot']
     
     # 记录浏览历史
     if request.user.is_authenticated:
@@ -2965,8 +3122,10 @@ def scenic_spot_detail(request, spot_id):
     # 构建上下文
     context = {
         'spot': spot,
-        'tags_list': tags_list,
-        'comments': comments,
+        'tags_list': detail['tags_list'],
+        'comments': detail['comments'],
+        'detail_version': detail['version'],  # 留言列表片段缓存的版本号
+        'detail_cache_timeout': spot_detail.get_timeout(),  # 留言列表片段缓存时间
     }
     
     # 渲染scenic_spot_detail.html模板，将景点详情数据传递给模板
@@ -2974,6 +3133,8 @@ def scenic_spot_detail(request, spot_id):
 
 
 # 资讯公告列表视图函数，处理资讯公告列表页请求
+# 未登录访客再次访问时，资讯没有变化则返回304
+@http_cache.cache_policy('page', etag_func=http_cache.news_list_etag, last_modified_func=http_cache.news_list_last_modified)
 def news_list(request):
     # 获取筛选参数，默认显示全部
     filter_type = request.GET.get('type', 'all')
@@ -3003,6 +3164,8 @@ def news_list(request):
 
 # 资讯公告详情视图函数，处理单个资讯公告的详情页请求
 # news_id: 资讯ID，从URL中获取
+# 未登录访客再次访问时，资讯没有修改则返回304
+@http_cache.cache_policy('page', etag_func=http_cache.news_detail_etag, last_modified_func=http_cache.news_detail_last_modified)
 def news_detail(request, news_id):
     # 根据资讯ID从数据库中获取单个资讯公告信息
     try:
@@ -3017,6 +3180,7 @@ def news_detail(request, news_id):
 # 购票页面视图函数，处理景点购票请求
 # spot_id: 景点ID，从URL中获取
 @login_required
+@waiting_room.waiting_room_required
 def buy_ticket(request, spot_id):
     # 导入日期处理模块
     from datetime import date
@@ -3069,7 +3233,8 @@ def buy_ticket(request, spot_id):
                 'single_tickets': single_tickets,
                 'package_tickets': package_tickets,
                 'selected_use_date': use_date,
-                'selected_quantity': quantity
+                'selected_quantity': quantity,
+                'idempotency_key': idempotency.new_key()
             })
         
         # 获取门票类型
@@ -3079,17 +3244,13 @@ def buy_ticket(request, spot_id):
         from datetime import datetime
         use_date_obj = datetime.strptime(use_date, '%Y-%m-%d').date()
         
-        # 获取或创建对应日期的库存记录
-        date_stock, created = DateStock.objects.get_or_create(
-            ticket_type=ticket_type,
-            use_date=use_date_obj,
-            defaults={'stock': ticket_type.stock}  # 使用门票类型的默认库存作为初始值
-        )
+        # 查询该日期的剩余库存，没有库存记录时为门票类型的默认库存
+        available_stock = inventory.get_available_stock(ticket_type, use_date_obj)
         
         # 检查该日期的库存是否充足
-        if date_stock.stock < quantity:
+        if available_stock < quantity:
             # 库存不足，显示错误信息
-            messages.error(request, f'门票库存不足，{use_date} 当日库存仅剩 {date_stock.stock} 张')
+            messages.error(request, f'门票库存不足，{use_date} 当日库存仅剩 {available_stock} 张')
             # 返回购票页面时保留用户之前的选择
             return render(request, 'buy_ticket.html', {
                 'spot': spot,
@@ -3098,7 +3259,8 @@ def buy_ticket(request, spot_id):
                 'package_tickets': package_tickets,
                 'selected_use_date': use_date,
                 'selected_quantity': quantity,
-                'today': today
+                'today': today,
+                'idempotency_key': idempotency.new_key()
             })
         
         # 计算总价
@@ -3108,26 +3270,37 @@ def buy_ticket(request, spot_id):
         if action == 'buy_now':
             # 直接购买：创建订单并跳转到支付页面
             if request.user.is_authenticated:
-                # 生成订单号
-                import datetime
-                import uuid
-                order_number = f"ORD{datetime.datetime.now().strftime('%Y%m%d%H%M%S')}{uuid.uuid4().hex[:6].upper()}"
+                # 生成订单号（按时间递增，不会重复）
+                order_number = id_generator.new_order_number()
                 
-                # 创建订单
-                order = Order.objects.create(
-                    user=request.user,
-                    scenic_spot=spot,
-                    ticket_type=ticket_type,
-                    use_date=use_date,
-                    quantity=quantity,
-                    total_price=total_price,
-                    order_number=order_number
-                )
+                try:
+                    # 在同一事务中登记幂等键、预占库存并创建订单，库存不足时不会留下订单
+                    with transaction.atomic():
+                        idempotency_record, first_request = idempotency.claim(
+                            request.user, idempotency.get_key(request), 'buy_now'
+                        )
+                        if first_request:
+                            inventory.reserve_stock(ticket_type, use_date_obj, quantity)
+                            order = Order.objects.create(
+                                user=request.user,
+                                scenic_spot=spot,
+                                ticket_type=ticket_type,
+                                use_date=use_date,
+                                quantity=quantity,
+                                total_price=total_price,
+                                order_number=order_number
+                            )
+                            # 记录库存预占，超时未支付将自动取消并释放库存
+                            inventory.create_hold(order)
+                            idempotency.complete(idempotency_record, [order.id])
+                except inventory.InsufficientStockError as e:
+                    # 并发购买时库存已被抢完，返回购票页面
+                    messages.error(request, f'门票库存不足，{e}')
+                    return redirect(reverse('ticket:buy_ticket', kwargs={'spot_id': spot.id}))
                 
-                # 减少对应日期的库存
-                date_stock.stock -= quantity
-                date_stock.sold += quantity
-                date_stock.save()
+                # 重复提交（双击、浏览器重试），返回第一次提交创建的订单
+                if not first_request:
+                    return redirect_to_idempotent_orders(request, idempotency_record)
                 
                 # 跳转到支付页面
                 return redirect(reverse('ticket:payment', kwargs={'order_id': order.id}))
@@ -3176,14 +3349,14 @@ def buy_ticket(request, spot_id):
     single_tickets_with_stock = []
     package_tickets_with_stock = []
     
-    for ticket in ticket_types:
-        # 获取对应日期的库存记录
-        date_stock = ticket.datestock_set.filter(use_date=selected_date_obj).first()
+    # 一条查询取回所有门票类型及其对应日期的剩余库存，没有记录时使用门票的默认库存
+    for ticket in inventory.with_date_stock(ticket_types, selected_date_obj):
+        stock = ticket.available_stock
         # 创建带有日期特定库存的门票对象
         ticket_with_stock = {
             'ticket': ticket,
-            'stock': date_stock.stock if date_stock else ticket.stock,
-            'is_sold_out': (date_stock.stock <= 0 if date_stock else ticket.stock <= 0)
+            'stock': stock,
+            'is_sold_out': stock <= 0
         }
         # 根据门票类型添加到不同列表
         if ticket.type == 'single':
@@ -3201,7 +3374,8 @@ def buy_ticket(request, spot_id):
         'selected_ticket_type': selected_ticket_type,
         'selected_quantity': selected_quantity,
         'today': today,
-        'selected_date': selected_date
+        'selected_date': selected_date,
+        'idempotency_key': idempotency.new_key()
     })
 
 from .weather_api import get_weather_by_region
@@ -3243,41 +3417,93 @@ def weather_check(request, order_id):
         'weather_data': weather_data
     })
 
+# 购票排队状态查询视图函数，供等候页轮询
+# 只校验请求中的签名令牌，不读取会话和数据库
+def waiting_room_status(request, spot_id):
+    token_data = waiting_room.read_token(request.GET.get('token'), spot_id)
+    if token_data is None:
+        return JsonResponse({'success': False, 'message': '排队令牌无效，请重新进入购票页面'})
+    
+    status = waiting_room.get_status(token_data, spot_id)
+    return JsonResponse({
+        'success': True,
+        'admitted': status['admitted'],
+        'position': status['position'],
+        'wait_seconds': status['wait_seconds'],
+        # 放行后携带令牌跳转到购票页面，由购票页面发放通行证
+        'redirect_url': f"{reverse('ticket:buy_ticket', args=[spot_id])}?wr_token={request.GET.get('token')}" if status['admitted'] else ''
+    })
+
 # AJAX获取门票库存视图函数
 def get_ticket_stocks(request):
-    # 获取请求参数
+    # 获取请求参数，传入start_date和end_date时返回日期范围内每天的库存（用于前端预取整月库存）
     date_str = request.GET.get('date')
+    start_str = request.GET.get('start_date')
+    end_str = request.GET.get('end_date')
     spot_id = request.GET.get('spot_id')
     
-    if not date_str or not spot_id:
+    if not (date_str or (start_str and end_str)) or not spot_id:
         return JsonResponse({'success': False, 'message': '缺少必要参数'})
     
     try:
         from datetime import datetime
-        selected_date = datetime.strptime(date_str, '%Y-%m-%d').date()
         spot = ScenicSpot.objects.get(id=spot_id)
         
         # 获取该景点的所有激活状态的门票类型
         ticket_types = TicketType.objects.filter(scenic_spot=spot, is_active=True)
         
-        # 构建库存数据
-        stocks_data = []
-        for ticket in ticket_types:
-            # 获取对应日期的库存记录
-            date_stock = ticket.datestock_set.filter(use_date=selected_date).first()
-            # 如果没有记录，使用门票的默认库存
-            stock = date_stock.stock if date_stock else ticket.stock
+        if date_str:
+            selected_date = datetime.strptime(date_str, '%Y-%m-%d').date()
+            # 构建库存数据，一条查询取回所有门票类型对应日期的库存
+            stocks_data = []
+            for ticket in inventory.with_date_stock(ticket_types, selected_date):
+                stocks_data.append({
+                    'id': ticket.id,
+                    'stock': ticket.available_stock,
+                    'is_sold_out': ticket.available_stock <= 0
+                })
             
-            stocks_data.append({
-                'id': ticket.id,
-                'stock': stock,
-                'is_sold_out': stock <= 0
-            })
+            return JsonResponse({'success': True, 'data': stocks_data})
+        
+        start_date = datetime.strptime(start_str, '%Y-%m-%d').date()
+        end_date = datetime.strptime(end_str, '%Y-%m-%d').date()
+        # 限制日期范围，最多查询62天
+        if end_date < start_date or (end_date - start_date).days > 61:
+            return JsonResponse({'success': False, 'message': '日期范围无效，最多查询62天'})
+        
+        # 按日期组织库存数据：{日期: [{门票类型库存}, ...]}
+        calendar = {}
+        for ticket_id, stocks in inventory.get_stock_calendar(ticket_types, start_date, end_date).items():
+            for day, stock in stocks.items():
+                calendar.setdefault(day.strftime('%Y-%m-%d'), []).append({
+                    'id': ticket_id,
+                    'stock': stock,
+                    'is_sold_out': stock <= 0
+                })
         
-        return JsonResponse({'success': True, 'data': stocks_data})
+        return JsonResponse({'success': True, 'calendar': calendar})
     except Exception as e:
         return JsonResponse({'success': False, 'message': str(e)})
 
+# 月历库存视图函数，返回景点各门票类型在某月每天的剩余库存
+# spot_id: 景点ID，从URL中获取；month参数格式为YYYY-MM，默认当月
+def get_stock_calendar(request, spot_id):
+    month_str = request.GET.get('month')
+    
+    try:
+        from datetime import date, datetime
+        if month_str:
+            month_date = datetime.strptime(month_str, '%Y-%m').date()
+        else:
+            month_date = date.today()
+        
+        # 表格整体缓存，库存或门票类型变化时自动失效；缓存命中时不查询数据库
+        # 景点不存在或没有上架的门票类型时ticket_types为空列表
+        grid = stock_calendar.get_month_grid(spot_id, month_date.year, month_date.month)
+        return JsonResponse({'success': True, **grid})
+    except ValueError:
+        return JsonResponse({'success': False, 'message': '月份格式错误，应为YYYY-MM'})
+
 # 支付页面视图函数，处理订单支付请求
 # order_id: 订单ID，从URL中获取
 def payment(request, order_id):
@@ -3297,6 +3523,26 @@ def payment(request, order_id):
     })
 
 
+# 重复提交的下单请求（相同幂等键）跳转到第一次提交创建的订单
+# record: 幂等键记录
+def redirect_to_idempotent_orders(request, record):
+    # 幂等键属于其他用户时不返回订单信息
+    if record.user_id != request.user.id:
+        messages.error(request, '请求无效，请刷新页面后重新提交')
+        return redirect(reverse('ticket:order_center'))
+    
+    order_ids = record.order_ids
+    if len(order_ids) == 1:
+        return redirect(reverse('ticket:payment', kwargs={'order_id': order_ids[0]}))
+    if order_ids:
+        # 多个订单，与第一次提交一样跳转到批量支付页面
+        request.session['batch_order_ids'] = order_ids
+        return redirect(reverse('ticket:batch_payment'))
+    
+    messages.info(request, '订单正在处理中，请在订单中心查看')
+    return redirect(reverse('ticket:order_center'))
+
+
 # 购物车视图函数，处理用户购物车请求
 # @login_required装饰器：要求用户必须登录才能访问该视图
 @login_required
@@ -3314,112 +3560,49 @@ def cart(request):
         # 获取用户选择的购物车项目ID
         selected_item_ids = request.POST.getlist('selected_items')
         
-        print(f"=== 购物车视图调试信息 ===")
-        print(f"请求方法: {request.method}")
-        print(f"选中的购物车项ID: {selected_item_ids}")
-        print(f"选中的购物车项数量: {len(selected_item_ids)}")
-        
         # 检查是否选择了商品
         if not selected_item_ids:
             messages.error(request, '请选择要购买的商品')
-            print(f"错误提示: 请选择要购买的商品")
             return redirect(reverse('ticket:cart'))
         
-        # 遍历选中的购物车项目，创建订单
-        orders = []
-        deleted_ids = []
-        
-        # 去重处理，避免重复处理同一个购物车项
-        unique_item_ids = list(set(selected_item_ids))
-        print(f"去重后的购物车项ID: {unique_item_ids}")
+        # 幂等键与整个批量结算在同一个事务中提交
+        with transaction.atomic():
+            idempotency_record, first_request = idempotency.claim(
+                request.user, idempotency.get_key(request), 'cart'
+            )
+            if first_request:
+                result = checkout.checkout_cart(request.user, selected_item_ids)
+                if result.orders:
+                    idempotency.complete(idempotency_record, [order.id for order in result.orders])
+                else:
+                    # 没有创建任何订单时回滚幂等键，允许用户重新提交
+                    transaction.set_rollback(True)
         
-        for item_id in unique_item_ids:
-            try:
-                # 检查ID是否已被处理过
-                if item_id in deleted_ids:
-                    print(f"跳过已处理的购物车项ID: {item_id}")
-                    continue
-                    
-                # 获取购物车项目，使用filter避免DoesNotExist异常
-                cart_items = Cart.objects.filter(id=item_id, user=request.user)
-                if not cart_items.exists():
-                    print(f"购物车项不存在，ID: {item_id}")
-                    continue
-                    
-                cart_item = cart_items.first()
-                print(f"获取到购物车项: {cart_item.id}, 景点: {cart_item.scenic_spot.name}")
-                
-                # 生成订单号
-                import datetime
-                import uuid
-                order_number = f"ORD{datetime.datetime.now().strftime('%Y%m%d%H%M%S')}{uuid.uuid4().hex[:6].upper()}"
-                print(f"生成订单号: {order_number}")
-                
-                # 检查库存是否充足
-                if cart_item.ticket_type.stock < cart_item.quantity:
-                    print(f"购物车项ID: {item_id}，库存不足，当前库存: {cart_item.ticket_type.stock}，请求数量: {cart_item.quantity}")
-                    messages.error(request, f'{cart_item.scenic_spot.name} - {cart_item.ticket_type.name} 的门票库存不足，当前库存仅剩 {cart_item.ticket_type.stock} 张')
-                    continue
-                
-                # 计算订单总价
-                total_price = cart_item.ticket_type.price * cart_item.quantity
-                print(f"计算订单总价: {total_price}")
-                
-                # 创建订单
-                order = Order.objects.create(
-                    user=request.user,
-                    scenic_spot=cart_item.scenic_spot,
-                    ticket_type=cart_item.ticket_type,
-                    use_date=cart_item.use_date,
-                    quantity=cart_item.quantity,
-                    total_price=total_price,
-                    order_number=order_number
-                )
-                print(f"创建订单成功: {order.id}")
-                
-                # 减少库存
-                cart_item.ticket_type.stock -= cart_item.quantity
-                cart_item.ticket_type.save()
-                print(f"减少库存: 门票类型ID={cart_item.ticket_type.id}, 数量={cart_item.quantity}, 剩余库存={cart_item.ticket_type.stock}")
-                
-                orders.append(order)
-                
-                # 从购物车中删除已购买的项目
-                cart_item.delete()
-                print(f"从购物车中删除项目: {item_id}")
-                
-                # 记录已删除的ID
-                deleted_ids.append(item_id)
-            except Exception as e:
-                # 捕获所有异常，避免处理一个商品失败影响其他商品
-                print(f"处理购物车项时发生错误，ID: {item_id}, 错误: {str(e)}")
-                # 只在控制台打印错误，不向用户显示，避免影响用户体验
-                continue
+        # 重复提交（双击、浏览器重试），返回第一次提交创建的订单
+        if not first_request:
+            return redirect_to_idempotent_orders(request, idempotency_record)
         
-        print(f"成功创建订单数量: {len(orders)}")
+        # 逐项提示结算失败的购物车项及原因，失败的项保留在购物车中
+        for failure in result.failures:
+            if failure['name']:
+                messages.error(request, f"{failure['name']}：{failure['message']}")
+            else:
+                messages.error(request, failure['message'])
         
+        orders = result.orders
         if orders:
-            # 提取订单ID列表
-            order_ids = [order.id for order in orders]
-            print(f"订单ID列表: {order_ids}")
-            
             # 如果只有一个订单，直接跳转到支付页面
             if len(orders) == 1:
-                payment_url = reverse('ticket:payment', kwargs={'order_id': orders[0].id})
-                print(f"单个订单，跳转到支付页面: {payment_url}")
-                return redirect(payment_url)
-            else:
-                # 多个订单，将订单ID存储到会话中，然后跳转到批量支付页面
-                request.session['batch_order_ids'] = order_ids
-                print(f"多个订单，跳转到批量支付页面")
-                return redirect(reverse('ticket:batch_payment'))
-        else:
-            messages.error(request, '没有成功创建订单，请重新尝试')
-            print(f"错误: 没有成功创建订单，请重新尝试")
-            return redirect(reverse('ticket:cart'))
+                return redirect(reverse('ticket:payment', kwargs={'order_id': orders[0].id}))
+            # 多个订单，将订单ID存储到会话中，然后跳转到批量支付页面
+            request.session['batch_order_ids'] = [order.id for order in orders]
+            return redirect(reverse('ticket:batch_payment'))
+        
+        messages.error(request, '没有成功创建订单，请重新尝试')
+        return redirect(reverse('ticket:cart'))
 
-    # 渲染cart.html模板，将购物车数据传递给模板
-    return render(request, 'cart.html', {'cart_items': cart_items})
+    # 渲染cart.html模板，将购物车数据和本次结算的幂等键传递给模板
+    return render(request, 'cart.html', {'cart_items': cart_items, 'idempotency_key': idempotency.new_key()})
 
 
 # 订单中心视图函数，处理用户订单中心请求
@@ -3534,10 +3717,6 @@ def confirm_payment(request):
     if request.method == 'POST':
         # 获取选中的订单ID列表
         order_ids = request.POST.getlist('order_ids')
-        print(f"=== 确认支付调试信息 ===")
-        print(f"请求方法: {request.method}")
-        print(f"选中的订单ID: {order_ids}")
-        print(f"选中的订单数量: {len(order_ids)}")
         
         # 检查是否选择了订单
         if not order_ids:
@@ -3546,70 +3725,24 @@ def confirm_payment(request):
         
         # 获取支付方式
         payment_method = request.POST.get('payment_method', 'alipay')
-        print(f"支付方式: {payment_method}")
         
-        # 统计成功和失败的订单数量
-        success_count = 0
-        failed_count = 0
+        # 在一个事务中批量确认所有订单，返回每个订单的支付结果
+        results = payments.confirm_orders(order_ids, payment_method, user=request.user)
+        paid_orders = [result.order for result in results if result.paid]
         
-        # 遍历处理每个订单
-        for order_id in order_ids:
-            try:
-                # 获取订单信息，确保订单属于当前用户
-                order = Order.objects.get(id=order_id, user=request.user)
-                print(f"获取到订单: {order.id}, 状态: {order.status}")
-                
-                # 只有待支付订单才能支付
-                if order.status == 0:
-                    # 模拟支付成功
-                    order.status = 1  # 更新订单状态为已支付
-                    # 更新支付相关字段
-                    order.payment_method = payment_method
-                    order.payment_time = timezone.now()
-                    # 生成支付流水号
-                    import uuid
-                    order.payment_serial = f"PAY{order.order_number}{str(uuid.uuid4())[:8].upper()}"
-                    
-                    # 减少对应日期的库存
-                    if order.ticket_type and order.use_date:
-                        # 获取或创建对应日期的库存记录
-                        date_stock, created = DateStock.objects.get_or_create(
-                            ticket_type=order.ticket_type,
-                            use_date=order.use_date,
-                            defaults={'stock': order.ticket_type.stock}
-                        )
-                        # 减少库存并增加已售数量
-                        date_stock.stock -= order.quantity
-                        date_stock.sold += order.quantity
-                        date_stock.save()
-                        print(f"订单 {order.id} 减少 {order.use_date} 库存: {order.quantity}, 剩余库存: {date_stock.stock}")
-                    
-                    order.save()
-                    print(f"订单 {order.id} 支付成功")
-                    success_count += 1
+        # 显示结果消息，逐个提示失败的订单及原因
+        if paid_orders:
+            messages.success(request, f'成功支付 {len(paid_orders)} 个订单')
+        for result in results:
+            if not result.paid:
+                if result.order:
+                    messages.error(request, f'订单 {result.order.order_number} 支付失败：{result.message}')
                 else:
-                    print(f"订单 {order.id} 状态不允许支付，当前状态: {order.status}")
-                    failed_count += 1
-            except Order.DoesNotExist:
-                print(f"订单 {order_id} 不存在或已被删除")
-                failed_count += 1
-                continue
-        
-        # 显示结果消息
-        if success_count > 0:
-            messages.success(request, f'成功支付 {success_count} 个订单')
-        if failed_count > 0:
-            messages.error(request, f'有 {failed_count} 个订单支付失败')
-        
-        print(f"支付完成: 成功 {success_count} 个，失败 {failed_count} 个")
+                    messages.error(request, f'订单支付失败：{result.message}')
         
-        # 如果有成功支付的订单，跳转到第一个订单的天气页面
-        if success_count > 0:
-            # 获取第一个成功支付的订单
-            first_order = Order.objects.filter(id__in=order_ids, user=request.user).first()
-            if first_order:
-                # 跳转到天气页面
-                return redirect(reverse('ticket:weather_check', kwargs={'order_id': first_order.id}))
+        # 如果有成功支付的订单，跳转到第一个成功支付订单的天气页面
+        if paid_orders:
+            return redirect(reverse('ticket:weather_check', kwargs={'order_id': paid_orders[0].id}))
         
         # 否则跳转到订单中心
         return redirect(reverse('ticket:order_center'))
@@ -3618,6 +3751,30 @@ def confirm_payment(request):
     return redirect(reverse('ticket:cart'))
 
 
+# 支付回调视图函数，接收支付平台的支付结果通知
+# 只校验签名和内容并写入待处理队列，由process_payment_notifications命令批量确认订单
+# 支付平台不携带CSRF令牌，使用请求签名验证来源
+@csrf_exempt
+def payment_callback(request):
+    # 只接受POST请求
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'message': '只支持POST请求'}, status=405)
+    
+    # 校验签名，防止伪造的支付通知
+    signature = request.META.get(payment_notifications.SIGNATURE_HEADER, '')
+    if not payment_notifications.verify(request.body, signature):
+        return JsonResponse({'success': False, 'message': '签名无效'}, status=403)
+    
+    try:
+        notification = payment_notifications.parse(request.body)
+    except payment_notifications.InvalidNotification as e:
+        return JsonResponse({'success': False, 'message': str(e)}, status=400)
+    
+    # 写入队列后立即返回，重复的通知同样返回成功，支付平台不再重试
+    payment_notifications.ingest(notification)
+    return JsonResponse({'success': True})
+
+
 # 取消订单视图函数，处理用户取消订单请求
 # @login_required装饰器：要求用户必须登录才能访问该视图
 @login_required
@@ -3625,36 +3782,17 @@ def cancel_order(request, order_id):
     # 判断请求方法是否为POST（表单提交）
     if request.method == 'POST':
         try:
-            # 获取订单信息，确保订单属于当前用户
-            order = Order.objects.get(id=order_id, user=request.user)
-            
-            # 只有待支付订单才能取消
-            if order.status == 0:
-                # 恢复对应日期的库存
-                if order.ticket_type and order.use_date:
-                    # 获取对应日期的库存记录
-                    date_stock = DateStock.objects.filter(
-                        ticket_type=order.ticket_type,
-                        use_date=order.use_date
-                    ).first()
-                    if date_stock:
-                        # 恢复库存并减少已售数量
-                        date_stock.stock += order.quantity
-                        date_stock.sold -= order.quantity
-                        date_stock.save()
-                
-                # 更新订单状态为已取消
-                order.status = 2
-                order.save()
-                
+            # 只有待支付订单才能取消：带条件更新状态，同时归还预占的库存并删除库存预占记录
+            orders = Order.objects.filter(id=order_id, user=request.user)
+            if order_state.transition(orders, 'cancel'):
                 # 显示成功消息
                 messages.success(request, '订单已成功取消')
-            else:
+            elif orders.exists():
                 # 非待支付订单不能取消
                 messages.error(request, '只有待支付订单才能取消')
-        except Order.DoesNotExist:
-            # 订单不存在或不属于当前用户
-            messages.error(request, '订单不存在或您没有权限操作')
+            else:
+                # 订单不存在或不属于当前用户
+                messages.error(request, '订单不存在或您没有权限操作')
         except Exception as e:
             # 其他错误
             messages.error(request, f'取消订单失败: {str(e)}')
@@ -3673,25 +3811,17 @@ def apply_refund(request, order_id):
         refund_reason = request.POST.get('refund_reason')
         
         try:
-            # 获取订单信息，确保订单属于当前用户
-            order = Order.objects.get(id=order_id, user=request.user)
-            
-            # 只有已支付订单才能申请退款
-            if order.status == 1:
-                # 更新订单信息
-                order.refund_reason = refund_reason
-                order.refund_apply_time = timezone.now()
-                order.status = 5  # 设置为退款审核中，等待管理员审核
-                order.save()
-                
+            # 只有已支付订单才能申请退款：设置为退款审核中，等待管理员审核
+            orders = Order.objects.filter(id=order_id, user=request.user)
+            if order_state.transition(orders, 'request_refund', refund_reason=refund_reason):
                 # 显示成功消息
                 messages.success(request, '退款申请已提交，正在等待管理员审核')
-            else:
+            elif orders.exists():
                 # 订单状态不是已支付，无法申请退款
                 messages.error(request, '只有已支付的订单才能申请退款')
-        except Order.DoesNotExist:
-            # 订单不存在或不属于当前用户
-            messages.error(request, '订单不存在或您没有权限操作')
+            else:
+                # 订单不存在或不属于当前用户
+                messages.error(request, '订单不存在或您没有权限操作')
         except Exception as e:
             # 其他错误
             messages.error(request, f'申请退款失败: {str(e)}')
@@ -3713,43 +3843,26 @@ def scenic_admin_refund_order(request, order_id):
             scenic_spots = ScenicSpot.objects.filter(admin=admin)
             scenic_ids = scenic_spots.values_list('id', flat=True)
             
-            # 获取订单信息，确保订单属于该管理员管理的景点
-            order = Order.objects.get(id=order_id, scenic_spot__id__in=scenic_ids)
+            # 订单必须属于该管理员管理的景点
+            orders = Order.objects.filter(id=order_id, scenic_spot__id__in=scenic_ids)
             
-            if order.status == 1:
-                # 已支付订单：管理员主动发起退款，设置为退款审核中
-                order.status = 5  # 设置为退款审核中
-                order.refund_amount = order.total_price  # 全额退款
-                order.refund_apply_time = timezone.now()
-                order.save()
-                messages.success(request, '已发起退款流程')
-            elif order.status == 5:
-                # 退款审核中的订单：管理员审核通过
-                order.status = 4  # 设置为已退款
-                order.refund_audit_time = timezone.now()
-                order.save()
-                
-                # 恢复对应日期的库存
-                if order.ticket_type and order.use_date:
-                    # 获取对应日期的库存记录
-                    date_stock = DateStock.objects.filter(
-                        ticket_type=order.ticket_type,
-                        use_date=order.use_date
-                    ).first()
-                    if date_stock:
-                        # 恢复库存并减少已售数量
-                        date_stock.stock += order.quantity
-                        date_stock.sold -= order.quantity
-                        date_stock.save()
-                
-                # 显示成功消息
-                messages.success(request, '退款申请已审核通过，订单已退款')
-            else:
-                # 订单状态不允许退款操作
-                messages.error(request, '该订单状态不允许退款操作')
-        except Order.DoesNotExist:
-            # 订单不存在或不属于该管理员管理的景点
-            messages.error(request, '订单不存在或您没有权限操作')
+            # 锁定订单后读取一次状态，只执行与当前状态对应的一个状态变更
+            with transaction.atomic():
+                order = orders.select_for_update(of=('self',)).only(*order_state.ROW_FIELDS).first()
+                if order is None:
+                    # 订单不存在或不属于该管理员管理的景点
+                    messages.error(request, '订单不存在或您没有权限操作')
+                elif order.status == order_state.REFUND_REVIEW:
+                    # 退款审核中的订单：管理员审核通过，归还库存并扣回已售数量
+                    order_state.apply_transition([order], 'approve_refund')
+                    messages.success(request, '退款申请已审核通过，订单已退款')
+                elif order.status == order_state.PAID:
+                    # 已支付订单：管理员主动发起全额退款，设置为退款审核中
+                    order_state.apply_transition([order], 'request_refund', refund_amount=models.F('total_price'))
+                    messages.success(request, '已发起退款流程')
+                else:
+                    # 订单状态不允许退款操作
+                    messages.error(request, '该订单状态不允许退款操作')
         except Exception as e:
             # 其他错误
             messages.error(request, f'处理退款失败: {str(e)}')
@@ -3771,24 +3884,19 @@ def scenic_admin_refund_reject(request, order_id):
             scenic_spots = ScenicSpot.objects.filter(admin=admin)
             scenic_ids = scenic_spots.values_list('id', flat=True)
             
-            # 获取订单信息，确保订单属于该管理员管理的景点
-            order = Order.objects.get(id=order_id, scenic_spot__id__in=scenic_ids)
+            # 订单必须属于该管理员管理的景点
+            orders = Order.objects.filter(id=order_id, scenic_spot__id__in=scenic_ids)
             
-            # 只有退款审核中的订单才能被拒绝
-            if order.status == 5:
-                # 更新订单信息，拒绝退款，恢复为已支付状态
-                order.status = 1  # 设置为已支付
-                order.refund_audit_time = timezone.now()
-                order.save()
-                
+            # 只有退款审核中的订单才能被拒绝，拒绝后恢复为已支付状态
+            if order_state.transition(orders, 'reject_refund'):
                 # 显示成功消息
                 messages.success(request, '退款申请已拒绝，订单已恢复为已支付状态')
-            else:
+            elif orders.exists():
                 # 订单状态不是退款审核中，无法拒绝
                 messages.error(request, '只有退款审核中的订单才能被拒绝')
-        except Order.DoesNotExist:
-            # 订单不存在或不属于该管理员管理的景点
-            messages.error(request, '订单不存在或您没有权限操作')
+            else:
+                # 订单不存在或不属于该管理员管理的景点
+                messages.error(request, '订单不存在或您没有权限操作')
         except Exception as e:
             # 其他错误
             messages.error(request, f'拒绝退款失败: {str(e)}')
@@ -3797,6 +3905,70 @@ def scenic_admin_refund_reject(request, order_id):
     return redirect(reverse('ticket:scenic_admin_orders'))
 
 
+# 景点管理员批量处理退款视图函数
+# 按景点和使用日期筛选退款审核中的订单（如天气原因闭园当天的全部退款申请），批量通过或拒绝
+# 订单分批处理，每批一个事务：带条件更新订单状态，库存按(门票类型, 日期)合并归还
+# 响应逐批输出处理进度，每行一个JSON对象；中途断开时已处理的批次保留，重新提交会继续处理剩余订单
+@scenic_admin_required
+def scenic_admin_bulk_refund(request):
+    import json
+    from datetime import datetime
+    
+    # 只接受POST请求
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'message': '只支持POST请求'}, status=405)
+    
+    # 审核通过或拒绝
+    actions = {'approve': 'approve_refund', 'reject': 'reject_refund'}
+    action = request.POST.get('action')
+    if action not in actions:
+        return JsonResponse({'success': False, 'message': '请选择审核通过或拒绝'}, status=400)
+    
+    # 景点必须由当前管理员管理
+    try:
+        scenic_spot = ScenicSpot.objects.get(id=request.POST.get('scenic_spot_id'), admin=request.user)
+    except (ScenicSpot.DoesNotExist, ValueError):
+        return JsonResponse({'success': False, 'message': '景点不存在或您没有权限操作'}, status=400)
+    
+    # 筛选该景点退款审核中的订单，可以限定使用日期
+    orders = Order.objects.filter(scenic_spot=scenic_spot, status=order_state.REFUND_REVIEW)
+    use_date = request.POST.get('use_date')
+    if use_date:
+        try:
+            orders = orders.filter(use_date=datetime.strptime(use_date, '%Y-%m-%d').date())
+        except ValueError:
+            return JsonResponse({'success': False, 'message': '日期格式错误，应为YYYY-MM-DD'}, status=400)
+    
+    total = orders.count()
+    batch_size = getattr(settings, 'BULK_REFUND_BATCH_SIZE', 500)
+    
+    def progress():
+        processed = 0
+        try:
+            for batch in order_state.iter_transition(orders, actions[action], batch_size=batch_size):
+                processed += len(batch)
+                yield json.dumps({'processed': processed, 'total': total}) + '\n'
+        except Exception as e:
+            # 出错的批次已回滚，之前的批次已提交
+            yield json.dumps({
+                'done': True, 'success': False, 'processed': processed, 'total': total,
+                'message': f'批量处理退款失败: {str(e)}',
+            }, ensure_ascii=False) + '\n'
+            return
+        
+        verb = '通过' if action == 'approve' else '拒绝'
+        yield json.dumps({
+            'done': True, 'success': True, 'processed': processed, 'total': total,
+            'message': f'已{verb} {processed} 个退款申请',
+        }, ensure_ascii=False) + '\n'
+    
+    response = StreamingHttpResponse(progress(), content_type='application/x-ndjson; charset=utf-8')
+    # 禁止缓存和反向代理缓冲，让进度实时到达浏览器
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
 # 景点管理员查看订单详情视图函数
 @scenic_admin_required
 def scenic_admin_order_detail(request, order_id):
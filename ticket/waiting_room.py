@@ -0,0 +1,302 @@
+import logging
+import math
+import threading
+import time
+from abc import ABC, abstractmethod
+from functools import lru_cache, wraps
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from django.shortcuts import render, reverse
+from django.utils.module_loading import import_string
+
+# 配置日志记录
+logger = logging.getLogger(__name__)
+
+
+# =======================
+# 购票排队（虚拟等候室）
+# =======================
+# 每个景点按固定速率放行用户进入购票流程（漏桶）：
+#   每个新到达的用户分配一个放行时间 admit_at = max(当前时间, 下一个空闲名额)，
+#   下一个空闲名额随之后移 1/速率 秒。
+# 放行时间写入签名令牌交给浏览器，等候页轮询状态接口时只校验签名，不访问数据库；
+# 排队状态（每个景点下一个空闲名额）由可插拔的后端保存，默认保存在Django缓存中，用户到达时不访问数据库。
+# 默认不启用，需要在WAITING_ROOM中开启，并可以只对热门景点启用（SPOTS）。
+# 到达放行时间后用户获得会话中的购票通行证，在PASS_SECONDS内访问购票页面不再排队。
+
+DEFAULTS = {
+    'ENABLED': False,
+    'SPOTS': [],
+    'BACKEND': 'ticket.waiting_room.CacheBackend',
+    'RATE': 20,
+    'SPOT_RATES': {},
+    'PASS_SECONDS': 600,
+    'POLL_SECONDS': 3,
+}
+
+# 令牌签名的salt，与其他签名数据区分
+TOKEN_SALT = 'ticket.waiting_room'
+# 会话中保存购票通行证的键，值为 {景点ID: 通行证过期时间戳}
+SESSION_PASS_KEY = 'waiting_room_passes'
+# 会话中保存排队令牌的键，值为 {景点ID: 令牌}
+SESSION_TOKEN_KEY = 'waiting_room_tokens'
+
+
+def get_config():
+    """读取WAITING_ROOM配置，未配置的项使用默认值"""
+    config = dict(DEFAULTS)
+    config.update(getattr(settings, 'WAITING_ROOM', {}))
+    return config
+
+
+def is_enabled(spot_id):
+    """
+    景点的购票页面是否需要排队
+
+    Args:
+        spot_id: 景点ID
+
+    Returns:
+        bool: 已启用排队，且未指定景点或该景点在SPOTS中
+    """
+    config = get_config()
+    if not config['ENABLED']:
+        return False
+    spots = config['SPOTS']
+    return not spots or spot_id in spots or str(spot_id) in spots
+
+
+def get_rate(spot_id):
+    """
+    获取景点的放行速率（每秒人数）
+
+    Args:
+        spot_id: 景点ID
+
+    Returns:
+        float: 每秒放行人数
+    """
+    config = get_config()
+    spot_rates = config['SPOT_RATES']
+    rate = spot_rates.get(spot_id, spot_rates.get(str(spot_id), config['RATE']))
+    return max(float(rate), 0.001)
+
+
+class BaseBackend(ABC):
+    """排队状态存储后端基类，只需要实现名额分配"""
+
+    @abstractmethod
+    def allocate(self, spot_id, now, interval):
+        """
+        为新到达的用户分配放行时间，并把下一个空闲名额后移interval秒
+
+        Args:
+            spot_id: 景点ID
+            now: 当前时间戳（秒）
+            interval: 相邻两个名额的间隔（秒），即 1/速率
+
+        Returns:
+            float: 该用户的放行时间戳
+        """
+
+    @abstractmethod
+    def reset(self, spot_id):
+        """清空景点的排队状态"""
+
+
+class LocalMemoryBackend(BaseBackend):
+    """进程内存后端，适用于单进程部署或开发环境，多进程部署时每个进程各自限速"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._next_admit_at = {}
+
+    def allocate(self, spot_id, now, interval):
+        with self._lock:
+            admit_at = max(now, self._next_admit_at.get(spot_id, 0))
+            self._next_admit_at[spot_id] = admit_at + interval
+        return admit_at
+
+    def reset(self, spot_id):
+        with self._lock:
+            self._next_admit_at.pop(spot_id, None)
+
+
+class CacheBackend(BaseBackend):
+    """
+    Django缓存后端，排队状态不写数据库，用户到达时只执行缓存的原子自增
+
+    时间按窗口划分（窗口长度为1秒，速率低于每秒1人时为一个名额间隔），每个窗口有固定名额：
+    用户到达时对当前窗口的计数自增，未超过名额就分配该窗口内的下一个名额，
+    已满则尝试下一个窗口。已满的最远窗口记录在缓存中，后到达的用户直接从那里开始，
+    突发流量时不必逐个窗口尝试。
+    缓存在进程间共享时（Redis）所有进程共用一个队列；使用本进程内存缓存时与LocalMemoryBackend相同，
+    每个进程各自限速。文件缓存的自增不是原子操作，不适合作为排队状态后端。
+    """
+
+    CACHE_PREFIX = 'waiting_room'
+
+    # 窗口计数过期后保留的时间（秒），之后自动删除
+    KEY_GRACE_SECONDS = 60
+
+    def _window_key(self, spot_id, window):
+        return f'{self.CACHE_PREFIX}:{spot_id}:{window}'
+
+    def _frontier_key(self, spot_id):
+        return f'{self.CACHE_PREFIX}:{spot_id}:frontier'
+
+    def allocate(self, spot_id, now, interval):
+        length = max(interval, 1.0)
+        capacity = max(int(round(length / interval)), 1)
+        window = max(int(now // length), cache.get(self._frontier_key(spot_id), 0))
+        while True:
+            timeout = max((window + 1) * length - now, 0) + self.KEY_GRACE_SECONDS
+            key = self._window_key(spot_id, window)
+            cache.add(key, 0, timeout)
+            try:
+                count = cache.incr(key)
+            except ValueError:
+                # 计数恰好在add和incr之间过期，重新创建
+                continue
+            if count <= capacity:
+                return max(now, window * length + (count - 1) * interval)
+            # 该窗口已满，记录后从下一个窗口继续；并发写入只是提示，不影响正确性
+            cache.set(self._frontier_key(spot_id), window + 1, timeout + length)
+            window += 1
+
+    def reset(self, spot_id):
+        # 删除当前窗口到已满的最远窗口之间的计数
+        length = max(1 / get_rate(spot_id), 1.0)
+        first = int(time.time() // length) - 1
+        last = max(cache.get(self._frontier_key(spot_id), first), first)
+        keys = [self._window_key(spot_id, window) for window in range(first, last + 1)]
+        cache.delete_many([self._frontier_key(spot_id)] + keys)
+
+
+@lru_cache(maxsize=None)
+def _load_backend(path):
+    return import_string(path)()
+
+
+def get_backend():
+    """获取配置的排队状态后端实例（每个进程一个）"""
+    return _load_backend(get_config()['BACKEND'])
+
+
+def issue_token(spot_id, user_id, now=None):
+    """
+    为用户分配放行名额并生成排队令牌
+
+    Args:
+        spot_id: 景点ID
+        user_id: 用户ID
+        now: 当前时间戳，默认time.time()
+
+    Returns:
+        tuple: (签名令牌, 放行时间戳)
+    """
+    now = time.time() if now is None else now
+    admit_at = get_backend().allocate(spot_id, now, 1 / get_rate(spot_id))
+    token = signing.dumps({'spot': spot_id, 'user': user_id, 'admit_at': admit_at}, salt=TOKEN_SALT)
+    return token, admit_at
+
+
+def read_token(token, spot_id):
+    """
+    校验令牌签名并返回其内容，令牌无效或不属于该景点时返回None
+
+    Args:
+        token: 签名令牌
+        spot_id: 景点ID
+
+    Returns:
+        dict: {'spot': 景点ID, 'user': 用户ID, 'admit_at': 放行时间戳}
+    """
+    if not token:
+        return None
+    try:
+        data = signing.loads(token, salt=TOKEN_SALT)
+    except signing.BadSignature:
+        return None
+    if data.get('spot') != spot_id:
+        return None
+    return data
+
+
+def get_status(token_data, spot_id, now=None):
+    """
+    根据令牌计算排队状态，不访问数据库
+
+    Args:
+        token_data: read_token返回的令牌内容
+        spot_id: 景点ID
+        now: 当前时间戳，默认time.time()
+
+    Returns:
+        dict: {'admitted': 是否已放行, 'position': 前方大约人数, 'wait_seconds': 预计等待秒数}
+    """
+    now = time.time() if now is None else now
+    wait_seconds = max(token_data['admit_at'] - now, 0)
+    return {
+        'admitted': wait_seconds <= 0,
+        'position': math.ceil(wait_seconds * get_rate(spot_id)),
+        'wait_seconds': math.ceil(wait_seconds),
+    }
+
+
+def has_pass(request, spot_id):
+    """检查会话中是否有该景点未过期的购票通行证"""
+    expires_at = request.session.get(SESSION_PASS_KEY, {}).get(str(spot_id))
+    return bool(expires_at) and expires_at > time.time()
+
+
+def grant_pass(request, spot_id):
+    """发放购票通行证，并删除会话中已使用的排队令牌"""
+    passes = request.session.get(SESSION_PASS_KEY, {})
+    passes[str(spot_id)] = time.time() + get_config()['PASS_SECONDS']
+    request.session[SESSION_PASS_KEY] = passes
+
+    tokens = request.session.get(SESSION_TOKEN_KEY, {})
+    if tokens.pop(str(spot_id), None):
+        request.session[SESSION_TOKEN_KEY] = tokens
+
+
+def waiting_room_required(view_func):
+    """
+    购票视图装饰器：没有购票通行证的用户先进入排队，到达放行时间后才执行视图
+
+    被装饰视图的第一个URL参数必须是spot_id，需要与login_required一起使用。
+    """
+    @wraps(view_func)
+    def wrapped_view(request, spot_id, *args, **kwargs):
+        if not is_enabled(spot_id) or has_pass(request, spot_id):
+            return view_func(request, spot_id, *args, **kwargs)
+
+        # 优先使用等候页跳转时带回的令牌，其次使用会话中保存的令牌
+        token = request.GET.get('wr_token') or request.session.get(SESSION_TOKEN_KEY, {}).get(str(spot_id))
+        token_data = read_token(token, spot_id)
+        if token_data is None or token_data.get('user') != request.user.id:
+            token, admit_at = issue_token(spot_id, request.user.id)
+            token_data = {'spot': spot_id, 'user': request.user.id, 'admit_at': admit_at}
+            tokens = request.session.get(SESSION_TOKEN_KEY, {})
+            tokens[str(spot_id)] = token
+            request.session[SESSION_TOKEN_KEY] = tokens
+
+        status = get_status(token_data, spot_id)
+        if status['admitted']:
+            grant_pass(request, spot_id)
+            return view_func(request, spot_id, *args, **kwargs)
+
+        logger.info(f"用户进入购票排队: 景点={spot_id}, 用户={request.user.id}, 前方约{status['position']}人")
+        return render(request, 'waiting_room.html', {
+            'spot_id': spot_id,
+            'token': token,
+            'status': status,
+            'poll_seconds': get_config()['POLL_SECONDS'],
+            'status_url': reverse('ticket:waiting_room_status', args=[spot_id]),
+            'buy_url': reverse('ticket:buy_ticket', args=[spot_id]),
+        })
+
+    return wrapped_view
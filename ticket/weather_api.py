@@ -1,7 +1,13 @@
-import requests
+import hashlib
 import logging
+import threading
+import time
 from datetime import datetime, date, timedelta
 
+import requests
+from django.conf import settings
+from django.core.cache import cache
+
 # 配置日志记录
 logger = logging.getLogger(__name__)
 
@@ -13,14 +19,24 @@ logger = logging.getLogger(__name__)
 # mock: 使用模拟数据
 API_MODE = 'real'  # 使用真实API
 
-# 真实API配置（当API_MODE='real'时使用）
+# 真实API配置（当API_MODE='real'时使用），可以在settings.WEATHER_API中覆盖
 # 这里使用开放的天气API服务
 REAL_WEATHER_API_URL = 'https://api.openweathermap.org/data/2.5/weather'
-REAL_WEATHER_API_KEY = 'dc19881169c2c25d6d30ee33167e1ee4'  # 有效的API密钥
+# API密钥只从环境变量WEATHER_API_KEY读取（见settings.WEATHER_API），不在代码中保存
 
 # 是否启用调试模式（调试模式下会输出详细日志）
 DEBUG_MODE = True
 
+# settings.WEATHER_API未配置的项使用这里的默认值
+DEFAULTS = {
+    'URL': REAL_WEATHER_API_URL,  # 天气API地址，测试时可以指向本地的模拟服务
+    'TIMEOUT': 3,  # 每次请求的超时时间（秒）
+    'MAX_ATTEMPTS': 2,  # 超时或连接失败时最多请求的次数，最坏耗时为 TIMEOUT × MAX_ATTEMPTS
+    'TTL': 600,  # 查询成功的结果直接使用的时间（秒）
+    'STALE_TTL': 3600,  # 超过TTL后仍可先返回旧结果、同时在后台刷新的时间（秒）
+    'NEGATIVE_TTL': 60,  # 查询失败的结果缓存时间（秒），期间不再请求天气API
+}
+
 # 模拟天气数据配置（当API_MODE='mock'时使用）
 MOCK_WEATHER_DATA = {
     '北京': {
@@ -164,9 +180,51 @@ MOCK_WEATHER_DATA = {
 }
 
 
+# =======================
+# 天气查询缓存
+# =======================
+# 天气按 (地区, 日期) 缓存在Django缓存中，所有进程共享：
+#   TTL内：直接返回缓存结果，不请求天气API
+#   超过TTL但在STALE_TTL内：先返回旧结果，同时由一个后台线程刷新（stale-while-revalidate）
+#   查询失败：失败结果缓存NEGATIVE_TTL秒，期间直接返回，避免上游故障时每次页面访问都等待超时；
+#             刷新失败时继续使用旧结果，NEGATIVE_TTL秒后再重试
+# 同一个键同时只请求一次天气API：
+#   同一进程内的并发请求等待第一个请求的结果；
+#   其他进程通过缓存中的锁得知正在请求，等待结果写入缓存，超过最坏请求耗时后才自行请求。
+
+CACHE_PREFIX = 'weather'
+
+# 等待其他进程写入结果时轮询缓存的间隔（秒）
+POLL_INTERVAL = 0.05
+
+# 本进程正在进行的查询，键为缓存键，值为_Call
+_calls = {}
+_calls_lock = threading.Lock()
+
+
+def get_config():
+    """读取WEATHER_API配置，未配置的项使用默认值"""
+    config = dict(DEFAULTS)
+    config.update(getattr(settings, 'WEATHER_API', {}))
+    return config
+
+
+class _Call:
+    """进行中的一次天气查询，同一个键的其他请求等待它完成"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+
+
+def _cache_key(region_name, target_date_str):
+    digest = hashlib.md5(f'{region_name}:{target_date_str}'.encode()).hexdigest()
+    return f'{CACHE_PREFIX}:{digest}'
+
+
 def get_weather_by_region(region_name, target_date):
     """
-    根据地区名称和日期获取天气信息
+    根据地区名称和日期获取天气信息，优先使用缓存
     
     Args:
         region_name: 地区名称，如"北京"、"上海"
@@ -179,54 +237,152 @@ def get_weather_by_region(region_name, target_date):
     
     target_date_str = target_date.strftime('%Y-%m-%d')
     
-    if API_MODE == 'real':
-        # 使用真实API
-        return _get_real_weather(region_name, target_date_str)
-    else:
-        # 使用模拟数据
+    if API_MODE != 'real':
+        # 使用模拟数据，不需要缓存
         return _get_mock_weather(region_name, target_date_str)
 
+    key = _cache_key(region_name, target_date_str)
+    entry = cache.get(key)
+    now = time.time()
+    if entry is not None:
+        if now < entry['expires_at']:
+            return entry['result']
+        if now < entry['stale_until']:
+            # 旧结果仍可使用，后台刷新
+            _refresh_in_background(key, region_name, target_date_str)
+            return entry['result']
+    return _fetch_coalesced(key, region_name, target_date_str)
+
 
-def _get_real_weather(region_name, target_date_str):
+def _store(key, result, ok, config):
+    """
+    保存查询结果
+
+    Args:
+        key: 缓存键
+        result: 返回给调用方的天气信息
+        ok: 是否从天气API查询成功；失败时如果有未过期的旧结果，继续使用旧结果
+
+    Returns:
+        dict: 之后一段时间内返回的天气信息
+    """
+    now = time.time()
+    if ok:
+        entry = {'result': result, 'expires_at': now + config['TTL'], 'stale_until': now + config['STALE_TTL']}
+    else:
+        previous = cache.get(key)
+        if previous is not None and previous['result'].get('success') and now < previous['stale_until']:
+            logger.warning(f"天气刷新失败，继续使用旧结果: {result.get('error', '已切换到模拟数据')}")
+            # NEGATIVE_TTL秒后再刷新，旧结果仍可使用到原来的期限
+            entry = {'result': previous['result'], 'expires_at': now + config['NEGATIVE_TTL'], 'stale_until': previous['stale_until']}
+        else:
+            entry = {'result': result, 'expires_at': now + config['NEGATIVE_TTL'], 'stale_until': now + config['NEGATIVE_TTL']}
+        result = entry['result']
+    cache.set(key, entry, max(entry['stale_until'] - now, 1))
+    return result
+
+
+def _lock_key(key):
+    return f'{key}:lock'
+
+
+def _fetch(key, region_name, target_date_str):
+    # 请求天气API并写入缓存，缓存中的锁让其他进程等待结果
+    config = get_config()
+    budget = config['TIMEOUT'] * config['MAX_ATTEMPTS']
+    acquired = cache.add(_lock_key(key), 1, int(budget) + 1)
+    if not acquired:
+        # 其他进程正在查询，等待结果写入缓存
+        started = cache.get(key)
+        deadline = time.time() + budget
+        while time.time() < deadline:
+            time.sleep(POLL_INTERVAL)
+            entry = cache.get(key)
+            if entry is not None and entry != started:
+                return entry['result']
+        logger.warning(f"等待其他进程查询天气超时，直接请求天气API: 地区={region_name}")
+    try:
+        result, ok = _get_real_weather(region_name, target_date_str, config)
+        return _store(key, result, ok, config)
+    finally:
+        # 等待超时后直接请求时锁仍属于其他进程，不能删除
+        if acquired:
+            cache.delete(_lock_key(key))
+
+
+def _fetch_coalesced(key, region_name, target_date_str):
+    # 同一进程内同一个键只有一个线程请求，其他线程等待结果
+    with _calls_lock:
+        call = _calls.get(key)
+        leader = call is None
+        if leader:
+            call = _calls[key] = _Call()
+    if not leader:
+        config = get_config()
+        if call.done.wait(config['TIMEOUT'] * config['MAX_ATTEMPTS'] + 1):
+            return call.result
+        return {'success': False, 'error': '天气查询超时'}
+    try:
+        call.result = _fetch(key, region_name, target_date_str)
+        return call.result
+    finally:
+        with _calls_lock:
+            del _calls[key]
+        call.done.set()
+
+
+def _refresh_in_background(key, region_name, target_date_str):
+    # 已有线程在刷新或查询该键时不再启动
+    with _calls_lock:
+        if key in _calls:
+            return
+    thread = threading.Thread(
+        target=_fetch_coalesced, args=(key, region_name, target_date_str), daemon=True,
+    )
+    thread.start()
+
+
+def _get_real_weather(region_name, target_date_str, config):
     """
     使用真实API获取天气信息
     
     Args:
         region_name: 地区名称
         target_date_str: 目标日期字符串，格式为"YYYY-MM-DD"
+        config: WEATHER_API配置
     
     Returns:
-        dict: 天气信息字典
+        tuple: (天气信息字典, 是否从天气API查询成功)
     """
     logger.info(f"使用真实API查询天气: 地区={region_name}")
     
     # 检查API密钥是否已配置
-    if REAL_WEATHER_API_KEY == 'your_real_api_key_here':
-        error_msg = "真实天气API密钥未配置，请先获取API密钥并配置到weather_api.py文件中"
+    if not config.get('API_KEY') or config['API_KEY'] == 'your_real_api_key_here':
+        error_msg = "真实天气API密钥未配置，请设置环境变量WEATHER_API_KEY"
         logger.error(error_msg)
         return {
             'success': False,
             'error': error_msg
-        }
+        }, False
     
     # 构建请求参数
     params = {
         'q': region_name,
-        'appid': REAL_WEATHER_API_KEY,
+        'appid': config['API_KEY'],
         'units': 'metric',
         'lang': 'zh_cn'
     }
     
-    # 尝试多次请求，增加可靠性
-    max_retries = 3
-    timeout = 15  # 增加超时时间
+    # 超时或连接失败时重试，次数和超时时间由配置决定
+    max_attempts = config['MAX_ATTEMPTS']
+    timeout = config['TIMEOUT']
     
-    for attempt in range(max_retries):
+    for attempt in range(max_attempts):
         try:
-            logger.info(f"API请求尝试 {attempt + 1}/{max_retries}")
+            logger.info(f"API请求尝试 {attempt + 1}/{max_attempts}")
             
             # 发送请求
-            response = requests.get(REAL_WEATHER_API_URL, params=params, timeout=timeout)
+            response = requests.get(config['URL'], params=params, timeout=timeout)
             response.raise_for_status()
             data = response.json()
             
@@ -239,7 +395,7 @@ def _get_real_weather(region_name, target_date_str):
                 return {
                     'success': False,
                     'error': f'天气查询失败: {error_msg}'
-                }
+                }, False
             
             # 构建天气信息
             weather_info = {
@@ -253,42 +409,42 @@ def _get_real_weather(region_name, target_date_str):
             }
             
             logger.info(f"真实天气API查询成功: {weather_info}")
-            return weather_info
+            return weather_info, True
             
-        except requests.ReadTimeout:
-            # 读取超时，继续重试
-            logger.warning(f"API请求超时，正在重试... ({attempt + 1}/{max_retries})")
-            if attempt == max_retries - 1:
+        except (requests.Timeout, requests.ConnectionError):
+            # 超时或连接失败，继续重试
+            logger.warning(f"API请求超时或连接失败，正在重试... ({attempt + 1}/{max_attempts})")
+            if attempt == max_attempts - 1:
                 # 最后一次尝试失败，切换到模拟数据
                 logger.error("所有API请求尝试都失败了，自动切换到模拟数据")
-                return _get_mock_weather(region_name, target_date_str)
+                return _get_mock_weather(region_name, target_date_str), False
         except requests.HTTPError as e:
             # HTTP错误处理
             if e.response.status_code == 401:
                 # 401认证错误，切换到模拟数据
                 logger.error(f"API认证失败: {str(e)}，切换到模拟数据")
-                return _get_mock_weather(region_name, target_date_str)
+                return _get_mock_weather(region_name, target_date_str), False
             else:
                 # 其他HTTP错误
                 logger.error(f"HTTP请求失败: {str(e)}", exc_info=True)
                 return {
                     'success': False,
                     'error': f'网络请求失败: {str(e)}'
-                }
+                }, False
         except requests.RequestException as e:
             # 其他网络请求异常
             logger.error(f"网络请求失败: {str(e)}", exc_info=True)
             return {
                 'success': False,
                 'error': f'网络请求失败: {str(e)}'
-            }
+            }, False
         except Exception as e:
             # 其他异常
             logger.error(f"真实天气API查询异常: {str(e)}", exc_info=True)
             return {
                 'success': False,
                 'error': f'天气查询异常: {str(e)}'
-            }
+            }, False
 
 
 def _get_mock_weather(region_name, target_date_str):
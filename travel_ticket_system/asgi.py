@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "travel_ticket_system.settings")
 
 application = get_asgi_application()
+
+# 服务启动时在后台加载景点自动补全索引，第一次输入不必等待索引加载
+from ticket import autocomplete  # noqa: E402
+
+autocomplete.start()
@@ -13,6 +13,8 @@ https://docs.djangoproject.com/en/6.0/ref/settings/
 import os
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
+
 # 项目根目录路径，用于构建其他路径
 # resolve() 解析路径，parent.parent 获取上两级目录（travel_ticket_system/travel_ticket_system/ -> travel_ticket_system/）
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -140,6 +142,37 @@ DATABASES = {
     }
 }
 
+# 缓存配置
+# 月历库存、分面统计、首页片段等缓存都使用default缓存，数据变化时通过缓存中的版本号失效，
+# 因此所有进程必须共享同一个缓存，否则其他进程看不到版本号变化：
+#   未设置环境变量：本进程内存缓存，只适用于单进程运行（如开发服务器）
+#   CACHE_DIR：文件缓存，同一台服务器上的多个进程共享
+#   CACHE_REDIS_URL：Redis缓存（如 redis://127.0.0.1:6379/1），多台服务器共享，需要安装redis包
+if os.environ.get('CACHE_REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',  # Redis缓存后端
+            'LOCATION': os.environ['CACHE_REDIS_URL'],  # Redis连接地址
+            'KEY_PREFIX': 'travel_ticket',  # 缓存键前缀，与同一Redis中的其他应用区分
+        }
+    }
+elif os.environ.get('CACHE_DIR'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',  # 文件缓存后端
+            'LOCATION': os.environ['CACHE_DIR'],  # 缓存文件目录
+            'OPTIONS': {'MAX_ENTRIES': 10000},  # 最多缓存条数，超过后删除部分旧文件
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',  # 本进程内存缓存后端
+            'LOCATION': 'travel_ticket',  # 缓存实例名称
+            'OPTIONS': {'MAX_ENTRIES': 10000},  # 最多缓存条数，默认300条容易淘汰版本号
+        }
+    }
+
 # 密码验证器 - 定义密码强度验证规则
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -167,4 +200,87 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')  # 静态文件收集目录（用
 # 开发环境静态文件目录配置
 STATICFILES_DIRS = [
     os.path.join(BASE_DIR, 'staticfiles'),  # 额外的静态文件目录
-]
\ No newline at end of file
+]
+# 库存预占配置
+# 未支付订单预占库存的有效时间（分钟），超时后由release_expired_holds命令取消订单并释放库存
+STOCK_HOLD_MINUTES = 15
+# 月历库存表格的缓存时间（秒），库存变化时会立即失效，这里只是兜底过期时间
+STOCK_CALENDAR_CACHE_SECONDS = 300
+
+# 下单幂等键配置
+# 幂等键保留时间（小时），在此期间重复提交同一个键返回原订单，过期后由cleanup_idempotency_keys命令清理
+IDEMPOTENCY_KEY_TTL_HOURS = 24
+
+# 订单号生成器配置
+# 每个进程的Snowflake节点ID从数据库租约表中自动分配，多台服务器、多个工作进程都不会重复；
+# 租约时间（秒），进程每1/3租约时间续期一次，异常退出的进程占用的节点ID在租约过期后可被重新使用
+ID_GENERATOR_LEASE_SECONDS = 600
+
+# 购票排队（虚拟等候室）配置
+# 热门景点开售时，进入购票页面的用户按固定速率放行，其余用户在等候页排队
+WAITING_ROOM = {
+    'ENABLED': False,  # 是否启用排队，默认关闭，热门景点开售前开启
+    'SPOTS': [],  # 需要排队的景点ID列表，为空时所有景点都排队
+    # 排队状态存储后端：LocalMemoryBackend（单进程内存）或CacheBackend（Django缓存，使用Redis时多进程共享）
+    'BACKEND': 'ticket.waiting_room.CacheBackend',
+    'RATE': 20,  # 每个景点每秒放行的用户数
+    'SPOT_RATES': {},  # 按景点单独设置放行速率，如 {景点ID: 每秒人数}
+    'PASS_SECONDS': 600,  # 放行后可在购票页面停留的时间（秒）
+    'POLL_SECONDS': 3,  # 等候页轮询排队状态的间隔（秒）
+}
+
+# 支付回调配置
+# 支付平台回调签名密钥（HMAC-SHA256），只能通过环境变量设置，不提供默认值；
+# 未设置时开发环境（DEBUG）拒绝所有支付回调，关闭DEBUG时启动即报错
+PAYMENT_CALLBACK_SECRET = os.environ.get('PAYMENT_CALLBACK_SECRET')
+if not PAYMENT_CALLBACK_SECRET and not DEBUG:
+    raise ImproperlyConfigured('未设置PAYMENT_CALLBACK_SECRET环境变量，无法校验支付回调签名')
+# 后台任务每批处理的支付通知数量
+PAYMENT_NOTIFICATION_BATCH_SIZE = 200
+# 支付通知处理出错的最多重试次数，超过后标记为处理失败
+PAYMENT_NOTIFICATION_MAX_ATTEMPTS = 5
+
+# 批量退款配置
+# 景点管理员批量处理退款时每批（每个事务）处理的订单数
+BULK_REFUND_BATCH_SIZE = 500
+
+# 站内搜索配置
+# search.search()按相关度排序最多返回的结果数；景点列表页对全部搜索结果分页，不受此限制
+SEARCH_RESULT_LIMIT = 1000
+# 景点自动补全默认返回的建议数
+AUTOCOMPLETE_LIMIT = 10
+# 景点自动补全索引重新加载的间隔（秒），用于同步其他进程的修改和批量更新
+AUTOCOMPLETE_REFRESH_SECONDS = 300
+# 景点列表每种筛选组合的分面统计缓存时间（秒），数据变化时通过版本号立即失效
+FACET_CACHE_TIMEOUT = 300
+
+# 首页缓存配置
+# 首页轮播图、公告、资讯、热门景点片段的缓存时间（秒），后台修改时通过版本号立即失效，这里只是兜底过期时间
+HOMEPAGE_CACHE_TIMEOUT = 600
+
+# 景点详情缓存配置
+# 景点详情页（景点、标签、留言）的缓存时间（秒），修改景点或留言时通过版本号立即失效，这里只是兜底过期时间
+SPOT_DETAIL_CACHE_TIMEOUT = 600
+
+# 地区、分类参考数据缓存配置
+# 进程内地区、分类快照的最长使用时间（秒），修改时通过版本号立即失效，这里只是兜底重新加载的间隔
+REFDATA_TTL_SECONDS = 300
+
+# HTTP缓存配置
+# 浏览器和反向代理缓存响应的时间（秒），过期后通过ETag重新验证，内容未变化时返回304
+HTTP_CACHE_MAX_AGE = {
+    'page': 60,  # 未登录访客的景点详情、资讯列表、资讯详情页面
+    'api': 300,  # 景点列表API
+}
+
+# 天气查询配置
+# 购票时查询目的地天气，结果按（地区, 日期）缓存；未配置的项使用ticket/weather_api.py中的默认值
+WEATHER_API = {
+    'URL': os.environ.get('WEATHER_API_URL', 'https://api.openweathermap.org/data/2.5/weather'),  # 天气API地址
+    'API_KEY': os.environ.get('WEATHER_API_KEY'),  # API密钥，只从环境变量读取，未设置时天气查询返回未配置的错误
+    'TIMEOUT': 3,  # 每次请求的超时时间（秒）
+    'MAX_ATTEMPTS': 2,  # 超时或连接失败时最多请求的次数
+    'TTL': 600,  # 查询成功的结果直接使用的时间（秒）
+    'STALE_TTL': 3600,  # 超过TTL后先返回旧结果、同时在后台刷新的时间（秒）
+    'NEGATIVE_TTL': 60,  # 查询失败的结果缓存时间（秒）
+}